@@ -0,0 +1,224 @@
+from typing import List, NamedTuple, Sequence
+
+import numpy as np
+
+from murdock_nio_bot.offload import offload
+from murdock_nio_bot.storage import TEST_ID_DTYPE, Storage, TestRunRow
+
+
+class Analysis(NamedTuple):
+    """Columnar statistics of the results of a number of keys, e.g. branches or
+    test cases. Every array has one entry per key.
+    """
+
+    keys: np.ndarray
+    runs: np.ndarray
+    failures: np.ndarray
+    # how often the result changed from passed to failed or vice versa
+    flips: np.ndarray
+    longest_streak: np.ndarray
+    # the number of the latest results that failed in a row
+    current_streak: np.ndarray
+
+    @property
+    def failure_rate(self) -> np.ndarray:
+        return self.failures / np.maximum(self.runs, 1)
+
+    @property
+    def flip_rate(self) -> np.ndarray:
+        """The fraction of consecutive results that differ, which serves as the
+        flakiness score of a test case.
+        """
+        return self.flips / np.maximum(self.runs - 1, 1)
+
+    def flakiest(self, limit: int, min_runs: int = 2) -> np.ndarray:
+        """Get the indices of the keys with the highest flip rates, highest
+        first. Keys that always passed or always failed are never flaky.
+
+        Args:
+            limit: The maximum number of indices to return.
+
+            min_runs: The minimum number of results of a key to be considered.
+        """
+        candidates = np.flatnonzero(
+            (self.runs >= min_runs) & (self.failures > 0) & (self.failures < self.runs)
+        )
+        order = np.argsort(-self.flip_rate[candidates], kind="stable")
+        return candidates[order[:limit]]
+
+
+def analyse(
+    keys: Sequence, timestamps: Sequence[int], failed: Sequence[bool]
+) -> Analysis:
+    """Compute the statistics of results without looping over them in Python.
+
+    Args:
+        keys: The key of every result.
+
+        timestamps: The time of every result, to order the results of a key.
+
+        failed: Whether a result failed.
+    """
+    keys = np.asarray(keys)
+    failed = np.asarray(failed, dtype=bool)
+    order = np.lexsort((np.asarray(timestamps), keys))
+    keys = keys[order]
+    failed = failed[order]
+    n = len(keys)
+    if n == 0:
+        empty = np.zeros(0, dtype=np.int64)
+        return Analysis(keys, empty, empty, empty, empty, empty)
+
+    # the results are grouped by key, find where the groups start
+    new_key = np.empty(n, dtype=bool)
+    new_key[0] = True
+    np.not_equal(keys[1:], keys[:-1], out=new_key[1:])
+    starts = np.flatnonzero(new_key)
+    codes = np.cumsum(new_key) - 1
+    runs = np.diff(np.append(starts, n))
+    failures = np.add.reduceat(failed.astype(np.int64), starts)
+
+    changed = np.empty(n, dtype=bool)
+    changed[0] = True
+    np.not_equal(failed[1:], failed[:-1], out=changed[1:])
+    flips = np.bincount(codes[changed & ~new_key], minlength=len(starts))
+
+    # streaks are segments of equal results within a group
+    segment_starts = np.flatnonzero(new_key | changed)
+    segment_lengths = np.diff(np.append(segment_starts, n))
+    segment_codes = codes[segment_starts]
+    segment_failed = failed[segment_starts]
+    longest_streak = np.zeros(len(starts), dtype=np.int64)
+    np.maximum.at(
+        longest_streak,
+        segment_codes[segment_failed],
+        segment_lengths[segment_failed],
+    )
+    last_segments = np.append(
+        np.flatnonzero(segment_codes[1:] != segment_codes[:-1]),
+        len(segment_starts) - 1,
+    )
+    current_streak = np.where(
+        segment_failed[last_segments], segment_lengths[last_segments], 0
+    )
+    return Analysis(keys[starts], runs, failures, flips, longest_streak, current_streak)
+
+
+class FlakyTest(NamedTuple):
+    """A test case that alternated between passing and failing"""
+
+    workflow: str
+    name: str
+    runs: int
+    failures: int
+    flips: int
+
+    @property
+    def flip_rate(self) -> float:
+        return self.flips / max(self.runs - 1, 1)
+
+
+async def analyse_nightlies(
+    store: Storage, source: str, branch: str, since: int = 0
+) -> Analysis:
+    """Compute the statistics of the nightlies of a branch, off the event loop
+    if there are many
+    """
+    results = store.get_nightly_results(source, branch, since)
+    timestamps = np.array([ts for ts, _, _ in results], dtype=np.int64)
+    failed = np.array([result == "errored" for _, _, result in results], dtype=bool)
+    return await offload(
+        analyse,
+        np.full(len(results), branch),
+        timestamps,
+        failed,
+        size=timestamps.nbytes + failed.nbytes,
+    )
+
+
+async def analyse_workflow(
+    store: Storage, source: str, workflow: str, since: int = 0
+) -> Analysis:
+    """Compute the statistics of the runs of a workflow, off the event loop if
+    there are many
+    """
+    results = store.get_workflow_run_results(source, workflow, since)
+    timestamps = np.array([ts for ts, _, _, _ in results], dtype=np.int64)
+    failed = np.array(
+        [conclusion == "failure" for _, _, _, conclusion in results], dtype=bool
+    )
+    return await offload(
+        analyse,
+        np.full(len(results), workflow),
+        timestamps,
+        failed,
+        size=timestamps.nbytes + failed.nbytes,
+    )
+
+
+def analyse_test_runs(runs: Sequence[TestRunRow]) -> Analysis:
+    """Compute the statistics of the test cases of packed workflow runs, keyed
+    by the ids of the test cases.
+    """
+    keys = np.frombuffer(
+        b"".join(test_ids for _, test_ids, _ in runs), dtype=TEST_ID_DTYPE
+    )
+    failed = np.frombuffer(b"".join(failed for _, _, failed in runs), dtype=bool)
+    timestamps = np.repeat(
+        np.array([ts for ts, _, _ in runs], dtype=np.int64),
+        [len(failed) for _, _, failed in runs],
+    )
+    return analyse(keys, timestamps, failed)
+
+
+async def analyse_tests(
+    store: Storage, source: str, workflow: str, since: int = 0
+) -> Analysis:
+    """Compute the statistics of the test cases of a workflow, keyed by the
+    ids of the test cases. The statistics of many results are computed off the
+    event loop.
+    """
+    runs = store.get_test_runs(source, workflow, since)
+    return await offload(
+        analyse_test_runs,
+        runs,
+        size=sum(len(test_ids) + len(failed) for _, test_ids, failed in runs),
+    )
+
+
+async def find_flaky_tests(
+    store: Storage, source: str, workflows: Sequence[str], since: int, limit: int
+) -> List[FlakyTest]:
+    """Find the flakiest test cases of workflows
+
+    Args:
+        store: The storage with the history of the test results.
+
+        source: The name of the source of the workflows.
+
+        workflows: The names of the workflows.
+
+        since: Only consider results since this timestamp.
+
+        limit: The maximum number of test cases to return.
+    """
+    candidates = []
+    for workflow in workflows:
+        analysis = await analyse_tests(store, source, workflow, since)
+        for i in analysis.flakiest(limit):
+            candidates.append((analysis.flip_rate[i], workflow, analysis, i))
+    candidates.sort(key=lambda candidate: candidate[0], reverse=True)
+    candidates = candidates[:limit]
+    names = store.get_test_case_names(
+        int(analysis.keys[i]) for _, _, analysis, i in candidates
+    )
+    return [
+        FlakyTest(
+            workflow=workflow,
+            name=names.get(int(analysis.keys[i]), str(analysis.keys[i])),
+            runs=int(analysis.runs[i]),
+            failures=int(analysis.failures[i]),
+            flips=int(analysis.flips[i]),
+        )
+        for _, workflow, analysis, i in candidates
+    ]
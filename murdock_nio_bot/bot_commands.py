@@ -1,8 +1,15 @@
+from typing import TYPE_CHECKING, Optional
+
 from nio import AsyncClient, MatrixRoom, RoomMessageText
 
 from murdock_nio_bot.chat_functions import react_to_event, send_text_to_room
 from murdock_nio_bot.config import Config
-from murdock_nio_bot.storage import Storage
+from murdock_nio_bot.metrics import metrics
+from murdock_nio_bot.murdock import generate_statistics_message
+from murdock_nio_bot.storage import ALL_BRANCHES, Storage
+
+if TYPE_CHECKING:
+    from murdock_nio_bot.reloader import ConfigReloader
 
 
 class Command:
@@ -14,6 +21,7 @@ class Command:
         command: str,
         room: MatrixRoom,
         event: RoomMessageText,
+        reloader: Optional["ConfigReloader"] = None,
     ):
         """A command made by a user.
 
@@ -29,6 +37,8 @@ class Command:
             room: The room the command was sent in.
 
             event: The event describing the command.
+
+            reloader: Reloads the config on the `reload` command.
         """
         self.client = client
         self.store = store
@@ -36,6 +46,7 @@ class Command:
         self.command = command
         self.room = room
         self.event = event
+        self.reloader = reloader
         self.args = self.command.split()[1:]
 
     async def process(self):
@@ -46,6 +57,18 @@ class Command:
             await self._react()
         elif self.command.startswith("help"):
             await self._show_help()
+        elif self.command.startswith("flaky"):
+            await self._flaky()
+        elif self.command.startswith("subscribe"):
+            await self._subscribe()
+        elif self.command.startswith("unsubscribe"):
+            await self._unsubscribe()
+        elif self.command.startswith("subscriptions"):
+            await self._subscriptions()
+        elif self.command.startswith("metrics"):
+            await self._metrics()
+        elif self.command.startswith("reload"):
+            await self._reload()
         else:
             await self._unknown_command()
 
@@ -68,6 +91,133 @@ class Command:
             self.client, self.room.room_id, self.event.event_id, reaction
         )
 
+    async def _flaky(self):
+        """Show the failure statistics and flaky test cases of the sources, or of
+        the source named in the arguments
+        """
+        sources = self.config.sources
+        if self.args:
+            sources = [s for s in sources if s.name == self.args[0]]
+            if not sources:
+                await send_text_to_room(
+                    self.client,
+                    self.room.room_id,
+                    f"Unknown source '{self.args[0]}'. Known sources: "
+                    + ", ".join(f"`{s.name}`" for s in self.config.sources),
+                )
+                return
+        show_source = len(self.config.sources) > 1
+        text = "\n".join(
+            [
+                await generate_statistics_message(
+                    source, self.store, source.name if show_source else None
+                )
+                for source in sources
+            ]
+        )
+        await send_text_to_room(self.client, self.room.room_id, text)
+
+    async def _parse_subscription(self):
+        """Get the (source, branch) of the arguments `<branch> [source]`. The
+        source may be left out if there is only one.
+
+        Returns:
+            None if the arguments are invalid, after telling the user why.
+        """
+        if not self.args:
+            error = (
+                f"Usage: `{self.command.split()[0]} <branch> [source]`, "
+                f"use `{ALL_BRANCHES}` as branch for all branches"
+            )
+        elif len(self.args) > 1:
+            names = [source.name for source in self.config.sources]
+            if self.args[1] in names:
+                return self.args[1], self.args[0]
+            error = f"Unknown source '{self.args[1]}'. Known sources: " + ", ".join(
+                f"`{name}`" for name in names
+            )
+        elif len(self.config.sources) == 1:
+            return self.config.sources[0].name, self.args[0]
+        else:
+            error = "There is more than one source, please name one: " + ", ".join(
+                f"`{source.name}`" for source in self.config.sources
+            )
+        await send_text_to_room(self.client, self.room.room_id, error)
+        return None
+
+    async def _subscribe(self):
+        """Subscribe the room to the reports of a branch of the nightlies or the
+        workflow runs of a source
+        """
+        subscription = await self._parse_subscription()
+        if subscription is None:
+            return
+        source, branch = subscription
+        config = next(s for s in self.config.sources if s.name == source)
+        branches = set(config.nightlies_branches) | self.store.get_workflow_branches(
+            source
+        )
+        if branch != ALL_BRANCHES and branch not in branches:
+            await send_text_to_room(
+                self.client,
+                self.room.room_id,
+                f"Unknown branch '{branch}' of `{source}`. Known branches: "
+                + ", ".join(f"`{b}`" for b in sorted(branches))
+                + f", or `{ALL_BRANCHES}` for all branches",
+            )
+            return
+        self.store.add_subscription(self.room.room_id, source, branch)
+        await send_text_to_room(
+            self.client,
+            self.room.room_id,
+            f"This room is now subscribed to `{branch}` of `{source}`",
+        )
+
+    async def _unsubscribe(self):
+        """Unsubscribe the room from the reports of a branch"""
+        subscription = await self._parse_subscription()
+        if subscription is None:
+            return
+        source, branch = subscription
+        if self.store.remove_subscription(self.room.room_id, source, branch):
+            text = f"This room is no longer subscribed to `{branch}` of `{source}`"
+        else:
+            text = f"This room was not subscribed to `{branch}` of `{source}`"
+        await send_text_to_room(self.client, self.room.room_id, text)
+
+    async def _subscriptions(self):
+        """List the subscriptions of the room"""
+        subscriptions = self.store.get_room_subscriptions(self.room.room_id)
+        if subscriptions:
+            text = "This room is subscribed to:\n\n" + "".join(
+                f"- `{branch}` of `{source}`\n" for source, branch in subscriptions
+            )
+        elif self.config.broadcast_unsubscribed:
+            text = "This room has no subscriptions, so it gets all reports"
+        else:
+            text = "This room has no subscriptions"
+        await send_text_to_room(self.client, self.room.room_id, text)
+
+    async def _metrics(self):
+        """Show the current metrics of the bot"""
+        text = metrics.render() or "No metrics recorded yet"
+        await send_text_to_room(self.client, self.room.room_id, f"```\n{text}\n```")
+
+    async def _reload(self):
+        """Reload the config file, restricted to the admins of the bot"""
+        if self.event.sender not in self.config.admins:
+            text = "Only admins of the bot may reload its config"
+        elif self.reloader is None:
+            text = "Reloading the config is not supported"
+        else:
+            changes = self.reloader.reload()
+            text = "Reloaded the config" + (
+                ":\n\n" + "".join(f"- {change}\n" for change in changes)
+                if changes
+                else ", nothing changed"
+            )
+        await send_text_to_room(self.client, self.room.room_id, text)
+
     async def _show_help(self):
         """Show the help text"""
         if not self.args:
@@ -82,7 +232,14 @@ class Command:
         if topic == "rules":
             text = "These are the rules!"
         elif topic == "commands":
-            text = "Available commands: ..."
+            text = (
+                "Available commands: `flaky [source]` shows the failure statistics "
+                "and flaky test cases of the nightlies and workflows, "
+                "`subscribe <branch> [source]` and `unsubscribe <branch> [source]` "
+                "manage which reports this room gets, `subscriptions` lists them, "
+                "`metrics` shows the metrics of the bot, `reload` reloads the config "
+                "(admins only)"
+            )
         else:
             text = "Unknown help topic!"
         await send_text_to_room(self.client, self.room.room_id, text)
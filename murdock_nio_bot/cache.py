@@ -0,0 +1,259 @@
+import hashlib
+import json
+import logging
+import math
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from typing import IO, Any, Callable, Dict, Hashable, Iterator, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class LRUCache:
+    """A mapping that holds at most `maxsize` entries, evicting the least
+    recently used one when full.
+
+    Args:
+        maxsize: The maximum number of entries.
+    """
+
+    def __init__(self, maxsize: int = 1024):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._data
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __iter__(self) -> Iterator[Hashable]:
+        return iter(self._data)
+
+    def get(self, key: Hashable, default: Optional[Any] = None) -> Any:
+        """Get the value of `key` and mark it as recently used"""
+        try:
+            self._data.move_to_end(key)
+        except KeyError:
+            return default
+        return self._data[key]
+
+    def put(self, key: Hashable, value: Any = None) -> None:
+        """Add or update `key`, evicting the least recently used entry if full"""
+        self._data[key] = value
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def pop(self, key: Hashable, default: Optional[Any] = None) -> Any:
+        return self._data.pop(key, default)
+
+    def clear(self) -> None:
+        self._data.clear()
+
+
+class BloomFilter:
+    """A set of strings that may report false positives, but never false
+    negatives, in constant space.
+
+    Args:
+        capacity: The number of entries the filter is sized for.
+
+        error_rate: The false positive rate at `capacity` entries.
+    """
+
+    def __init__(self, capacity: int, error_rate: float = 0.001):
+        capacity = max(1, capacity)
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self._bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, key: str) -> Iterator[int]:
+        # Double hashing: derive all positions from two halves of one digest
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return ((h1 + i * h2) % self.size for i in range(self.hashes))
+
+    def add(self, key: str) -> None:
+        for pos in self._positions(key):
+            self._bits[pos >> 3] |= 1 << (pos & 7)
+
+    def __contains__(self, key: str) -> bool:
+        return all(
+            self._bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(key)
+        )
+
+
+class FileCache:
+    """A content-addressed cache of files on disk, e.g. downloaded artifacts.
+
+    The files are stored under the SHA-256 hash of their content, so identical
+    content is only stored once. An index maps keys, e.g. a run ID or a
+    commit, to content hashes. When the files exceed `max_bytes`, the least
+    recently used entries are evicted. The cache is safe to use from multiple
+    threads.
+
+    The index is written when entries are stored or evicted. When entries were
+    last used is only kept in memory on a cache hit, and written at most every
+    `index_save_interval` seconds or on `flush()`.
+
+    Args:
+        path: The directory to store the cache in.
+
+        max_bytes: The maximum size of all cached files in bytes.
+
+        index_save_interval: The minimum number of seconds between writes of
+            the index on cache hits.
+    """
+
+    def __init__(self, path: str, max_bytes: int, index_save_interval: float = 60):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.index_save_interval = index_save_interval
+        self._blobs_path = os.path.join(path, "blobs")
+        self._index_path = os.path.join(path, "index.json")
+        self._lock = threading.Lock()
+        os.makedirs(self._blobs_path, exist_ok=True)
+        self._index: Dict[str, Dict[str, Any]] = {}
+        if os.path.exists(self._index_path):
+            try:
+                with open(self._index_path) as index_file:
+                    self._index = json.load(index_file)
+            except ValueError:
+                logger.warning("Discarding corrupt cache index %s", self._index_path)
+        # drop entries whose files are gone
+        self._index = {
+            key: entry
+            for key, entry in self._index.items()
+            if os.path.exists(self._blob_path(entry["hash"]))
+        }
+        # whether the index has changes not written yet, and when it was written
+        self._index_dirty = False
+        self._index_saved = time.monotonic()
+
+    def _blob_path(self, content_hash: str) -> str:
+        return os.path.join(self._blobs_path, content_hash)
+
+    def _save_index(self) -> None:
+        fd, tmp_path = tempfile.mkstemp(dir=self.path)
+        with os.fdopen(fd, "w") as index_file:
+            json.dump(self._index, index_file)
+        os.replace(tmp_path, self._index_path)
+        self._index_dirty = False
+        self._index_saved = time.monotonic()
+
+    def flush(self) -> None:
+        """Write the index, if entries were used since it was last written"""
+        with self._lock:
+            if self._index_dirty:
+                self._save_index()
+
+    def __contains__(self, key: str) -> bool:
+        with self._lock:
+            return key in self._index
+
+    @property
+    def size(self) -> int:
+        """The size of all cached files in bytes"""
+        with self._lock:
+            return self._size()
+
+    def _size(self) -> int:
+        sizes = {entry["hash"]: entry["size"] for entry in self._index.values()}
+        return sum(sizes.values())
+
+    def open(self, key: str) -> Optional[IO[bytes]]:
+        """Open the cached file of `key` for reading
+
+        Returns:
+            A binary file object or None if `key` is not cached.
+        """
+        with self._lock:
+            entry = self._index.get(key)
+            if entry is None:
+                return None
+            entry["used"] = time.time()
+            self._index_dirty = True
+            if time.monotonic() - self._index_saved >= self.index_save_interval:
+                self._save_index()
+            return open(self._blob_path(entry["hash"]), "rb")
+
+    def put(self, key: str, fileobj: IO[bytes]) -> None:
+        """Store the content of a binary file object under `key`"""
+
+        def copy(tmp_file):
+            for chunk in iter(lambda: fileobj.read(64 * 1024), b""):
+                tmp_file.write(chunk)
+
+        self._store(key, copy).close()
+
+    def fetch(self, key: str, download: Callable[[IO[bytes]], None]) -> IO[bytes]:
+        """Open the cached file of `key`, downloading it first if it is not cached
+
+        Args:
+            key: The key of the file.
+
+            download: A callable that writes the file to the binary file object
+                it is given.
+
+        Returns:
+            A binary file object of the file.
+        """
+        cached = self.open(key)
+        if cached is not None:
+            logger.debug("Cache hit for %s", key)
+            return cached
+        return self._store(key, download)
+
+    def _store(self, key: str, write: Callable[[IO[bytes]], None]) -> IO[bytes]:
+        """Store what `write` writes to a file under `key` and open it"""
+        fd, tmp_path = tempfile.mkstemp(dir=self.path)
+        try:
+            with os.fdopen(fd, "wb") as tmp_file:
+                hashing_file = _HashingWriter(tmp_file)
+                write(hashing_file)
+            content_hash = hashing_file.digest.hexdigest()
+            with self._lock:
+                blob_path = self._blob_path(content_hash)
+                os.replace(tmp_path, blob_path)
+                # keep the file open, in case it gets evicted right away
+                cached = open(blob_path, "rb")
+                self._index[key] = {
+                    "hash": content_hash,
+                    "size": hashing_file.size,
+                    "used": time.time(),
+                }
+                self._evict()
+                self._save_index()
+            return cached
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def _evict(self) -> None:
+        """Evict the least recently used entries until the cache fits"""
+        by_use = sorted(self._index, key=lambda key: self._index[key]["used"])
+        while by_use and self._size() > self.max_bytes:
+            key = by_use.pop(0)
+            content_hash = self._index.pop(key)["hash"]
+            if all(entry["hash"] != content_hash for entry in self._index.values()):
+                os.remove(self._blob_path(content_hash))
+            logger.debug("Evicted %s from the cache", key)
+
+
+class _HashingWriter:
+    """Wraps a binary file object to hash and count what is written to it"""
+
+    def __init__(self, fileobj: IO[bytes]):
+        self.fileobj = fileobj
+        self.digest = hashlib.sha256()
+        self.size = 0
+
+    def write(self, data: bytes) -> int:
+        self.digest.update(data)
+        self.size += len(data)
+        return self.fileobj.write(data)
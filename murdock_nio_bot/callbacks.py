@@ -1,27 +1,48 @@
 import logging
+from typing import TYPE_CHECKING, Awaitable, Callable, Optional
 
 from nio import (
     AsyncClient,
     InviteMemberEvent,
-    JoinError,
     MatrixRoom,
     MegolmEvent,
-    RoomGetEventError,
     RoomMessageText,
     UnknownEvent,
 )
 
 from murdock_nio_bot.bot_commands import Command
-from murdock_nio_bot.chat_functions import make_pill, react_to_event, send_text_to_room
+from murdock_nio_bot.chat_functions import (
+    make_pill,
+    react_to_event,
+    send_text_to_room,
+    sent_events,
+)
+from murdock_nio_bot.command_pool import CommandPool
 from murdock_nio_bot.config import Config
+from murdock_nio_bot.join_queue import JoinQueue
+from murdock_nio_bot.leader import LeaderElector
+from murdock_nio_bot.log import Sampler
 from murdock_nio_bot.message_responses import Message
+from murdock_nio_bot.profiling import timed_callback
 from murdock_nio_bot.storage import Storage
 
+if TYPE_CHECKING:
+    from murdock_nio_bot.reloader import ConfigReloader
+
 logger = logging.getLogger(__name__)
 
 
 class Callbacks:
-    def __init__(self, client: AsyncClient, store: Storage, config: Config):
+    def __init__(
+        self,
+        client: AsyncClient,
+        store: Storage,
+        config: Config,
+        leader: Optional[LeaderElector] = None,
+        reloader: Optional["ConfigReloader"] = None,
+        pool: Optional[CommandPool] = None,
+        join_queue: Optional[JoinQueue] = None,
+    ):
         """
         Args:
             client: nio client used to interact with matrix.
@@ -29,12 +50,38 @@ class Callbacks:
             store: Bot storage.
 
             config: Bot configuration parameters.
+
+            leader: If given, events are only responded to while this replica is
+                the leader.
+
+            reloader: If given, admins may reload the config with a command.
+
+            pool: If given, commands and messages are processed by its workers
+                instead of while handling the sync response.
+
+            join_queue: Joins the rooms the bot is invited to. Defaults to one
+                with the default options.
         """
         self.client = client
         self.store = store
+        self.leader = leader
+        self.reloader = reloader
+        self.pool = pool
+        self.join_queue = join_queue or JoinQueue(client)
+        self.set_config(config)
+
+    def set_config(self, config: Config) -> None:
+        """Use a new config, e.g. after it was reloaded"""
         self.config = config
         self.command_prefix = config.command_prefix
-
+        self._message_log_sampler = Sampler(config.message_log_sample_rate)
+        if self.pool is not None:
+            self.pool.queue_size = config.command_queue_size
+            self.pool.timeout = config.command_timeout
+        self.join_queue.max_attempts = config.join_max_attempts
+        self.join_queue.backoff_initial = config.join_backoff_initial
+
+    @timed_callback
     async def message(self, room: MatrixRoom, event: RoomMessageText) -> None:
         """Callback for when a message event is received
 
@@ -50,10 +97,24 @@ class Callbacks:
         if event.sender == self.client.user:
             return
 
-        logger.debug(
-            f"Bot message received for room {room.display_name} | "
-            f"{room.user_name(event.sender)}: {msg}"
-        )
+        # Leave the messages to the leader, before marking them as processed
+        if self._is_standby():
+            return
+
+        # Ignore messages we already processed, e.g. replayed after a reconnect or
+        # a reset of the store
+        if self.store.is_event_processed(event.event_id):
+            logger.debug("Skipping already processed event %s", event.event_id)
+            return
+        self.store.mark_event_processed(event.event_id)
+
+        if logger.isEnabledFor(logging.DEBUG) and self._message_log_sampler.sample():
+            logger.debug(
+                "Bot message received for room %s | %s: %s",
+                room.display_name,
+                room.user_name(event.sender),
+                msg,
+            )
 
         # Process as message if in a public room without command prefix
         has_command_prefix = msg.startswith(self.command_prefix)
@@ -65,7 +126,7 @@ class Callbacks:
         if not has_command_prefix and room.member_count > 2:
             # General message listener
             message = Message(self.client, self.store, self.config, msg, room, event)
-            await message.process()
+            await self._process(room, event, message.process)
             return
 
         # Otherwise if this is in a 1-1 with the bot or features a command prefix,
@@ -74,9 +135,28 @@ class Callbacks:
             # Remove the command prefix
             msg = msg[len(self.command_prefix) :]
 
-        command = Command(self.client, self.store, self.config, msg, room, event)
-        await command.process()
-
+        command = Command(
+            self.client, self.store, self.config, msg, room, event, self.reloader
+        )
+        await self._process(room, event, command.process)
+
+    async def _process(
+        self,
+        room: MatrixRoom,
+        event: RoomMessageText,
+        process: Callable[[], Awaitable[None]],
+    ):
+        """Process a command or message on the pool, if there is one"""
+        if self.pool is None:
+            await process()
+        elif not self.pool.submit(room.room_id, process):
+            logger.warning("Too busy, ignored %s in %s", event.event_id, room.room_id)
+
+    def _is_standby(self) -> bool:
+        """Whether another replica is responsible for responding to events"""
+        return self.leader is not None and not self.leader.is_leader
+
+    @timed_callback
     async def invite(self, room: MatrixRoom, event: InviteMemberEvent) -> None:
         """Callback for when an invite is received. Join the room specified in the invite.
 
@@ -85,24 +165,10 @@ class Callbacks:
 
             event: The invite event.
         """
-        logger.debug(f"Got invite to {room.room_id} from {event.sender}.")
-
-        # Attempt to join 3 times before giving up
-        for attempt in range(3):
-            result = await self.client.join(room.room_id)
-            if type(result) == JoinError:
-                logger.error(
-                    f"Error joining room {room.room_id} (attempt %d): %s",
-                    attempt,
-                    result.message,
-                )
-            else:
-                break
-        else:
-            logger.error("Unable to join room: %s", room.room_id)
-
-        # Successfully joined room
-        logger.info(f"Joined {room.room_id}")
+        logger.debug("Got invite to %s from %s.", room.room_id, event.sender)
+
+        # Join in the background, so piled up invites do not hold up the sync
+        self.join_queue.submit(room.room_id)
 
     async def _reaction(
         self, room: MatrixRoom, event: UnknownEvent, reacted_to_id: str
@@ -116,19 +182,14 @@ class Callbacks:
 
             reacted_to_id: The event ID that the reaction points to.
         """
-        logger.debug(f"Got reaction to {room.room_id} from {event.sender}.")
+        logger.debug("Got reaction to %s from %s.", room.room_id, event.sender)
 
-        # Get the original event that was reacted to
-        event_response = await self.client.room_get_event(room.room_id, reacted_to_id)
-        if isinstance(event_response, RoomGetEventError):
-            logger.warning(
-                "Error getting event that was reacted to (%s)", reacted_to_id
-            )
+        if self._is_standby():
             return
-        reacted_to_event = event_response.event
 
-        # Only acknowledge reactions to events that we sent
-        if reacted_to_event.sender != self.config.user_id:
+        # Only acknowledge reactions to events that we sent. They are looked up
+        # locally, so this costs no request to the homeserver
+        if not sent_events.sent_by_us(room.room_id, reacted_to_id):
             return
 
         # Send a message acknowledging the reaction
@@ -146,6 +207,7 @@ class Callbacks:
             reply_to_event_id=reacted_to_id,
         )
 
+    @timed_callback
     async def decryption_failure(self, room: MatrixRoom, event: MegolmEvent) -> None:
         """Callback for when an event fails to decrypt. Inform the user.
 
@@ -155,15 +217,21 @@ class Callbacks:
             event: The encrypted event that we were unable to decrypt.
         """
         logger.error(
-            f"Failed to decrypt event '{event.event_id}' in room '{room.room_id}'!"
-            f"\n\n"
-            f"Tip: try using a different device ID in your config file and restart."
-            f"\n\n"
-            f"If all else fails, delete your store directory and let the bot recreate "
-            f"it (your reminders will NOT be deleted, but the bot may respond to existing "
-            f"commands a second time)."
+            "Failed to decrypt event '%s' in room '%s'!"
+            "\n\n"
+            "Tip: try using a different device ID in your config file and restart."
+            "\n\n"
+            "If all else fails, delete your store directory and let the bot recreate "
+            "it (the database is kept, so already processed commands within "
+            "storage.processed_events.window_days will not be responded to a second "
+            "time).",
+            event.event_id,
+            room.room_id,
         )
 
+        if self._is_standby():
+            return
+
         red_x_and_lock_emoji = "❌ 🔐"
 
         # React to the undecryptable event with some emoji
@@ -174,6 +242,7 @@ class Callbacks:
             red_x_and_lock_emoji,
         )
 
+    @timed_callback
     async def unknown(self, room: MatrixRoom, event: UnknownEvent) -> None:
         """Callback for when an event with a type that is unknown to matrix-nio is received.
         Currently this is used for reaction events, which are not yet part of a released
@@ -190,12 +259,12 @@ class Callbacks:
 
             reacted_to = relation_dict.get("event_id")
             if reacted_to and relation_dict.get("rel_type") == "m.annotation":
-                # await self._reaction(room, event, reacted_to)
-                logger.debug(
-                    f"Got reaction event from {event.sender} in {room.room_id}"
-                )
+                await self._reaction(room, event, reacted_to)
                 return
 
         logger.debug(
-            f"Got unknown event with type to {event.type} from {event.sender} in {room.room_id}."
+            "Got unknown event with type to %s from %s in %s.",
+            event.type,
+            event.sender,
+            room.room_id,
         )
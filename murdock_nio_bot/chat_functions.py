@@ -1,5 +1,6 @@
 import logging
-from typing import Optional, Union
+import time
+from typing import Iterable, Optional, Union
 
 from markdown import markdown
 from nio import (
@@ -10,11 +11,59 @@ from nio import (
     Response,
     RoomSendResponse,
     SendRetryError,
+    ShareGroupSessionError,
 )
 
+from murdock_nio_bot.cache import LRUCache
+from murdock_nio_bot.offload import offload
+from murdock_nio_bot.storage import Storage
+
 logger = logging.getLogger(__name__)
 
 
+class SentEvents:
+    """Remembers the IDs of the most recent events the bot sent, so reactions to
+    them can be recognized without asking the homeserver.
+
+    Args:
+        maxsize: How many events to remember.
+
+        store: If given, the events are also persisted to and restored from the
+            bot storage.
+    """
+
+    def __init__(self, maxsize: int = 1024, store: Optional[Storage] = None):
+        self.configure(maxsize, store)
+
+    def configure(self, maxsize: int, store: Optional[Storage] = None) -> None:
+        """(Re-)configure the cache, restoring persisted events from `store`"""
+        self._events = LRUCache(maxsize)
+        self._store = store
+        self._added = 0
+        if store is not None:
+            store.prune_sent_events(maxsize)
+            for event_id, room_id in store.get_sent_events(maxsize):
+                self._events.put(event_id, room_id)
+
+    def add(self, room_id: str, event_id: str) -> None:
+        """Remember that the bot sent `event_id` to `room_id`"""
+        self._events.put(event_id, room_id)
+        if self._store is not None:
+            self._store.add_sent_event(event_id, room_id)
+            self._added += 1
+            if self._added >= self._events.maxsize:
+                self._store.prune_sent_events(self._events.maxsize)
+                self._added = 0
+
+    def sent_by_us(self, room_id: str, event_id: str) -> bool:
+        """Returns True if the bot sent `event_id` to `room_id`"""
+        return self._events.get(event_id) == room_id
+
+
+# The events sent with send_text_to_room
+sent_events = SentEvents()
+
+
 async def send_text_to_room(
     client: AsyncClient,
     room_id: str,
@@ -54,11 +103,75 @@ async def send_text_to_room(
     }
 
     if markdown_convert:
-        content["formatted_body"] = markdown(message)
+        # large reports take long to render, so they are rendered off the loop
+        content["formatted_body"] = await offload(markdown, message, size=len(message))
 
     if reply_to_event_id:
         content["m.relates_to"] = {"m.in_reply_to": {"event_id": reply_to_event_id}}
 
+    try:
+        response = await client.room_send(
+            room_id,
+            "m.room.message",
+            content,
+            ignore_unverified_devices=True,
+        )
+        if isinstance(response, RoomSendResponse):
+            sent_events.add(room_id, response.event_id)
+        return response
+    except SendRetryError:
+        logger.exception("Unable to send message response to %s", room_id)
+
+
+async def edit_text_in_room(
+    client: AsyncClient,
+    room_id: str,
+    event_id: str,
+    message: str,
+    notice: bool = True,
+    markdown_convert: bool = True,
+) -> Union[RoomSendResponse, ErrorResponse]:
+    """Replace the text of a message the bot sent to a matrix room.
+
+    Args:
+        client: The client to communicate to matrix with.
+
+        room_id: The ID of the room of the message.
+
+        event_id: The ID of the message to replace.
+
+        message: The new message content.
+
+        notice: Whether the message should be sent with an "m.notice" message type
+            (will not ping users).
+
+        markdown_convert: Whether to convert the message content to markdown.
+            Defaults to true.
+
+    Returns:
+        A RoomSendResponse if the request was successful, else an ErrorResponse.
+    """
+    new_content = {
+        "msgtype": "m.notice" if notice else "m.text",
+        "format": "org.matrix.custom.html",
+        "body": message,
+    }
+    if markdown_convert:
+        new_content["formatted_body"] = await offload(
+            markdown, message, size=len(message)
+        )
+
+    # clients without support for edits show the fallback
+    content = {
+        "msgtype": new_content["msgtype"],
+        "body": f"* {message}",
+        "m.new_content": new_content,
+        "m.relates_to": {"rel_type": "m.replace", "event_id": event_id},
+    }
+    if markdown_convert:
+        content["format"] = new_content["format"]
+        content["formatted_body"] = "* " + new_content["formatted_body"]
+
     try:
         return await client.room_send(
             room_id,
@@ -67,7 +180,58 @@ async def send_text_to_room(
             ignore_unverified_devices=True,
         )
     except SendRetryError:
-        logger.exception(f"Unable to send message response to {room_id}")
+        logger.exception("Unable to edit message %s in %s", event_id, room_id)
+
+
+async def prewarm_group_sessions(client: AsyncClient, room_ids: Iterable[str]) -> int:
+    """Create and share the outbound group sessions of encrypted rooms ahead of
+    sending to them, so the next message is not delayed by it.
+
+    A new session is only needed after the members or their devices changed,
+    or the previous session expired. Like `send_text_to_room`, unverified
+    devices are ignored.
+
+    Args:
+        client: The client to communicate to matrix with.
+
+        room_ids: The rooms to send to soon.
+
+    Returns:
+        The number of sessions shared.
+    """
+    if client.olm is None:
+        return 0
+    shared = 0
+    for room_id in room_ids:
+        room = client.rooms.get(room_id)
+        if room is None or not room.encrypted:
+            continue
+        if not room.members_synced:
+            await client.joined_members(room_id)
+        if client.should_query_keys:
+            await client.keys_query()
+        if room_id in client.sharing_session:
+            # sending to the room is sharing a session already
+            await client.sharing_session[room_id].wait()
+            continue
+        if not client.olm.should_share_group_session(room_id):
+            continue
+        start = time.perf_counter()
+        response = await client.share_group_session(
+            room_id, ignore_unverified_devices=True
+        )
+        if isinstance(response, ShareGroupSessionError):
+            logger.warning(
+                "Unable to share group session of %s: %s", room_id, response.message
+            )
+            continue
+        shared += 1
+        logger.debug(
+            "Shared group session of %s in %.3fs",
+            room_id,
+            time.perf_counter() - start,
+        )
+    return shared
 
 
 def make_pill(user_id: str, displayname: str = None) -> str:
@@ -132,13 +296,15 @@ async def react_to_event(
 async def decryption_failure(self, room: MatrixRoom, event: MegolmEvent) -> None:
     """Callback for when an event fails to decrypt. Inform the user"""
     logger.error(
-        f"Failed to decrypt event '{event.event_id}' in room '{room.room_id}'!"
-        f"\n\n"
-        f"Tip: try using a different device ID in your config file and restart."
-        f"\n\n"
-        f"If all else fails, delete your store directory and let the bot recreate "
-        f"it (your reminders will NOT be deleted, but the bot may respond to existing "
-        f"commands a second time)."
+        "Failed to decrypt event '%s' in room '%s'!"
+        "\n\n"
+        "Tip: try using a different device ID in your config file and restart."
+        "\n\n"
+        "If all else fails, delete your store directory and let the bot recreate "
+        "it (your reminders will NOT be deleted, but the bot may respond to existing "
+        "commands a second time).",
+        event.event_id,
+        room.room_id,
     )
 
     user_msg = (
@@ -0,0 +1,161 @@
+import copy
+import http.client
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, Hashable, Optional
+
+import requests
+
+from murdock_nio_bot.errors import CircuitOpenError
+from murdock_nio_bot.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Errors that count as failures of an endpoint
+FAILURES = (requests.RequestException, http.client.HTTPException, OSError)
+
+CLOSED = "closed"
+HALF_OPEN = "half-open"
+OPEN = "open"
+# The values of the circuit_breaker_state gauge
+STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+
+class CircuitBreaker:
+    """Stops calling the endpoints of a source after repeated failures.
+
+    While the breaker is closed, calls go through and their errors are raised.
+    After `failure_threshold` failures in a row it opens: calls are not sent,
+    but answered with the last good result of the same call. After
+    `reset_timeout` seconds it is half-open and lets a single trial call
+    through, which closes the breaker again on success or reopens it on
+    failure.
+
+    Args:
+        name: The name of the breaker, usually the name of the source.
+
+        failure_threshold: After how many failures in a row to open.
+
+        reset_timeout: How many seconds to stay open before a trial call.
+    """
+
+    def __init__(
+        self, name: str, failure_threshold: int = 3, reset_timeout: float = 300
+    ):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._trial_running = False
+        self._last_good: Dict[Hashable, Any] = {}
+        self._lock = threading.Lock()
+        metrics.set("circuit_breaker_state", STATE_VALUES[CLOSED], source=name)
+
+    def _set_state(self, state: str) -> None:
+        if state == self.state:
+            return
+        log = logger.info if state == CLOSED else logger.warning
+        log("Circuit breaker of %s is %s now", self.name, state)
+        self.state = state
+        metrics.set("circuit_breaker_state", STATE_VALUES[state], source=self.name)
+        if state == OPEN:
+            self.opened_at = time.monotonic()
+            metrics.inc("circuit_breaker_trips_total", source=self.name)
+
+    def _admit(self) -> bool:
+        """Whether a call may be sent now. A call admitted while half-open is
+        the trial call.
+        """
+        with self._lock:
+            if (
+                self.state == OPEN
+                and time.monotonic() - self.opened_at >= self.reset_timeout
+            ):
+                self._set_state(HALF_OPEN)
+            if self.state == CLOSED:
+                return True
+            if self.state == HALF_OPEN and not self._trial_running:
+                self._trial_running = True
+                return True
+            return False
+
+    def _stale(self, key: Hashable) -> Any:
+        with self._lock:
+            if key not in self._last_good:
+                raise CircuitOpenError(f"Circuit breaker of {self.name} is open")
+            # a copy, as callers may change the result in place
+            result = copy.deepcopy(self._last_good[key])
+        logger.info("Serving last good result of %s for %s", key, self.name)
+        metrics.inc("circuit_breaker_stale_results_total", source=self.name)
+        return result
+
+    def call(self, key: Hashable, func: Callable[..., Any], *args, **kwargs) -> Any:
+        """Call `func` through the breaker. A copy of every truthy result is kept
+        as the last good result of `key`.
+
+        Args:
+            key: Identifies the call, e.g. the endpoint and its parameters.
+
+            func: The function sending the request.
+
+        Raises:
+            CircuitOpenError: If the breaker is open and there is no last good
+                result of `key`.
+        """
+        if not self._admit():
+            return self._stale(key)
+        try:
+            result = func(*args, **kwargs)
+        except FAILURES as exc:
+            with self._lock:
+                self._trial_running = False
+                self.failures += 1
+                metrics.inc("circuit_breaker_failures_total", source=self.name)
+                if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+                    self._set_state(OPEN)
+                stale = self.state == OPEN and key in self._last_good
+            if stale:
+                logger.warning("Call %s of %s failed: %s", key, self.name, exc)
+                return self._stale(key)
+            raise
+        except BaseException:
+            # e.g. a rate limit, which says nothing about the endpoint
+            with self._lock:
+                self._trial_running = False
+            raise
+        with self._lock:
+            self._trial_running = False
+            self.failures = 0
+            self._set_state(CLOSED)
+            if result:
+                self._last_good[key] = copy.deepcopy(result)
+        return result
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+
+
+def get_breaker(
+    name: str,
+    failure_threshold: Optional[int] = None,
+    reset_timeout: Optional[float] = None,
+) -> CircuitBreaker:
+    """Get the circuit breaker of a source, creating it on first use
+
+    Args:
+        name: The name of the source.
+
+        failure_threshold: If given, update the threshold of the breaker.
+
+        reset_timeout: If given, update the reset timeout of the breaker.
+    """
+    if name not in _breakers:
+        _breakers[name] = CircuitBreaker(name)
+    if failure_threshold is not None:
+        _breakers[name].failure_threshold = failure_threshold
+    if reset_timeout is not None:
+        _breakers[name].reset_timeout = reset_timeout
+    return _breakers[name]
@@ -0,0 +1,134 @@
+import asyncio
+import collections
+import logging
+import time
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, Tuple
+
+from murdock_nio_bot.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# A command to run and when it was queued
+Job = Tuple[Callable[[], Awaitable[Any]], float]
+
+
+class CommandPool:
+    """Runs commands on a fixed number of worker tasks, so a slow command never
+    holds up the processing of the rest of a sync response.
+
+    Commands of the same room run one after another in the order they were
+    submitted, commands of different rooms run concurrently. When
+    `queue_size` commands are waiting, further commands are dropped until the
+    workers caught up.
+
+    Args:
+        workers: How many commands may run at the same time.
+
+        queue_size: How many commands may wait for a worker.
+
+        timeout: Seconds after which a running command is cancelled. None to let
+            commands run for as long as they take.
+    """
+
+    def __init__(
+        self, workers: int = 4, queue_size: int = 100, timeout: Optional[float] = 60
+    ):
+        self.workers = workers
+        self.queue_size = queue_size
+        self.timeout = timeout
+        # the waiting commands of every room with commands waiting or running
+        self._pending: Dict[str, Deque[Job]] = {}
+        # rooms with waiting commands and none running
+        self._ready: Optional[asyncio.Queue] = None
+        self._queued = 0
+        self._tasks: List[asyncio.Future] = []
+
+    @property
+    def queued(self) -> int:
+        """The number of commands waiting for a worker"""
+        return self._queued
+
+    def start(self) -> None:
+        """Start the worker tasks"""
+        if self._tasks:
+            return
+        self._ready = asyncio.Queue()
+        self._tasks = [asyncio.ensure_future(self._work()) for _ in range(self.workers)]
+
+    async def stop(self) -> None:
+        """Cancel the worker tasks, dropping the waiting commands"""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._pending.clear()
+        self._queued = 0
+        metrics.set("command_queue_depth", 0)
+
+    def submit(self, room_id: str, command: Callable[[], Awaitable[Any]]) -> bool:
+        """Queue a command for a room
+
+        Args:
+            room_id: The room the command was sent in.
+
+            command: A coroutine function to call without arguments.
+
+        Returns:
+            False if the command was dropped, as the queue is full.
+        """
+        if self._queued >= self.queue_size:
+            logger.warning(
+                "Dropping command in %s, %d commands are waiting", room_id, self._queued
+            )
+            metrics.inc("commands_shed_total")
+            return False
+        if not self._tasks:
+            self.start()
+        pending = self._pending.get(room_id)
+        if pending is None:
+            pending = self._pending[room_id] = collections.deque()
+            # no command of the room is waiting or running
+            self._ready.put_nowait(room_id)
+        pending.append((command, time.monotonic()))
+        self._queued += 1
+        metrics.set("command_queue_depth", self._queued)
+        return True
+
+    async def join(self) -> None:
+        """Wait until all commands submitted so far ran"""
+        while self._pending:
+            await asyncio.sleep(0.01)
+
+    async def _work(self) -> None:
+        while True:
+            room_id = await self._ready.get()
+            pending = self._pending[room_id]
+            command, queued_at = pending.popleft()
+            self._queued -= 1
+            metrics.set("command_queue_depth", self._queued)
+            try:
+                await self._run(room_id, command, queued_at)
+            finally:
+                if pending:
+                    self._ready.put_nowait(room_id)
+                else:
+                    del self._pending[room_id]
+
+    async def _run(
+        self, room_id: str, command: Callable[[], Awaitable[Any]], queued_at: float
+    ) -> None:
+        start = time.monotonic()
+        metrics.inc("command_queue_wait_seconds_total", start - queued_at)
+        try:
+            await asyncio.wait_for(command(), self.timeout)
+            outcome = "ok"
+        except asyncio.TimeoutError:
+            logger.warning(
+                "Command in %s timed out after %ss, cancelled it", room_id, self.timeout
+            )
+            outcome = "timeout"
+        except Exception:
+            logger.exception("Command in %s failed", room_id)
+            outcome = "error"
+        metrics.inc("command_execution_seconds_total", time.monotonic() - start)
+        metrics.inc("commands_total", outcome=outcome)
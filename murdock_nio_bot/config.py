@@ -1,12 +1,15 @@
 import logging
 import os
 import re
+import signal
 import sys
-from typing import Any, List, Optional
+from typing import Any, Dict, List, Optional, Union
 
 import yaml
+from croniter import croniter
 
 from murdock_nio_bot.errors import ConfigError
+from murdock_nio_bot.log import setup_logging
 
 logger = logging.getLogger()
 logging.getLogger("peewee").setLevel(
@@ -35,12 +38,12 @@ class Config:
         formatter = logging.Formatter(
             "%(asctime)s | %(name)s [%(levelname)s] %(message)s"
         )
+        handlers = []
 
         log_level = self._get_cfg(["logging", "level"], default="INFO")
-        logger.setLevel(log_level)
 
         file_logging_enabled = self._get_cfg(
-            ["logging", "file_logging", "enabled"], default=False
+            ["logging", "file_logging", "enabled"], default=False, required=False
         )
         file_logging_filepath = self._get_cfg(
             ["logging", "file_logging", "filepath"], default="bot.log"
@@ -48,7 +51,7 @@ class Config:
         if file_logging_enabled:
             handler = logging.FileHandler(file_logging_filepath)
             handler.setFormatter(formatter)
-            logger.addHandler(handler)
+            handlers.append(handler)
 
         console_logging_enabled = self._get_cfg(
             ["logging", "console_logging", "enabled"], default=True
@@ -56,7 +59,13 @@ class Config:
         if console_logging_enabled:
             handler = logging.StreamHandler(sys.stdout)
             handler.setFormatter(formatter)
-            logger.addHandler(handler)
+            handlers.append(handler)
+
+        setup_logging(logger, log_level, handlers)
+
+        self.message_log_sample_rate = self._get_cfg(
+            ["logging", "message_sample_rate"], default=1.0
+        )
 
         # Storage setup
         self.store_path = self._get_cfg(["storage", "store_path"], required=True)
@@ -87,6 +96,44 @@ class Config:
         else:
             raise ConfigError("Invalid connection string for storage.database")
 
+        # How many of its own sent events the bot remembers to recognize reactions
+        self.sent_events_size = self._get_cfg(
+            ["storage", "sent_events", "size"], default=1024
+        )
+        self.persist_sent_events = self._get_cfg(
+            ["storage", "sent_events", "persist"], default=False, required=False
+        )
+
+        # Downloads, e.g. of artifacts, are cached within the store path
+        self.cache_max_bytes = (
+            self._get_cfg(["storage", "cache", "max_size_mb"], default=1024)
+            * 1024
+            * 1024
+        )
+
+        # How long and how many processed events are remembered for de-duplication
+        self.processed_events_window = (
+            self._get_cfg(["storage", "processed_events", "window_days"], default=7)
+            * 24
+            * 60
+            * 60
+        )
+        self.processed_events_capacity = self._get_cfg(
+            ["storage", "processed_events", "capacity"], default=100000
+        )
+
+        # How long to keep single results in the history and when to summarize
+        # older ones
+        self.history_retention = (
+            self._get_cfg(["storage", "history", "retention_days"], default=730)
+            * 24
+            * 60
+            * 60
+        )
+        self.history_compact_crontab = self._get_cfg(
+            ["storage", "history", "compact_crontab"], default="0 3 * * *"
+        )
+
         # Matrix bot account setup
         self.user_id = self._get_cfg(["matrix", "user_id"], required=True)
         if not re.match("@.*:.*", self.user_id):
@@ -104,44 +151,220 @@ class Config:
         self.homeserver_url = self._get_cfg(["matrix", "homeserver_url"], required=True)
 
         self.command_prefix = self._get_cfg(["command_prefix"], default="!c") + " "
-        self.crontab = self._get_cfg(["murdock", "crontab"])
-        self.nightlies_branches = self._get_cfg(["murdock", "branches"], default=[])
-        self.nightlies_url = self._get_cfg(["murdock", "nightlies_url"])
-        self.result_url = self._get_cfg(["murdock", "result_url"])
-        self.commit_url = self._get_cfg(["murdock", "commit_url"])
-        self.github_org = self._get_cfg(["murdock", "github", "org"], required=True)
-        self.github_repo = self._get_cfg(["murdock", "github", "repo"], required=True)
-        self.github_workflows = self._get_cfg(
-            ["murdock", "github_workflows"], default=[]
-        )
-        for workflow in self.github_workflows:
+        # Users allowed to administrate the bot, e.g. to reload the config
+        self.admins = self._get_cfg(["admins"], default=[])
+        # How commands are processed, so slow commands do not stall the sync
+        self.command_workers = self._get_cfg(["commands", "workers"], default=4)
+        self.command_queue_size = self._get_cfg(["commands", "queue_size"], default=100)
+        self.command_timeout = self._get_cfg(
+            ["commands", "timeout_seconds"], default=60
+        )
+        if self.command_workers < 1:
+            raise ConfigError("commands.workers must be at least 1")
+        # How the rooms the bot is invited to are joined
+        self.join_concurrency = self._get_cfg(["joins", "concurrency"], default=4)
+        self.join_max_attempts = self._get_cfg(["joins", "max_attempts"], default=5)
+        self.join_backoff_initial = self._get_cfg(
+            ["joins", "backoff_initial"], default=2
+        )
+        # Whether a joined room gets the last report of every source right away
+        self.join_send_report = self._get_cfg(["joins", "send_report"], default=True)
+        if self.join_concurrency < 1 or self.join_max_attempts < 1:
+            raise ConfigError(
+                "joins.concurrency and joins.max_attempts must be at least 1"
+            )
+        # only needed by sources without a crontab of their own
+        self.crontab = self._get_cfg(["murdock", "crontab"], required=False)
+        sources = self._get_cfg(["murdock", "sources"], required=False)
+        if sources is None:
+            # A single source configured directly in the murdock section
+            sources = [self._get_cfg(["murdock"])]
+        self.sources = [self._parse_source(source) for source in sources]
+        names = [source.name for source in self.sources]
+        if len(set(names)) != len(names):
+            raise ConfigError("The names of murdock.sources must be unique")
+        # Whether rooms without subscriptions get the reports of all sources
+        self.broadcast_unsubscribed = self._get_cfg(
+            ["murdock", "broadcast_unsubscribed"], default=True
+        )
+        # Whether to edit one status message per room and source instead of
+        # sending a new report, unless there are new failures
+        self.live_status = self._get_cfg(["murdock", "live_status"], default=False)
+        # The maximum of a random delay of the checks, so sources and replicas do
+        # not check at the same time
+        self.schedule_jitter = self._get_cfg(["murdock", "jitter_seconds"], default=30)
+        # Whether to check once on start, if a check was missed while the bot
+        # was down
+        self.catch_up = self._get_cfg(["murdock", "catch_up"], default=True)
+        # How long before the checks to share the group sessions of the rooms
+        self.prewarm_lead = (
+            self._get_cfg(["murdock", "prewarm_minutes"], default=5) * 60
+        )
+        self.backoff_initial = self._get_cfg(
+            ["murdock", "backoff", "initial"], default=60
+        )
+        self.backoff_max_retries = self._get_cfg(
+            ["murdock", "backoff", "max_retries"], default=5
+        )
+
+        # High availability setup, with replicas sharing the database
+        self.ha_enabled = self._get_cfg(["ha", "enabled"], default=False)
+        self.ha_instance_id = self._get_cfg(["ha", "instance_id"], required=False)
+        self.ha_lease_duration = self._get_cfg(["ha", "lease_seconds"], default=10)
+        self.ha_renew_interval = self._get_cfg(["ha", "renew_seconds"], default=3)
+        if self.ha_renew_interval >= self.ha_lease_duration:
+            raise ConfigError("ha.renew_seconds must be less than ha.lease_seconds")
+
+        # Profiling setup
+        self.slow_callback_threshold = self._get_cfg(
+            ["profiling", "slow_callback_threshold"], default=0.5
+        )
+        self.profiler_backend = self._get_cfg(
+            ["profiling", "backend"], default="cprofile"
+        )
+        if self.profiler_backend not in ("cprofile", "yappi"):
+            raise ConfigError("profiling.backend must be one of 'cprofile' or 'yappi'")
+        self.profile_signal = self._get_cfg(
+            ["profiling", "signal"], default="SIGUSR1", required=False
+        )
+        if self.profile_signal and (
+            self.profile_signal not in signal.Signals.__members__
+            or self.profile_signal in ("SIGKILL", "SIGSTOP")
+        ):
+            raise ConfigError(
+                "profiling.signal must be the name of a signal that can be "
+                "handled, e.g. 'SIGUSR1', or false"
+            )
+        # Log the stack of the event loop when it lags behind for longer than
+        # this many seconds
+        self.loop_lag_threshold = self._get_cfg(
+            ["profiling", "loop_lag_threshold"], default=0.25, required=False
+        )
+
+        # Performance tuning
+        self.uvloop = self._get_cfg(["performance", "uvloop"], default=False)
+        self.offload_threshold = self._get_cfg(
+            ["performance", "offload_threshold"], default=64 * 1024
+        )
+        self.offload_processes = self._get_cfg(
+            ["performance", "offload_processes"], default=0
+        )
+
+    def _parse_source(self, source_dict: Dict[str, Any]) -> "Source":
+        """Read and validate the options of a source to monitor"""
+        github_org = self._get_cfg(["github", "org"], required=True, root=source_dict)
+        github_repo = self._get_cfg(["github", "repo"], required=True, root=source_dict)
+        name = self._get_cfg(
+            ["name"], default=f"{github_org}/{github_repo}", root=source_dict
+        )
+        github_workflows = self._get_cfg(
+            ["github_workflows"], default=[], root=source_dict
+        )
+        for workflow in github_workflows:
             if "name" not in workflow:
                 raise ConfigError("Must supply a name with murdock.github_workflows")
             if "report_xml" not in workflow:
                 workflow["report_xml"] = False
+            if "critical" not in workflow:
+                workflow["critical"] = True
+        crontab = self._get_cfg(
+            ["crontab"], default=self.crontab, required=False, root=source_dict
+        )
+        if crontab is None:
+            raise ConfigError(
+                f"Source {name} has no crontab, set murdock.crontab or its own"
+            )
+        for spec in [crontab] if isinstance(crontab, str) else crontab:
+            if not croniter.is_valid(spec):
+                raise ConfigError(f"Invalid crontab '{spec}' of source {name}")
+        return Source(
+            name=name,
+            crontab=crontab,
+            nightlies_branches=self._get_cfg(
+                ["branches"], default=[], root=source_dict
+            ),
+            nightlies_url=self._get_cfg(["nightlies_url"], root=source_dict),
+            result_url=self._get_cfg(["result_url"], root=source_dict),
+            commit_url=self._get_cfg(["commit_url"], root=source_dict),
+            github_org=github_org,
+            github_repo=github_repo,
+            github_token=self._get_cfg(
+                ["github", "token"],
+                default=os.environ.get("GITHUB_TOKEN"),
+                required=False,
+                root=source_dict,
+            ),
+            github_rate_limit_reserve=self._get_cfg(
+                ["github", "rate_limit_reserve"], default=100, root=source_dict
+            ),
+            github_api_url=self._get_cfg(
+                ["github", "api_url"],
+                default="https://api.github.com",
+                root=source_dict,
+            ),
+            github_workflows=github_workflows,
+            result_max_size=self._get_cfg(
+                ["result_page", "max_size_kb"], default=4096, root=source_dict
+            )
+            * 1024,
+            result_timeout=self._get_cfg(
+                ["result_page", "timeout"], default=30, root=source_dict
+            ),
+            analytics_window=self._get_cfg(
+                ["analytics", "window_days"],
+                default=self._get_cfg(["murdock", "analytics", "window_days"], 90),
+                root=source_dict,
+            )
+            * 24
+            * 60
+            * 60,
+            max_flaky_tests=self._get_cfg(
+                ["analytics", "max_flaky_tests"],
+                default=self._get_cfg(["murdock", "analytics", "max_flaky_tests"], 5),
+                root=source_dict,
+            ),
+            nightlies_timeout=self._get_cfg(
+                ["timeouts", "nightlies"], default=10, root=source_dict
+            ),
+            github_timeout=self._get_cfg(
+                ["timeouts", "github"], default=30, root=source_dict
+            ),
+            download_timeout=self._get_cfg(
+                ["timeouts", "download"], default=60, root=source_dict
+            ),
+            breaker_failure_threshold=self._get_cfg(
+                ["circuit_breaker", "failure_threshold"], default=3, root=source_dict
+            ),
+            breaker_reset_timeout=self._get_cfg(
+                ["circuit_breaker", "reset_timeout"], default=300, root=source_dict
+            ),
+        )
 
     def _get_cfg(
         self,
         path: List[str],
         default: Optional[Any] = None,
         required: Optional[bool] = True,
+        root: Optional[Dict[str, Any]] = None,
     ) -> Any:
         """Get a config option from a path and option name, specifying whether it is
         required.
 
+        The path is looked up in `root` if given, else in the whole config.
+
         Raises:
             ConfigError: If required is True and the object is not found (and there is
                 no default value provided), a ConfigError will be raised.
         """
         # Sift through the the config until we reach our option
-        config = self.config_dict
+        config = self.config_dict if root is None else root
         for name in path:
             config = config.get(name)
 
             # If at any point we don't get our expected option...
             if config is None:
                 # Raise an error if it was required
-                if required and not default:
+                if required and default is None:
                     raise ConfigError(f"Config option {'.'.join(path)} is required")
 
                 # or return the default value
@@ -149,3 +372,116 @@ class Config:
 
         # We found the option. Return it.
         return config
+
+
+class Source:
+    """A repository and its Murdock instance to monitor
+
+    Args:
+        name: A unique name of the source.
+
+        crontab: When to check and report the source. May be a list of
+            crontabs.
+
+        nightlies_branches: The branches to report the nightlies for.
+
+        nightlies_url: Link to the nightlies JSON. May contain the branch as a
+            format string.
+
+        result_url: Link to the results HTML. May contain the branch and the
+            commit as a format string.
+
+        result_max_size: Maximum number of bytes to fetch of a results HTML.
+
+        result_timeout: Maximum number of seconds to fetch a results HTML.
+
+        analytics_window: How many seconds of the history to analyse, e.g. for
+            flaky test cases.
+
+        max_flaky_tests: How many of the flakiest test cases to report.
+
+        nightlies_timeout: Seconds to wait for the nightlies JSON.
+
+        github_timeout: Seconds to wait for a response of the GitHub API.
+
+        download_timeout: Seconds to wait for the next chunk of a download, e.g.
+            of an artifact.
+
+        breaker_failure_threshold: After how many failed requests in a row to
+            open the circuit breaker of the source.
+
+        breaker_reset_timeout: How many seconds the circuit breaker stays open
+            before a trial request.
+
+        commit_url: Link to a commit. May contain the commit as a format string.
+
+        github_org: The GitHub organization of the repository.
+
+        github_repo: The name of the GitHub repository.
+
+        github_token: The token to access the GitHub API with.
+
+        github_rate_limit_reserve: Number of requests of the GitHub rate limit
+            reserved for critical workflows.
+
+        github_workflows: The GitHub workflows to report.
+
+        github_api_url: The base URL of the GitHub API.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        crontab: Union[str, List[str]],
+        nightlies_branches: List[str],
+        nightlies_url: str,
+        result_url: str,
+        commit_url: str,
+        github_org: str,
+        github_repo: str,
+        github_token: Optional[str] = None,
+        github_rate_limit_reserve: int = 100,
+        github_workflows: Optional[List[Dict[str, Any]]] = None,
+        result_max_size: int = 4 * 1024 * 1024,
+        result_timeout: float = 30,
+        analytics_window: int = 90 * 24 * 60 * 60,
+        max_flaky_tests: int = 5,
+        nightlies_timeout: float = 10,
+        github_timeout: float = 30,
+        download_timeout: float = 60,
+        breaker_failure_threshold: int = 3,
+        breaker_reset_timeout: float = 300,
+        github_api_url: str = "https://api.github.com",
+    ):
+        self.name = name
+        self.crontab = crontab
+        self.nightlies_branches = nightlies_branches
+        self.nightlies_url = nightlies_url
+        self.result_url = result_url
+        self.commit_url = commit_url
+        self.github_org = github_org
+        self.github_repo = github_repo
+        self.github_token = github_token
+        self.github_rate_limit_reserve = github_rate_limit_reserve
+        self.github_workflows = github_workflows or []
+        self.result_max_size = result_max_size
+        self.result_timeout = result_timeout
+        self.analytics_window = analytics_window
+        self.max_flaky_tests = max_flaky_tests
+        self.nightlies_timeout = nightlies_timeout
+        self.github_timeout = github_timeout
+        self.download_timeout = download_timeout
+        self.breaker_failure_threshold = breaker_failure_threshold
+        self.breaker_reset_timeout = breaker_reset_timeout
+        self.github_api_url = github_api_url
+
+    @property
+    def crontabs(self) -> List[str]:
+        """All crontabs of the source"""
+        return [self.crontab] if isinstance(self.crontab, str) else list(self.crontab)
+
+    def __str__(self):
+        return self.name
+
+    def __repr__(self):
+        return "<{}: {}>".format(type(self).__name__, self)
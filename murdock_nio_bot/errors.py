@@ -10,3 +10,44 @@ class ConfigError(RuntimeError):
 
     def __init__(self, msg: str):
         super(ConfigError, self).__init__("%s" % (msg,))
+
+
+class RateLimitError(RuntimeError):
+    """A request was not sent or rejected, as the API rate limit is exhausted.
+
+    Args:
+        msg: The message displayed to the user on error.
+
+        retry_at: The UNIX timestamp at which requests may be sent again.
+    """
+
+    def __init__(self, msg: str, retry_at: float):
+        super(RateLimitError, self).__init__("%s" % (msg,))
+        self.retry_at = retry_at
+
+
+class CircuitOpenError(RuntimeError):
+    """A request was not sent, as the circuit breaker of its source is open and
+    there is no last good result to serve instead.
+
+    Args:
+        msg: The message displayed to the user on error.
+    """
+
+    def __init__(self, msg: str):
+        super(CircuitOpenError, self).__init__("%s" % (msg,))
+
+
+class GitHubError(RuntimeError):
+    """A request to the GitHub API failed with an error other than the rate
+    limit.
+
+    Args:
+        msg: The message displayed to the user on error.
+
+        status: The HTTP status of the response.
+    """
+
+    def __init__(self, msg: str, status: int):
+        super(GitHubError, self).__init__("%s" % (msg,))
+        self.status = status
@@ -1,22 +1,277 @@
+import datetime
+import ipaddress
 import logging
 import os
+import tempfile
+import time
+import urllib.parse
+from http.client import HTTPConnection
 
-from agithub.GitHub import GitHub
+import requests
+from agithub.GitHub import GitHub, GitHubClient
 
-from murdock_nio_bot.errors import ConfigError
-from murdock_nio_bot.storage import Storage
+from murdock_nio_bot.circuit import get_breaker
+from murdock_nio_bot.errors import (
+    CircuitOpenError,
+    ConfigError,
+    GitHubError,
+    RateLimitError,
+)
+from murdock_nio_bot.junit import RunOutcomes, iter_zipped_testcases
 
 GITHUB_TOKEN = os.environ.get("GITHUB_TOKEN")
+GITHUB_API_URL = "https://api.github.com"
+
+# How many failing test cases of a run to keep for the report
+MAX_FAILED_TESTS = 10
 
 logger = logging.getLogger()
 
 
+class _TimeoutGitHubClient(GitHubClient):
+    """A `GitHubClient` whose connections time out"""
+
+    def __init__(self, *args, timeout=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.timeout = timeout
+
+    def get_connection(self):
+        if self.prop.secure_http or not _is_loopback(self.prop.api_url):
+            conn = super().get_connection()
+        else:
+            # agithub refuses to send the token over plain HTTP, which is only
+            # fine for local stand-ins of the API
+            conn = HTTPConnection(self.prop.api_url)
+        conn.timeout = self.timeout
+        return conn
+
+
+def _is_loopback(netloc):
+    host = urllib.parse.urlsplit(f"//{netloc}").hostname
+    if host == "localhost":
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+
+class TimeoutGitHub(GitHub):
+    """A `GitHub` API, whose requests time out after `timeout` seconds
+
+    Unlike agithub, `api_url` may be a full URL, e.g.
+    ``https://github.example.com/api/v3`` or a local stand-in of the API.
+    """
+
+    def __init__(self, token=None, timeout=None, api_url=GITHUB_API_URL, **kwargs):
+        super().__init__(token=token, **kwargs)
+        props = self.client.prop
+        url = urllib.parse.urlsplit(api_url if "//" in api_url else f"//{api_url}")
+        props.api_url = url.netloc
+        props.secure_http = url.scheme != "http"
+        props.url_prefix = url.path.rstrip("/") or None
+        self.setClient(_TimeoutGitHubClient(timeout=timeout, **kwargs))
+        self.setConnectionProperties(props)
+
+
+class RateLimitGovernor:
+    """Tracks the GitHub API rate limit budget shared by all requests.
+
+    The budget is read from the `X-RateLimit-*` headers of every response.
+    Once fewer than `reserve` requests remain, only critical requests are let
+    through, so optional checks never starve critical ones.
+
+    Args:
+        token: The token to authenticate the requests with. The rate limit
+            applies per token.
+
+        reserve: The number of requests reserved for critical requests.
+
+        api_url: The base URL of the GitHub API.
+    """
+
+    def __init__(self, token=GITHUB_TOKEN, reserve=100, api_url=GITHUB_API_URL):
+        self.token = token
+        self.reserve = reserve
+        self.api_url = api_url
+        self.remaining = None
+        self.reset = 0.0
+        self.retry_at = 0.0
+
+    def allow(self, critical=True):
+        """Returns True if a request may be sent now"""
+        now = time.time()
+        if now < self.retry_at:
+            return False
+        if self.remaining is None or now >= self.reset:
+            return True
+        if critical:
+            return self.remaining > 0
+        return self.remaining > self.reserve
+
+    def update(self, status, headers):
+        """Update the budget from a response
+
+        Args:
+            status: The HTTP status of the response.
+
+            headers: The headers of the response as (name, value) pairs.
+
+        Returns:
+            True if the response signals that the rate limit was hit.
+        """
+        headers = {name.lower(): value for name, value in headers or ()}
+        if "x-ratelimit-remaining" in headers:
+            self.remaining = int(headers["x-ratelimit-remaining"])
+        if "x-ratelimit-reset" in headers:
+            self.reset = float(headers["x-ratelimit-reset"])
+        if status not in (403, 429):
+            return False
+        if "retry-after" in headers:
+            # secondary rate limit
+            self.retry_at = time.time() + int(headers["retry-after"])
+        elif self.remaining == 0:
+            self.retry_at = self.reset
+        else:
+            return False
+        logger.warning(
+            "GitHub rate limit hit, deferring requests until %s",
+            time.ctime(self.retry_at),
+        )
+        return True
+
+    def _check_allowed(self, critical):
+        if not self.allow(critical):
+            raise RateLimitError(
+                "GitHub rate limit budget exhausted",
+                max(self.retry_at, self.reset),
+            )
+
+    def download(self, url, fileobj, critical=True, timeout=None):
+        """Download a file, e.g. an artifact, from the GitHub API in chunks
+
+        Args:
+            url: The API URL of the file.
+
+            fileobj: A binary file object to write the file to.
+
+            critical: Whether the request may use the reserved budget.
+
+            timeout: Seconds to wait for the server to respond or send the next
+                chunk.
+
+        Raises:
+            RateLimitError: If the request was deferred or hit the rate limit.
+
+            requests.HTTPError: If the download failed.
+        """
+        self._check_allowed(critical)
+        headers = {"Accept": "application/vnd.github.v3+json"}
+        if self.token:
+            headers["Authorization"] = f"token {self.token}"
+        with requests.get(
+            url, headers=headers, stream=True, timeout=timeout
+        ) as response:
+            # the API redirects to the actual storage of the file
+            api_response = response.history[0] if response.history else response
+            if self.update(api_response.status_code, api_response.headers.items()):
+                raise RateLimitError("GitHub rate limit hit", self.retry_at)
+            response.raise_for_status()
+            for chunk in response.iter_content(chunk_size=64 * 1024):
+                fileobj.write(chunk)
+
+    def request(self, api_call, critical=True, timeout=None):
+        """Send a request to the GitHub API if the budget allows it
+
+        Args:
+            api_call: A callable, that takes a `GitHub` object and returns
+                the (status, data) result of a request.
+
+            critical: Whether the request may use the reserved budget.
+
+            timeout: Seconds to wait for the server to respond.
+
+        Raises:
+            RateLimitError: If the request was deferred or hit the rate limit.
+        """
+        self._check_allowed(critical)
+        github = TimeoutGitHub(
+            token=self.token,
+            timeout=timeout,
+            api_url=self.api_url,
+            sleep_on_ratelimit=False,
+        )
+        status, data = api_call(github)
+        if self.update(status, github.getheaders()):
+            raise RateLimitError("GitHub rate limit hit", self.retry_at)
+        logger.debug("GitHub rate limit: %s requests remaining", self.remaining)
+        return status, data
+
+
+_governors = {}
+
+
+def get_governor(token=GITHUB_TOKEN, reserve=None, api_url=GITHUB_API_URL):
+    """Get the governor shared by all requests using the same token with the
+    same API
+
+    Args:
+        token: The token to authenticate the requests with.
+
+        reserve: If given, update the reserve of the governor.
+
+        api_url: The base URL of the GitHub API.
+    """
+    key = (api_url, token)
+    if key not in _governors:
+        _governors[key] = RateLimitGovernor(token, api_url=api_url)
+    if reserve is not None:
+        _governors[key].reserve = reserve
+    return _governors[key]
+
+
+# The governor of requests using the GITHUB_TOKEN from the environment
+governor = get_governor()
+
+
+def _governor(config):
+    return get_governor(
+        config.github_token, config.github_rate_limit_reserve, config.github_api_url
+    )
+
+
+def _breaker(config):
+    return get_breaker(
+        config.name, config.breaker_failure_threshold, config.breaker_reset_timeout
+    )
+
+
+def _repo(github, config):
+    return github.repos[config.github_org][config.github_repo]
+
+
+def run_html_url(config, run_id):
+    """
+    Gets the web page of a workflow run, for runs whose URL was not fetched,
+    e.g. ones read from the history
+    """
+    parsed = urllib.parse.urlsplit(config.github_api_url)
+    if parsed.netloc == "api.github.com":
+        base = "https://github.com"
+    else:
+        # GitHub Enterprise serves the API below /api/v3 of the web host
+        base = f"{parsed.scheme}://{parsed.netloc}"
+    return f"{base}/{config.github_org}/{config.github_repo}/actions/runs/{run_id}"
+
+
 class Workflow:
-    def __init__(self, config, name, id, report_xml=False):
+    def __init__(self, config, name, id, report_xml=False, critical=True, store=None):
         self.config = config
         self.name = name
         self.id = id
         self.report_xml = report_xml
+        self.critical = critical
+        self.store = store
 
     def __str__(self):
         return self.name
@@ -25,39 +280,49 @@ class Workflow:
         return "<{}: {}>".format(type(self).__name__, self)
 
     @staticmethod
-    def fetch_workflows(config):
-        status, data = (
-            GitHub(token=GITHUB_TOKEN)
-            .repos[config.github_org][config.github_repo]
-            .actions.workflows.get()
+    def fetch_workflows(config, store=None):
+        """
+        Returns the configured workflows of the repository of a source.
+
+        :raises GitHubError: If the list of workflows could not be fetched, so
+            a failed request is not mistaken for a repository without
+            workflows.
+        """
+        status, data = _governor(config).request(
+            lambda github: _repo(github, config).actions.workflows.get(),
+            timeout=config.github_timeout,
         )
         if status != 200:
-            logger.error("Unable to fetch workflow list from Github")
-            return []
+            raise GitHubError(
+                f"Unable to fetch workflow list from Github: {status}", status
+            )
         workflow_list = data["workflows"]
         workflows = {w["name"]: w for w in config.github_workflows}
         available_names = {w["name"] for w in workflow_list}
         for workflow in workflows:
             if workflow not in available_names:
-                raise ConfigError(f"{workflow['name']} is not in a workflow")
+                raise ConfigError(f"{workflow} is not a workflow")
         res = []
         for workflow in workflow_list:
             name = workflow["name"]
             if name not in workflows:
                 continue
-            res.append(Workflow(config, id=workflow["id"], **workflows[name]))
+            res.append(
+                Workflow(config, id=workflow["id"], store=store, **workflows[name])
+            )
         return res
 
     @property
     def scheduled_runs(self):
-        status, data = (
-            GitHub(token=GITHUB_TOKEN)
-            .repos[self.config.github_org][self.config.github_repo]
+        status, data = _governor(self.config).request(
+            lambda github: _repo(github, self.config)
             .actions.workflows[self.id]
-            .runs.get()
+            .runs.get(),
+            critical=self.critical,
+            timeout=self.config.github_timeout,
         )
         if status != 200:
-            logger.error("Unable to fetch workflow runs from Github")
+            logger.error("Unable to fetch workflow runs from Github: %d", status)
             return []
         return [
             WorkflowRun(self.config, **r)
@@ -65,12 +330,41 @@ class Workflow:
             if r["event"] == "schedule" and r["status"] == "completed"
         ]
 
-    def check_if_last_errored_or_changed_to_passed(self):
-        results = self.scheduled_runs
-        store = Storage(self.config.database)
+    def fetch_scheduled_runs(self):
+        """
+        Returns the scheduled runs or ``None`` if fetching them was deferred
+        due to the rate limit or an open circuit breaker. While the circuit
+        breaker of the source is open, the last fetched runs are returned.
+        """
+        try:
+            return _breaker(self.config).call(
+                ("scheduled_runs", self.id), lambda: self.scheduled_runs
+            )
+        except (RateLimitError, CircuitOpenError) as exc:
+            # the check is repeated with the next report, as the last run
+            # commit is not updated
+            logger.warning("Deferring check of workflow %s: %s", self.name, exc)
+            return None
+
+    def check_if_last_errored_or_changed_to_passed(self, results=None):
+        """
+        Returns the latest scheduled run when it failed or changed from failed
+        to succeeded and was not reported yet. Returns ``None`` otherwise.
+
+        :param results: The scheduled runs, if they were already fetched.
+        """
+        if results is None:
+            results = self.fetch_scheduled_runs()
+            if results is None:
+                return None
+        store = self.store
         if len(results) == 0:
             return None
-        if results[0].commit == store.get_last_run_commit(self.id):
+        # without a store, e.g. in a dry run, already reported runs are not
+        # skipped and nothing is recorded
+        if store is not None and results[0].commit == store.get_last_run_commit(
+            self.id
+        ):
             return None
         if results[0].conclusion == "failure" or (
             len(results) > 1
@@ -78,7 +372,8 @@ class Workflow:
             and results[0].conclusion == "success"
         ):
             result = results[0]
-            store.set_last_run_commit(self.id, results[0].commit)
+            if store is not None:
+                store.set_last_run_commit(self.id, results[0].commit)
             return result
         return None
 
@@ -90,3 +385,78 @@ class WorkflowRun:
         self.commit = head_sha
         self.conclusion = conclusion
         self.html_url = html_url
+        self.branch = kwargs.get("head_branch")
+        # when the run started as a UNIX timestamp, if GitHub reported it
+        started = kwargs.get("run_started_at") or kwargs.get("created_at")
+        self.timestamp = (
+            int(datetime.datetime.strptime(started, "%Y-%m-%dT%H:%M:%S%z").timestamp())
+            if started
+            else None
+        )
+        # the first MAX_FAILED_TESTS failing test cases and the number of all
+        # failing test cases, if the JUnit XML reports of the run were analysed
+        self.failed_tests = None
+        self.failed_tests_count = 0
+        # the outcomes of all test cases, for the history
+        self.test_outcomes = None
+
+    def fetch_failed_tests(self, critical=True, cache=None):
+        """
+        Finds the failing test cases in the JUnit XML reports of the run's
+        artifacts and collects the outcomes of all test cases. The artifacts
+        are downloaded to files and parsed incrementally, so only the packed
+        outcomes, not the reports or test cases, are kept in memory.
+
+        :param cache: A `FileCache` to keep the artifacts in. Without it, they
+            are downloaded to temporary files.
+        """
+        status, data = _governor(self.config).request(
+            lambda github: _repo(github, self.config)
+            .actions.runs[self.id]
+            .artifacts.get(),
+            critical=critical,
+            timeout=self.config.github_timeout,
+        )
+        if status != 200:
+            logger.error("Unable to fetch artifacts of run %d: %d", self.id, status)
+            return
+        failed_tests = []
+        failed_tests_count = 0
+        test_outcomes = RunOutcomes()
+        for artifact in data["artifacts"]:
+            if artifact.get("expired"):
+                continue
+
+            def download(fileobj, url=artifact["archive_download_url"]):
+                _governor(self.config).download(
+                    url,
+                    fileobj,
+                    critical=critical,
+                    timeout=self.config.download_timeout,
+                )
+
+            if cache is None:
+                zip_file = tempfile.TemporaryFile()
+                download(zip_file)
+                zip_file.seek(0)
+            else:
+                zip_file = cache.fetch(
+                    "artifact/{}/{}/{}/{}".format(
+                        self.config.github_org,
+                        self.config.github_repo,
+                        self.id,
+                        artifact["id"],
+                    ),
+                    download,
+                )
+            with zip_file:
+                for testcase in iter_zipped_testcases(zip_file):
+                    test_outcomes.add(testcase)
+                    if not testcase.failed:
+                        continue
+                    failed_tests_count += 1
+                    if len(failed_tests) < MAX_FAILED_TESTS:
+                        failed_tests.append(testcase)
+        self.failed_tests = failed_tests
+        self.failed_tests_count = failed_tests_count
+        self.test_outcomes = test_outcomes
@@ -0,0 +1,126 @@
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict, Optional
+
+import aiohttp
+from nio import AsyncClient, JoinError
+
+from murdock_nio_bot.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Errors after which joining again is pointless, e.g. as the invite was
+# withdrawn
+PERMANENT_ERRORS = ("M_FORBIDDEN", "M_NOT_FOUND", "M_UNKNOWN_TOKEN")
+
+# Errors of the connection to the homeserver, which are worth retrying
+TRANSPORT_ERRORS = (aiohttp.ClientError, asyncio.TimeoutError, OSError)
+
+
+class JoinQueue:
+    """Joins the rooms the bot is invited to, a limited number at a time, so
+    invites that piled up, e.g. while the bot was down, neither hold up the sync
+    nor run into the rate limit of the homeserver all at once.
+
+    Failed joins are retried with exponential backoff, or after the time the
+    homeserver asks for with `retry_after_ms`.
+
+    Args:
+        client: The client to join with.
+
+        concurrency: How many rooms to join at the same time.
+
+        max_attempts: How often to try to join a room before giving up.
+
+        backoff_initial: Seconds to wait before the first retry. The delay
+            doubles with every further retry.
+
+        on_join: A coroutine function called with the ID of every room joined.
+    """
+
+    def __init__(
+        self,
+        client: AsyncClient,
+        concurrency: int = 4,
+        max_attempts: int = 5,
+        backoff_initial: float = 2,
+        on_join: Optional[Callable[[str], Awaitable[None]]] = None,
+    ):
+        self.client = client
+        self.max_attempts = max_attempts
+        self.backoff_initial = backoff_initial
+        self.on_join = on_join
+        self._semaphore = asyncio.Semaphore(concurrency)
+        # the joins queued or running, by room
+        self._joins: Dict[str, asyncio.Future] = {}
+
+    def submit(self, room_id: str) -> "asyncio.Future[bool]":
+        """Queue joining a room, unless it is queued already
+
+        Returns:
+            A future of whether the room was joined.
+        """
+        if room_id not in self._joins:
+            self._joins[room_id] = asyncio.ensure_future(self._join(room_id))
+            metrics.set("joins_queued", len(self._joins))
+        return self._joins[room_id]
+
+    async def join(self) -> None:
+        """Wait until all joins queued so far are done"""
+        await asyncio.gather(*self._joins.values(), return_exceptions=True)
+
+    async def _join(self, room_id: str) -> bool:
+        joined = False
+        try:
+            async with self._semaphore:
+                joined = await self._try_join(room_id)
+        except Exception:
+            logger.exception("Unable to join %s", room_id)
+        finally:
+            del self._joins[room_id]
+            metrics.set("joins_queued", len(self._joins))
+        metrics.inc("joins_total", outcome="joined" if joined else "failed")
+        if joined and self.on_join is not None:
+            try:
+                await self.on_join(room_id)
+            except Exception:
+                logger.exception("Unable to welcome %s", room_id)
+        return joined
+
+    async def _try_join(self, room_id: str) -> bool:
+        for attempt in range(1, self.max_attempts + 1):
+            retry_after_ms = None
+            try:
+                response = await self.client.join(room_id)
+            except TRANSPORT_ERRORS as exc:
+                error = str(exc) or type(exc).__name__
+            else:
+                if not isinstance(response, JoinError):
+                    logger.info("Joined %s", room_id)
+                    return True
+                if response.status_code in PERMANENT_ERRORS:
+                    logger.error("Unable to join %s: %s", room_id, response.message)
+                    return False
+                error = response.message
+                retry_after_ms = response.retry_after_ms
+            if attempt == self.max_attempts:
+                break
+            if retry_after_ms:
+                delay = retry_after_ms / 1000
+            else:
+                delay = self.backoff_initial * 2 ** (attempt - 1)
+            logger.warning(
+                "Error joining %s (attempt %d), retrying in %.1fs: %s",
+                room_id,
+                attempt,
+                delay,
+                error,
+            )
+            await asyncio.sleep(delay)
+        logger.error(
+            "Unable to join %s after %d attempts: %s",
+            room_id,
+            self.max_attempts,
+            error,
+        )
+        return False
@@ -0,0 +1,102 @@
+import array
+import hashlib
+import logging
+import zipfile
+from typing import IO, Dict, Iterator, NamedTuple, Optional
+from xml.etree.ElementTree import ParseError, iterparse
+
+logger = logging.getLogger(__name__)
+
+
+class TestCase(NamedTuple):
+    """A test case of a JUnit XML report"""
+
+    classname: str
+    name: str
+    failed: bool
+    message: Optional[str] = None
+
+    def __str__(self):
+        if self.classname:
+            return f"{self.classname}.{self.name}"
+        return self.name
+
+
+def test_case_id(name: str) -> int:
+    """A stable id of a test case, as a signed 64 bit integer"""
+    digest = hashlib.blake2b(name.encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "big", signed=True)
+
+
+class RunOutcomes:
+    """The outcomes of the test cases of a run, packed as the ids of the test
+    cases and whether they failed. Only the names of the failed test cases are
+    kept, as only those can be flaky.
+    """
+
+    def __init__(self):
+        self.test_ids = array.array("q")
+        self.failed = bytearray()
+        self.failed_names: Dict[int, str] = {}
+
+    def __len__(self) -> int:
+        return len(self.failed)
+
+    def add(self, testcase: TestCase) -> None:
+        name = str(testcase)
+        test_id = test_case_id(name)
+        self.test_ids.append(test_id)
+        self.failed.append(testcase.failed)
+        if testcase.failed:
+            self.failed_names[test_id] = name
+
+
+def iter_testcases(xml_file: IO[bytes]) -> Iterator[TestCase]:
+    """Parse the test cases of a JUnit XML report incrementally.
+
+    Every element is dropped as soon as it was parsed, so the memory used does
+    not grow with the size of the report.
+
+    Args:
+        xml_file: A binary file object of the report.
+    """
+    parents = []
+    for event, elem in iterparse(xml_file, events=("start", "end")):
+        if event == "start":
+            parents.append(elem)
+            continue
+        parents.pop()
+        if elem.tag == "testcase":
+            failure = elem.find("failure")
+            if failure is None:
+                failure = elem.find("error")
+            yield TestCase(
+                classname=elem.get("classname", ""),
+                name=elem.get("name", ""),
+                failed=failure is not None,
+                message=None if failure is None else failure.get("message"),
+            )
+        # drop everything parsed below the test suites from the tree, e.g. test
+        # cases or their captured output
+        if parents and parents[-1].tag in ("testsuite", "testsuites"):
+            elem.clear()
+            parents[-1].remove(elem)
+
+
+def iter_zipped_testcases(zip_file: IO[bytes]) -> Iterator[TestCase]:
+    """Parse the test cases of all JUnit XML reports in a zip archive
+
+    The reports are decompressed while they are parsed, not extracted first.
+
+    Args:
+        zip_file: A seekable binary file object of the archive.
+    """
+    with zipfile.ZipFile(zip_file) as archive:
+        for info in archive.infolist():
+            if info.is_dir() or not info.filename.endswith(".xml"):
+                continue
+            with archive.open(info) as xml_file:
+                try:
+                    yield from iter_testcases(xml_file)
+                except ParseError as exc:
+                    logger.warning("Unable to parse %s: %s", info.filename, exc)
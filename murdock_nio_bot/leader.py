@@ -0,0 +1,96 @@
+import asyncio
+import logging
+import os
+import socket
+import time
+from typing import Optional
+
+from murdock_nio_bot.storage import Storage
+
+logger = logging.getLogger(__name__)
+
+# The name of the lease all replicas of the bot compete for
+LEASE_NAME = "leader"
+
+
+class LeaderElector:
+    """Elects one of several replicas of the bot sharing a database as the
+    leader, using a lease in the database that the leader renews as a
+    heartbeat. Only the leader should check the sources and respond to
+    messages; a standby takes over once the lease of a dead leader expired.
+
+    Args:
+        store: Bot storage, shared by all replicas.
+
+        holder: A unique id of this replica. Defaults to the host name and the
+            process id.
+
+        lease_duration: For how many seconds a lease is valid without being
+            renewed. A standby takes over at most this long after the leader
+            died, plus `renew_interval`.
+
+        renew_interval: How often to renew the lease or try to acquire it, in
+            seconds. Must be well below `lease_duration`.
+    """
+
+    def __init__(
+        self,
+        store: Storage,
+        holder: Optional[str] = None,
+        lease_duration: float = 10,
+        renew_interval: float = 3,
+    ):
+        self.store = store
+        self.holder = holder or "{}-{}".format(socket.gethostname(), os.getpid())
+        self.lease_duration = lease_duration
+        self.renew_interval = renew_interval
+        # when the lease held by this replica expires, according to the local
+        # clock
+        self._expires_at = 0.0
+
+    @property
+    def is_leader(self) -> bool:
+        """Whether this replica holds the lease. Turns False as soon as the lease
+        expires, even if renewing it got stuck.
+        """
+        return time.monotonic() < self._expires_at
+
+    def try_acquire(self) -> bool:
+        """Acquire or renew the lease
+
+        Returns:
+            Whether this replica is the leader now.
+        """
+        was_leader = self.is_leader
+        # the lease is counted from before the query, to never overestimate it
+        start = time.monotonic()
+        try:
+            acquired = self.store.acquire_lease(
+                LEASE_NAME, self.holder, self.lease_duration
+            )
+        except Exception as exc:
+            logger.error("Unable to renew leader lease: %s", exc)
+            acquired = False
+        if acquired:
+            self._expires_at = start + self.lease_duration
+            if not was_leader:
+                logger.info("%s is now the leader", self.holder)
+        elif was_leader and not self.is_leader:
+            logger.warning("%s lost the leader lease", self.holder)
+        return self.is_leader
+
+    def release(self) -> None:
+        """Give up the lease, so a standby can take over right away"""
+        if self.is_leader:
+            self.store.release_lease(LEASE_NAME, self.holder)
+            self._expires_at = 0.0
+            logger.info("%s released the leader lease", self.holder)
+
+    async def run(self) -> None:
+        """Keep acquiring or renewing the lease, until cancelled"""
+        try:
+            while True:
+                self.try_acquire()
+                await asyncio.sleep(self.renew_interval)
+        finally:
+            self.release()
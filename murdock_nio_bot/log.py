@@ -0,0 +1,82 @@
+import atexit
+import itertools
+import logging
+import logging.handlers
+import queue
+from typing import List, Optional
+
+# The listener currently draining the log queue, if logging was set up
+_listener: Optional[logging.handlers.QueueListener] = None
+_queue_handler: Optional[logging.handlers.QueueHandler] = None
+_logger: Optional[logging.Logger] = None
+
+
+def setup_logging(
+    logger: logging.Logger, level: str, handlers: List[logging.Handler]
+) -> None:
+    """Route the records of a logger through a queue to the given handlers.
+
+    The handlers run on a background thread of a `QueueListener`, so slow
+    file or console output never blocks the event loop. Calling this again
+    replaces the previous setup.
+
+    Args:
+        logger: The logger to set up, usually the root logger.
+
+        level: The log level of the logger.
+
+        handlers: The handlers that should eventually emit the records.
+    """
+    global _listener, _queue_handler, _logger
+
+    stop_logging()
+    logger.setLevel(level)
+    if not handlers:
+        return
+    log_queue = queue.SimpleQueue()
+    _queue_handler = logging.handlers.QueueHandler(log_queue)
+    _listener = logging.handlers.QueueListener(
+        log_queue, *handlers, respect_handler_level=True
+    )
+    _logger = logger
+    _logger.addHandler(_queue_handler)
+    _listener.start()
+
+
+def stop_logging() -> None:
+    """Flush all queued records and stop the listener thread"""
+    global _listener, _queue_handler, _logger
+
+    if _queue_handler is not None:
+        _logger.removeHandler(_queue_handler)
+        _queue_handler = _logger = None
+    if _listener is not None:
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+        _listener = None
+
+
+atexit.register(stop_logging)
+
+
+class Sampler:
+    """Lets through only a fraction of calls, e.g. to thin out per-message debug
+    logs in busy rooms.
+
+    Args:
+        rate: The fraction of calls to let through, between 0 and 1.
+    """
+
+    def __init__(self, rate: float = 1.0):
+        if rate <= 0:
+            self._every = 0
+        else:
+            self._every = max(1, round(1 / rate))
+        self._counter = itertools.count()
+
+    def sample(self) -> bool:
+        """Returns True if this call should be let through"""
+        if self._every == 0:
+            return False
+        return next(self._counter) % self._every == 0
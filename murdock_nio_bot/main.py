@@ -1,10 +1,12 @@
 #!/usr/bin/env python3
 import asyncio
 import logging
+import os
+import signal
 import sys
 from time import sleep
+from typing import Optional
 
-import aiocron
 from aiohttp import ClientConnectionError, ServerDisconnectedError
 from nio import (
     AsyncClient,
@@ -17,18 +19,23 @@ from nio import (
     UnknownEvent,
 )
 
+from murdock_nio_bot import offload
+from murdock_nio_bot.cache import FileCache
 from murdock_nio_bot.callbacks import Callbacks
+from murdock_nio_bot.chat_functions import sent_events
+from murdock_nio_bot.command_pool import CommandPool
 from murdock_nio_bot.config import Config
-from murdock_nio_bot.github import Workflow
-from murdock_nio_bot.murdock import report_last_nightlies
+from murdock_nio_bot.join_queue import JoinQueue
+from murdock_nio_bot.leader import LeaderElector
+from murdock_nio_bot.profiling import LoopLagMonitor, Profiler, install_uvloop
+from murdock_nio_bot.reloader import ConfigReloader
 from murdock_nio_bot.storage import Storage
 
 logger = logging.getLogger(__name__)
 
 
-async def main():
-    """The first function that is run when starting the bot"""
-
+def read_config() -> Config:
+    """Read the config file given as the first command line argument"""
     # Read user-configured options from a config file.
     # A different config file path can be specified as the first command line argument
     if len(sys.argv) > 1:
@@ -37,10 +44,42 @@ async def main():
         config_path = "config.yaml"
 
     # Read the parsed config file and create a Config object
-    config = Config(config_path)
+    return Config(config_path)
+
+
+async def main(config: Optional[Config] = None):
+    """The first function that is run when starting the bot"""
+    if config is None:
+        config = read_config()
+
+    # Large inputs of CPU-bound work are processed off the event loop
+    offload.configure(config.offload_threshold, config.offload_processes)
+    if config.loop_lag_threshold:
+        LoopLagMonitor(config.loop_lag_threshold).start()
 
     # Configure the database
-    store = Storage(config.database)
+    store = Storage(
+        config.database,
+        processed_events_window=config.processed_events_window,
+        processed_events_capacity=config.processed_events_capacity,
+        history_retention=config.history_retention,
+    )
+
+    # With several replicas, only the leader acts
+    leader = None
+    if config.ha_enabled:
+        leader = LeaderElector(
+            store,
+            config.ha_instance_id,
+            lease_duration=config.ha_lease_duration,
+            renew_interval=config.ha_renew_interval,
+        )
+        leader.try_acquire()
+        asyncio.ensure_future(leader.run())
+
+    sent_events.configure(
+        config.sent_events_size, store if config.persist_sent_events else None
+    )
 
     # Configuration options for the AsyncClient
     client_config = AsyncClientConfig(
@@ -63,16 +102,42 @@ async def main():
         client.access_token = config.user_token
         client.user_id = config.user_id
 
+    cache = FileCache(os.path.join(config.store_path, "cache"), config.cache_max_bytes)
+
+    # Every source is checked by its own worker, so they do not delay each other.
+    # On a reload of the config, only the workers of changed sources are rebuilt
+    reloader = ConfigReloader(config, client, store, cache=cache, leader=leader)
+    reloader.start()
+    loop = asyncio.get_event_loop()
+    loop.add_signal_handler(signal.SIGHUP, reloader.reload)
+
+    # Commands are run by a pool of workers, so they do not hold up the sync
+    pool = CommandPool(
+        config.command_workers, config.command_queue_size, config.command_timeout
+    )
+    pool.start()
+
+    # Invites are joined in the background, and joined rooms get the last
+    # reports right away
+    join_queue = JoinQueue(
+        client,
+        config.join_concurrency,
+        config.join_max_attempts,
+        config.join_backoff_initial,
+        on_join=reloader.send_last_reports if config.join_send_report else None,
+    )
+
     # Set up event callbacks
-    callbacks = Callbacks(client, store, config)
+    callbacks = Callbacks(client, store, config, leader, reloader, pool, join_queue)
+    reloader.listeners.append(callbacks.set_config)
     client.add_event_callback(callbacks.message, (RoomMessageText,))
     client.add_event_callback(callbacks.invite, (InviteMemberEvent,))
     client.add_event_callback(callbacks.decryption_failure, (MegolmEvent,))
     client.add_event_callback(callbacks.unknown, (UnknownEvent,))
-    workflows = Workflow.fetch_workflows(config)
-    aiocron.crontab(
-        config.crontab, func=report_last_nightlies, args=(config, client, workflows)
-    )
+    if config.profile_signal:
+        Profiler(config.store_path, config.profiler_backend).install(
+            loop, config.profile_signal
+        )
 
     # Keep trying to reconnect on failure (with some time in-between)
     while True:
@@ -109,7 +174,7 @@ async def main():
 
                 # Login succeeded!
 
-            logger.info(f"Logged in as {config.user_id}")
+            logger.info("Logged in as %s", config.user_id)
             await client.sync_forever(timeout=30000, full_state=True)
 
         except (ClientConnectionError, ServerDisconnectedError):
@@ -118,9 +183,23 @@ async def main():
             # Sleep so we don't bombard the server with login requests
             sleep(15)
         finally:
+            cache.flush()
             # Make sure to close the client connection on disconnect
             await client.close()
 
 
-# Run the main function in an asyncio event loop
-asyncio.get_event_loop().run_until_complete(main())
+def run():
+    """Run the bot, or one of its subcommands"""
+    if sys.argv[1:2] == ["report"]:
+        from murdock_nio_bot import report
+
+        sys.exit(report.main(sys.argv[2:]))
+    config = read_config()
+    if config.uvloop:
+        install_uvloop()
+    # Run the main function in an asyncio event loop
+    asyncio.get_event_loop().run_until_complete(main(config))
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,58 @@
+import threading
+from typing import Dict, Tuple
+
+# A metric is identified by its name and its sorted (label, value) pairs
+MetricKey = Tuple[str, Tuple[Tuple[str, str], ...]]
+
+
+class Metrics:
+    """A registry of counters and gauges, safe to update from executor threads.
+
+    Metrics are rendered in the Prometheus text format, e.g.
+    `circuit_breaker_state{source="RIOT"} 0`.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._values: Dict[MetricKey, float] = {}
+
+    @staticmethod
+    def _key(name: str, labels: Dict[str, str]) -> MetricKey:
+        return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+    def inc(self, name: str, value: float = 1, **labels) -> None:
+        """Increase a counter"""
+        key = self._key(name, labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + value
+
+    def set(self, name: str, value: float, **labels) -> None:
+        """Set a gauge"""
+        with self._lock:
+            self._values[self._key(name, labels)] = value
+
+    def get(self, name: str, **labels) -> float:
+        """Get the value of a counter or a gauge, 0 if it was never set"""
+        with self._lock:
+            return self._values.get(self._key(name, labels), 0)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._values.clear()
+
+    def render(self) -> str:
+        """Render all metrics, one per line"""
+        with self._lock:
+            items = sorted(self._values.items())
+        lines = []
+        for (name, labels), value in items:
+            if labels:
+                name += "{{{}}}".format(
+                    ",".join(f'{label}="{v}"' for label, v in labels)
+                )
+            lines.append(f"{name} {value:g}")
+        return "\n".join(lines)
+
+
+# The metrics of the bot
+metrics = Metrics()
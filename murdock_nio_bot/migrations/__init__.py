@@ -0,0 +1,40 @@
+"""Migrations of the database schema.
+
+Every migration is a module named `v<version>_<description>` with an
+`upgrade(store)` function, which is passed the `Storage` to migrate. The
+migrations are applied in the order of their versions, each one in a
+transaction of its own together with the update of the version of the
+database.
+"""
+
+import importlib
+import pkgutil
+import re
+from typing import TYPE_CHECKING, Callable, List, Tuple
+
+if TYPE_CHECKING:
+    from murdock_nio_bot.storage import Storage
+
+Migration = Tuple[int, str, Callable[["Storage"], None]]
+
+MODULE_NAME = re.compile(r"v(\d+)_(\w+)")
+
+
+def load_migrations() -> List[Migration]:
+    """Get the (version, description, upgrade function) of all migrations,
+    ordered by version
+    """
+    migrations = []
+    for module_info in pkgutil.iter_modules(__path__):
+        match = MODULE_NAME.fullmatch(module_info.name)
+        if match is None:
+            continue
+        module = importlib.import_module(f"{__name__}.{module_info.name}")
+        migrations.append(
+            (int(match.group(1)), module.__doc__ or match.group(2), module.upgrade)
+        )
+    migrations.sort(key=lambda migration: migration[0])
+    versions = [version for version, _, _ in migrations]
+    if versions != list(range(1, len(versions) + 1)):
+        raise RuntimeError(f"Migration versions are not consecutive: {versions}")
+    return migrations
@@ -0,0 +1,17 @@
+"""The last reported run of every GitHub workflow"""
+
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from murdock_nio_bot.storage import Storage
+
+
+def upgrade(store: "Storage") -> None:
+    store._execute(
+        """
+        CREATE TABLE github_workflow (
+            id INTEGER PRIMARY KEY,
+            last_run_commit VARCHAR(40) DEFAULT NULL
+        )
+    """
+    )
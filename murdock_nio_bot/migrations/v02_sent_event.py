@@ -0,0 +1,19 @@
+"""The events the bot sent, to recognize reactions to them"""
+
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from murdock_nio_bot.storage import Storage
+
+
+def upgrade(store: "Storage") -> None:
+    store._execute(
+        """
+        CREATE TABLE sent_event (
+            event_id VARCHAR(255) PRIMARY KEY,
+            room_id VARCHAR(255) NOT NULL,
+            sent_at BIGINT NOT NULL
+        )
+    """
+    )
+    store._execute("CREATE INDEX sent_event_sent_at ON sent_event (sent_at)")
@@ -0,0 +1,20 @@
+"""The events the bot processed, to not respond to them twice"""
+
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from murdock_nio_bot.storage import Storage
+
+
+def upgrade(store: "Storage") -> None:
+    store._execute(
+        """
+        CREATE TABLE processed_event (
+            event_id VARCHAR(255) PRIMARY KEY,
+            processed_at BIGINT NOT NULL
+        )
+    """
+    )
+    store._execute(
+        "CREATE INDEX processed_event_processed_at ON processed_event (processed_at)"
+    )
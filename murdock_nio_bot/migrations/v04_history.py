@@ -0,0 +1,57 @@
+"""The history of the results of the nightlies and workflow runs"""
+
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from murdock_nio_bot.storage import Storage
+
+
+def upgrade(store: "Storage") -> None:
+    # the primary keys double as the indexes for history queries
+    store._execute(
+        """
+        CREATE TABLE nightly_result (
+            source VARCHAR(255) NOT NULL,
+            branch VARCHAR(255) NOT NULL,
+            ts BIGINT NOT NULL,
+            commit_hash VARCHAR(40) NOT NULL,
+            result VARCHAR(16) NOT NULL,
+            PRIMARY KEY (source, branch, ts)
+        )
+    """
+    )
+    store._execute(
+        """
+        CREATE TABLE workflow_run_result (
+            source VARCHAR(255) NOT NULL,
+            run_id BIGINT NOT NULL,
+            workflow VARCHAR(255) NOT NULL,
+            commit_hash VARCHAR(40) NOT NULL,
+            branch VARCHAR(255),
+            conclusion VARCHAR(32) NOT NULL,
+            ts BIGINT NOT NULL,
+            PRIMARY KEY (source, run_id)
+        )
+    """
+    )
+    store._execute(
+        "CREATE INDEX workflow_run_result_workflow_ts "
+        "ON workflow_run_result (source, workflow, ts)"
+    )
+    store._execute(
+        "CREATE INDEX workflow_run_result_branch_ts "
+        "ON workflow_run_result (source, branch, ts)"
+    )
+    store._execute(
+        """
+        CREATE TABLE result_summary (
+            kind VARCHAR(16) NOT NULL,
+            source VARCHAR(255) NOT NULL,
+            name VARCHAR(255) NOT NULL,
+            period_start BIGINT NOT NULL,
+            runs INTEGER NOT NULL,
+            failures INTEGER NOT NULL,
+            PRIMARY KEY (kind, source, name, period_start)
+        )
+    """
+    )
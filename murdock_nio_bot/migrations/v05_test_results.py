@@ -0,0 +1,37 @@
+"""The results of single test cases"""
+
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from murdock_nio_bot.storage import Storage
+
+
+def upgrade(store: "Storage") -> None:
+    # test cases are referenced by the hash of their name, so the results
+    # can be loaded as plain integer columns
+    store._execute(
+        """
+        CREATE TABLE test_case (
+            id BIGINT PRIMARY KEY,
+            name TEXT NOT NULL
+        )
+    """
+    )
+    store._execute(
+        """
+        CREATE TABLE test_result (
+            source VARCHAR(255) NOT NULL,
+            run_id BIGINT NOT NULL,
+            test_id BIGINT NOT NULL,
+            workflow VARCHAR(255) NOT NULL,
+            failed SMALLINT NOT NULL,
+            ts BIGINT NOT NULL,
+            PRIMARY KEY (source, run_id, test_id)
+        )
+    """
+    )
+    # the results are read ordered by test case and time for analytics
+    store._execute(
+        "CREATE INDEX test_result_workflow_test_ts "
+        "ON test_result (source, workflow, test_id, ts)"
+    )
@@ -0,0 +1,23 @@
+"""The subscriptions of rooms to the branches of sources"""
+
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from murdock_nio_bot.storage import Storage
+
+
+def upgrade(store: "Storage") -> None:
+    store._execute(
+        """
+        CREATE TABLE subscription (
+            room_id VARCHAR(255) NOT NULL,
+            source VARCHAR(255) NOT NULL,
+            branch VARCHAR(255) NOT NULL,
+            PRIMARY KEY (room_id, source, branch)
+        )
+    """
+    )
+    # reports are routed by source and branch
+    store._execute(
+        "CREATE INDEX subscription_source_branch ON subscription (source, branch)"
+    )
@@ -0,0 +1,18 @@
+"""Leases to elect a leader among replicas"""
+
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from murdock_nio_bot.storage import Storage
+
+
+def upgrade(store: "Storage") -> None:
+    store._execute(
+        """
+        CREATE TABLE lease (
+            name VARCHAR(255) PRIMARY KEY,
+            holder VARCHAR(255) NOT NULL,
+            expires_at BIGINT NOT NULL
+        )
+    """
+    )
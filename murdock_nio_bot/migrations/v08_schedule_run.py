@@ -0,0 +1,17 @@
+"""When every schedule last ran"""
+
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from murdock_nio_bot.storage import Storage
+
+
+def upgrade(store: "Storage") -> None:
+    store._execute(
+        """
+        CREATE TABLE schedule_run (
+            name VARCHAR(255) PRIMARY KEY,
+            last_run BIGINT NOT NULL
+        )
+    """
+    )
@@ -0,0 +1,22 @@
+"""The live status messages of the rooms"""
+
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from murdock_nio_bot.storage import Storage
+
+
+def upgrade(store: "Storage") -> None:
+    # The message of every room that is edited with the latest results
+    # of a source, and the keys of the results it shows
+    store._execute(
+        """
+        CREATE TABLE live_status (
+            room_id VARCHAR(255) NOT NULL,
+            source VARCHAR(255) NOT NULL,
+            event_id VARCHAR(255) NOT NULL,
+            results TEXT NOT NULL,
+            PRIMARY KEY (room_id, source)
+        )
+    """
+    )
@@ -0,0 +1,104 @@
+"""Commit hashes as bytes, and indexes for the compaction of the history"""
+
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from murdock_nio_bot.storage import Storage
+
+# The tables with commit hashes, their columns and their columns of commits
+COMMIT_TABLES = {
+    "github_workflow": (
+        """
+        CREATE TABLE {table} (
+            id INTEGER PRIMARY KEY,
+            last_run_commit {binary} DEFAULT NULL
+        )
+        """,
+        ("id", "last_run_commit"),
+        "last_run_commit",
+    ),
+    "nightly_result": (
+        """
+        CREATE TABLE {table} (
+            source VARCHAR(255) NOT NULL,
+            branch VARCHAR(255) NOT NULL,
+            ts BIGINT NOT NULL,
+            commit_hash {binary} NOT NULL,
+            result VARCHAR(16) NOT NULL,
+            PRIMARY KEY (source, branch, ts)
+        )
+        """,
+        ("source", "branch", "ts", "commit_hash", "result"),
+        "commit_hash",
+    ),
+    "workflow_run_result": (
+        """
+        CREATE TABLE {table} (
+            source VARCHAR(255) NOT NULL,
+            run_id BIGINT NOT NULL,
+            workflow VARCHAR(255) NOT NULL,
+            commit_hash {binary} NOT NULL,
+            branch VARCHAR(255),
+            conclusion VARCHAR(32) NOT NULL,
+            ts BIGINT NOT NULL,
+            PRIMARY KEY (source, run_id)
+        )
+        """,
+        (
+            "source",
+            "run_id",
+            "workflow",
+            "commit_hash",
+            "branch",
+            "conclusion",
+            "ts",
+        ),
+        "commit_hash",
+    ),
+}
+
+
+def _rebuild(store: "Storage", table: str) -> None:
+    """Rebuild a table of sqlite, which cannot change the type of a column"""
+    # the migrations are loaded while the storage module is imported
+    from murdock_nio_bot.storage import pack_commit
+
+    create, columns, commit_column = COMMIT_TABLES[table]
+    store._execute(create.format(table=f"{table}_new", binary="BLOB"))
+    store._execute(f"SELECT {', '.join(columns)} FROM {table}")
+    commit_index = columns.index(commit_column)
+    rows = [
+        row[:commit_index] + (pack_commit(row[commit_index]),) + row[commit_index + 1 :]
+        for row in store.cursor.fetchall()
+    ]
+    store._executemany(
+        f"INSERT INTO {table}_new ({', '.join(columns)}) "
+        f"VALUES ({', '.join('?' for _ in columns)})",
+        rows,
+    )
+    store._execute(f"DROP TABLE {table}")
+    store._execute(f"ALTER TABLE {table}_new RENAME TO {table}")
+
+
+def upgrade(store: "Storage") -> None:
+    for table, (_, _, commit_column) in COMMIT_TABLES.items():
+        if store.db_type == "postgres":
+            store._execute(
+                f"ALTER TABLE {table} ALTER COLUMN {commit_column} TYPE BYTEA "
+                f"USING decode({commit_column}, 'hex')"
+            )
+        else:
+            _rebuild(store, table)
+    # the indexes of the rebuilt tables were dropped with them
+    if store.db_type != "postgres":
+        store._execute(
+            "CREATE INDEX workflow_run_result_workflow_ts "
+            "ON workflow_run_result (source, workflow, ts)"
+        )
+        store._execute(
+            "CREATE INDEX workflow_run_result_branch_ts "
+            "ON workflow_run_result (source, branch, ts)"
+        )
+    # the compaction of the history deletes the results before a time
+    for table in ("nightly_result", "workflow_run_result", "test_result"):
+        store._execute(f"CREATE INDEX {table}_ts ON {table} (ts)")
@@ -0,0 +1,50 @@
+"""The results of the test cases packed per workflow run"""
+
+from typing import TYPE_CHECKING, Dict, List, Tuple
+
+if TYPE_CHECKING:
+    from murdock_nio_bot.storage import Storage
+
+
+def upgrade(store: "Storage") -> None:
+    # the migrations are loaded while the storage module is imported
+    from murdock_nio_bot.storage import pack_test_results
+
+    binary = "BYTEA" if store.db_type == "postgres" else "BLOB"
+    # one row per run instead of per test case, so the results of a workflow
+    # load as a few blobs instead of millions of rows
+    store._execute(
+        f"""
+        CREATE TABLE test_run (
+            source VARCHAR(255) NOT NULL,
+            run_id BIGINT NOT NULL,
+            workflow VARCHAR(255) NOT NULL,
+            ts BIGINT NOT NULL,
+            test_ids {binary} NOT NULL,
+            failed {binary} NOT NULL,
+            PRIMARY KEY (source, run_id)
+        )
+    """
+    )
+    store._execute(
+        "CREATE INDEX test_run_workflow_ts ON test_run (source, workflow, ts)"
+    )
+    store._execute("CREATE INDEX test_run_ts ON test_run (ts)")
+    store._execute(
+        "SELECT source, run_id, workflow, ts, test_id, failed FROM test_result "
+        "ORDER BY source, run_id"
+    )
+    runs: Dict[Tuple[str, int, str, int], Tuple[List[int], List[bool]]] = {}
+    for source, run_id, workflow, ts, test_id, failed in store.cursor.fetchall():
+        test_ids, outcomes = runs.setdefault((source, run_id, workflow, ts), ([], []))
+        test_ids.append(test_id)
+        outcomes.append(bool(failed))
+    store._executemany(
+        "INSERT INTO test_run (source, run_id, workflow, ts, test_ids, failed) "
+        "VALUES (?, ?, ?, ?, ?, ?)",
+        [
+            (*run, *pack_test_results(test_ids, outcomes))
+            for run, (test_ids, outcomes) in runs.items()
+        ],
+    )
+    store._execute("DROP TABLE test_result")
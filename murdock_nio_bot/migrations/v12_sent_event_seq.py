@@ -0,0 +1,32 @@
+"""Order the sent events by a sequence instead of their second"""
+
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from murdock_nio_bot.storage import Storage
+
+
+def upgrade(store: "Storage") -> None:
+    # events sent within the same second tied, so pruning kept an arbitrary
+    # subset of them
+    seq = (
+        "BIGSERIAL PRIMARY KEY"
+        if store.db_type == "postgres"
+        else "INTEGER PRIMARY KEY"
+    )
+    store._execute(
+        f"""
+        CREATE TABLE sent_event_seq (
+            seq {seq},
+            event_id VARCHAR(255) NOT NULL UNIQUE,
+            room_id VARCHAR(255) NOT NULL,
+            sent_at BIGINT NOT NULL
+        )
+    """
+    )
+    store._execute(
+        "INSERT INTO sent_event_seq (event_id, room_id, sent_at) "
+        "SELECT event_id, room_id, sent_at FROM sent_event ORDER BY sent_at, event_id"
+    )
+    store._execute("DROP TABLE sent_event")
+    store._execute("ALTER TABLE sent_event_seq RENAME TO sent_event")
@@ -3,14 +3,25 @@ import datetime
 import json
 import logging
 import random
+import tempfile
+import time
+import zipfile
 
 import requests
+from nio import RoomSendResponse
 
-from .chat_functions import send_text_to_room
+from .analytics import analyse_nightlies, analyse_workflow, find_flaky_tests
+from .chat_functions import edit_text_in_room, send_text_to_room
+from .circuit import get_breaker
+from .errors import CircuitOpenError, RateLimitError
+from .github import WorkflowRun, run_html_url
+from .result_page import iter_failed_jobs
+from .storage import ALL_BRANCHES
 
 logger = logging.getLogger(__name__)
 
 DEFAULT_BRANCH = "master"
+MAX_FAILED_JOBS = 10
 
 
 class Nightlies:
@@ -26,10 +37,23 @@ class Nightlies:
 
     def get_nightlies(self):
         """
-        Get current list of nightlies
+        Get current list of nightlies. While the circuit breaker of the source
+        is open, the last fetched list is returned instead.
         """
+        breaker = get_breaker(
+            self.config.name,
+            self.config.breaker_failure_threshold,
+            self.config.breaker_reset_timeout,
+        )
+        try:
+            return breaker.call(("nightlies", self.branch), self._fetch_nightlies)
+        except CircuitOpenError as exc:
+            logger.warning("Skipping nightlies of %s: %s", self.branch, exc)
+            return []
+
+    def _fetch_nightlies(self):
         nightlies_url = self.config.nightlies_url.format(branch=self.branch)
-        request = requests.get(nightlies_url)
+        request = requests.get(nightlies_url, timeout=self.config.nightlies_timeout)
         if request.status_code != 200:
             logger.error(
                 "Unable to GET %s\n%d %s",
@@ -44,14 +68,17 @@ class Nightlies:
             logger.error("Unable to decode: %s\n%s", exc, request.text)
             return []
 
-    def check_if_last_errored_or_changed_to_passed(self):
+    def check_if_last_errored_or_changed_to_passed(self, results=None):
         """
         Returns the latest nightly result of self.branch when it errored or
         changed from errored to passed compared to the nightly before. Returns
         ``None`` if both conditions do not apply or the two previous builds
         have the same commit hash.
+
+        :param results: The nightlies, if they were already fetched.
         """
-        results = self.get_nightlies()
+        if results is None:
+            results = self.get_nightlies()
         if len(results) > 0:
             if len(results) > 1 and results[0]["commit"] == results[1]["commit"]:
                 # do not double report already reported commits
@@ -69,6 +96,66 @@ class Nightlies:
                 return result
         return None
 
+    def fetch_failed_jobs(self, result, cache=None):
+        """
+        Finds the failed jobs on the result page of an errored nightly and
+        stores them in ``result["failed_jobs"]`` and their number in
+        ``result["failed_jobs_count"]``. The page is streamed to a file, bounded
+        by ``config.result_max_size`` bytes and ``config.result_timeout``
+        seconds, and parsed incrementally.
+
+        :param result: An errored nightly result, as returned by
+            `check_if_last_errored_or_changed_to_passed()`.
+        :param cache: A `FileCache` to keep the page in. As the result of a
+            commit does not change, it is only fetched once per commit.
+        """
+
+        def download(fileobj):
+            _download_result_page(
+                result["url"],
+                fileobj,
+                self.config.result_max_size,
+                self.config.result_timeout,
+            )
+
+        if cache is None:
+            html_file = tempfile.TemporaryFile()
+            download(html_file)
+            html_file.seek(0)
+        else:
+            html_file = cache.fetch(
+                "result/{}/{}/{}".format(
+                    self.config.name, self.branch, result["commit"]
+                ),
+                download,
+            )
+        failed_jobs = []
+        failed_jobs_count = 0
+        with html_file:
+            for job in iter_failed_jobs(html_file):
+                failed_jobs_count += 1
+                if len(failed_jobs) < MAX_FAILED_JOBS:
+                    failed_jobs.append(job)
+        result["failed_jobs"] = failed_jobs
+        result["failed_jobs_count"] = failed_jobs_count
+
+
+def _download_result_page(url, fileobj, max_size, timeout):
+    deadline = time.monotonic() + timeout
+    with requests.get(url, stream=True, timeout=timeout) as response:
+        response.raise_for_status()
+        size = 0
+        for chunk in response.iter_content(chunk_size=64 * 1024):
+            if size + len(chunk) > max_size:
+                fileobj.write(chunk[: max_size - size])
+                logger.warning("Truncated %s to %d bytes", url, max_size)
+                return
+            fileobj.write(chunk)
+            size += len(chunk)
+            if time.monotonic() > deadline:
+                # do not cache a page that was cut short by a slow server
+                raise requests.Timeout(f"Fetching {url} took longer than {timeout}s")
+
 
 def commit_markdown_link(config, commit):
     """
@@ -78,16 +165,28 @@ def commit_markdown_link(config, commit):
     return f"[{commit[:10]}]({commit_url})"
 
 
-def generate_message(config, greeting, nightlies, workflow_runs=None):
+def generate_message(
+    config,
+    greeting,
+    nightlies,
+    workflow_runs=None,
+    source_name=None,
+    flaky_tests=None,
+):
     """
     Generates a message from nightlies results
+
+    :param source_name: The name of the source to mention in the message, if
+        the bot reports more than one.
+    :param flaky_tests: The `FlakyTest`s to list in the message.
     """
     if workflow_runs is None:
         workflow_runs = []
+    nightlies_name = f"`{source_name}` nightlies" if source_name else "nightlies"
     if workflow_runs:
-        msg = f"{greeting} Here is my morning report for the nightlies and GitHub workflows:\n\n"
+        msg = f"{greeting} Here is my morning report for the {nightlies_name} and GitHub workflows:\n\n"
     else:
-        msg = f"{greeting} Here is my morning report for the nightlies:\n\n"
+        msg = f"{greeting} Here is my morning report for the {nightlies_name}:\n\n"
 
     for branch, result in [
         (b, r) for b, r in nightlies if r and r["result"] == "passed"
@@ -110,6 +209,14 @@ def generate_message(config, greeting, nightlies, workflow_runs=None):
     ]:
         commit_link = commit_markdown_link(config, result["commit"])
         msg += f'- [`{branch}` nightlies errored]({result["url"]}) on {commit_link}\n'
+        failed_jobs = result.get("failed_jobs") or []
+        for job in failed_jobs:
+            msg += f"    - `{job.application}` on `{job.board}` failed ({job.kind})\n"
+        if result.get("failed_jobs_count", 0) > len(failed_jobs):
+            msg += (
+                f'    - ... and {result["failed_jobs_count"] - len(failed_jobs)} '
+                "more failed jobs\n"
+            )
     for workflow, result in [
         (w, r) for w, r in workflow_runs if r and r.conclusion == "failure"
     ]:
@@ -117,45 +224,543 @@ def generate_message(config, greeting, nightlies, workflow_runs=None):
         msg += (
             f"- [`{workflow}` workflow errored]({result.html_url}) on {commit_link}\n"
         )
+        for testcase in result.failed_tests or []:
+            msg += f"    - `{testcase}` failed\n"
+        if result.failed_tests_count > len(result.failed_tests or []):
+            msg += (
+                f"    - ... and {result.failed_tests_count - len(result.failed_tests)} "
+                "more failing test cases\n"
+            )
+    if flaky_tests:
+        msg += "\nFlaky test cases:\n\n" + format_flaky_tests(flaky_tests)
+    return msg
+
+
+def generate_status_message(
+    config,
+    greeting,
+    nightlies,
+    workflow_runs=None,
+    source_name=None,
+    flaky_tests=None,
+):
+    """
+    Generates a message with the latest results of nightlies and workflows,
+    whether they changed or not, as returned by `last_results`
+
+    :param source_name: The name of the source to mention in the message, if
+        the bot reports more than one.
+    :param flaky_tests: The `FlakyTest`s to list in the message.
+    """
+    if workflow_runs is None:
+        workflow_runs = []
+    nightlies_name = f"`{source_name}` nightlies" if source_name else "nightlies"
+    if workflow_runs:
+        msg = f"{greeting} Here is the current status of the {nightlies_name} and GitHub workflows:\n\n"
+    else:
+        msg = f"{greeting} Here is the current status of the {nightlies_name}:\n\n"
+    for branch, result in nightlies:
+        commit_link = commit_markdown_link(config, result["commit"])
+        msg += (
+            f'- [`{branch}` nightlies {result["result"]}]({result["url"]}) '
+            f"on {commit_link}\n"
+        )
+    for workflow, result in workflow_runs:
+        commit_link = commit_markdown_link(config, result.commit)
+        outcome = {"success": "passed", "failure": "errored"}.get(
+            result.conclusion, result.conclusion
+        )
+        msg += (
+            f"- [`{workflow}` workflow {outcome}]({result.html_url}) "
+            f"on {commit_link}\n"
+        )
+    if flaky_tests:
+        msg += "\nFlaky test cases:\n\n" + format_flaky_tests(flaky_tests)
+    return msg
+
+
+def last_results(source, store):
+    """
+    Reads the latest recorded results of the nightlies and workflows of a
+    source from the history, so they survive restarts.
+
+    :returns: The results as lists of (branch, result) and (workflow name,
+        result) pairs, for the branches and workflows with a recorded result.
+    """
+    nightlies = []
+    for branch in source.nightlies_branches:
+        last = store.get_last_nightly_result(source.name, branch)
+        if last is None:
+            continue
+        ts, commit, result = last
+        nightlies.append(
+            (
+                branch,
+                {
+                    "commit": commit,
+                    "result": result,
+                    "since": datetime.datetime.utcfromtimestamp(ts),
+                    "url": source.result_url.format(commit=commit, branch=branch),
+                },
+            )
+        )
+    workflow_runs = []
+    for workflow in source.github_workflows:
+        last = store.get_last_workflow_run_result(source.name, workflow["name"])
+        if last is None:
+            continue
+        _, run_id, commit, branch, conclusion = last
+        workflow_runs.append(
+            (
+                workflow["name"],
+                WorkflowRun(
+                    source,
+                    run_id,
+                    commit,
+                    conclusion,
+                    run_html_url(source, run_id),
+                    head_branch=branch,
+                ),
+            )
+        )
+    return nightlies, workflow_runs
+
+
+def format_flaky_tests(flaky_tests):
+    """
+    Formats `FlakyTest`s as a markdown list
+    """
+    return "".join(
+        f"- `{test.name}` of `{test.workflow}` flipped {test.flips} times in "
+        f"{test.runs} runs ({test.failures} failed)\n"
+        for test in flaky_tests
+    )
+
+
+async def flaky_tests_of_source(source, store):
+    """
+    Finds the flakiest test cases of the workflows of a source, whose JUnit XML
+    reports are analysed, within ``source.analytics_window``.
+    """
+    return await find_flaky_tests(
+        store,
+        source.name,
+        [w["name"] for w in source.github_workflows if w["report_xml"]],
+        since=int(time.time()) - source.analytics_window,
+        limit=source.max_flaky_tests,
+    )
+
+
+async def generate_statistics_message(source, store, source_name=None):
+    """
+    Generates a message with the failure statistics of the nightlies and
+    workflows of a source and their flakiest test cases
+
+    :param source_name: The name of the source to mention in the message, if
+        the bot reports more than one.
+    """
+    since = int(time.time()) - source.analytics_window
+    days = source.analytics_window // (24 * 60 * 60)
+    of_source = f" of `{source_name}`" if source_name else ""
+    msg = f"Failure statistics{of_source} of the last {days} days:\n\n"
+    analyses = [
+        (
+            f"`{branch}` nightlies",
+            await analyse_nightlies(store, source.name, branch, since),
+        )
+        for branch in source.nightlies_branches
+    ] + [
+        (
+            f"`{w['name']}` workflow",
+            await analyse_workflow(store, source.name, w["name"], since),
+        )
+        for w in source.github_workflows
+    ]
+    for name, analysis in analyses:
+        if len(analysis.keys) == 0:
+            msg += f"- {name}: no results recorded\n"
+            continue
+        msg += (
+            f"- {name}: {analysis.failures[0]} of {analysis.runs[0]} runs failed, "
+            f"changed {analysis.flips[0]} times, longest failure streak "
+            f"{analysis.longest_streak[0]}"
+        )
+        if analysis.current_streak[0]:
+            msg += f", failing for the last {analysis.current_streak[0]} runs"
+        msg += "\n"
+    flaky_tests = await flaky_tests_of_source(source, store)
+    if flaky_tests:
+        msg += "\nFlaky test cases:\n\n" + format_flaky_tests(flaky_tests)
     return msg
 
 
-async def report_last_nightlies(config, client, workflows=None):
+async def check_last_nightlies(source, workflows=None, cache=None, store=None):
     """
-    Reports last nightlies to all rooms the bot is in
+    Checks the nightlies and workflows of a source. The results are fetched
+    concurrently in the default executor, so the event loop is not blocked.
+
+    :param cache: A `FileCache` for downloads needed for the analysis of the
+        results.
+    :param store: A `Storage` to record all fetched results in as history.
+
+    :returns: The results of the nightlies and the workflows as lists of
+        (branch, result) and (workflow name, result) pairs.
     """
-    nightlies = [
-        (branch, Nightlies(config, branch).check_if_last_errored_or_changed_to_passed())
-        for branch in config.nightlies_branches
+    loop = asyncio.get_event_loop()
+    nightlies = [Nightlies(source, branch) for branch in source.nightlies_branches]
+    # request critical workflows first, so they get the GitHub rate limit budget
+    # should it run low
+    workflows = sorted(workflows or [], key=lambda w: not w.critical)
+    fetched = await asyncio.gather(
+        *(loop.run_in_executor(None, n.get_nightlies) for n in nightlies),
+        *(loop.run_in_executor(None, w.fetch_scheduled_runs) for w in workflows),
+    )
+    if store is not None:
+        # record before checking, the check converts the timestamp of a result
+        record_history(
+            store,
+            source,
+            nightlies,
+            workflows,
+            fetched[: len(nightlies)],
+            fetched[len(nightlies) :],
+        )
+    nightly_results = [
+        (n.branch, n.check_if_last_errored_or_changed_to_passed(results))
+        for n, results in zip(nightlies, fetched)
     ]
-    workflow_runs = [
-        (workflow.name, workflow.check_if_last_errored_or_changed_to_passed())
-        for workflow in workflows or []
+    workflow_results = [
+        (
+            w.name,
+            (
+                None
+                if runs is None
+                else w.check_if_last_errored_or_changed_to_passed(runs)
+            ),
+        )
+        for w, runs in zip(workflows, fetched[len(nightlies) :])
     ]
+    analysed_runs = []
+    for w, (_, run), runs in zip(
+        workflows, workflow_results, fetched[len(nightlies) :]
+    ):
+        if not w.report_xml:
+            continue
+        if run and run.conclusion == "failure":
+            analysed_runs.append((w, run, w.critical))
+        elif (
+            store is not None
+            and runs
+            and runs[0].timestamp is not None
+            and not store.has_test_results(source.name, runs[0].id)
+        ):
+            # only for the history, so it must not use the reserved budget
+            analysed_runs.append((w, runs[0], False))
+    await asyncio.gather(
+        *(
+            _fetch_failed_jobs(n, result, cache)
+            for n, (_, result) in zip(nightlies, nightly_results)
+            if result and result["result"] == "errored"
+        ),
+        *(
+            _fetch_failed_tests(w, run, critical, cache)
+            for w, run, critical in analysed_runs
+        ),
+    )
+    if store is not None:
+        for w, run, _ in analysed_runs:
+            if run.timestamp is not None and run.test_outcomes is not None:
+                store.add_test_run(
+                    source.name, w.name, run.id, run.timestamp, run.test_outcomes
+                )
+    return nightly_results, workflow_results
+
+
+def record_history(store, source, nightlies, workflows, nightly_results, runs):
+    """
+    Records the fetched results of a source in the history, with one batch for
+    all nightlies and one for all workflow runs.
+
+    :param nightly_results: The fetched results for each of ``nightlies``.
+    :param runs: The fetched runs for each of ``workflows``, ``None`` if
+        fetching them was deferred.
+    """
+    store.add_nightly_results(
+        (source.name, n.branch, r["commit"], r["result"], int(r["since"]))
+        for n, results in zip(nightlies, nightly_results)
+        for r in results
+        if r.get("result") in ("passed", "errored")
+    )
+    store.add_workflow_run_results(
+        (source.name, w.name, r.id, r.commit, r.branch, r.conclusion, r.timestamp)
+        for w, workflow_runs in zip(workflows, runs)
+        for r in workflow_runs or []
+        if r.timestamp is not None
+    )
+
+
+async def _fetch_failed_jobs(nightlies, result, cache):
+    loop = asyncio.get_event_loop()
+    try:
+        await loop.run_in_executor(None, nightlies.fetch_failed_jobs, result, cache)
+    except (requests.RequestException, OSError) as exc:
+        # report the nightly anyway, it is not reported again
+        logger.error("Unable to analyse result page %s: %s", result["url"], exc)
+
+
+async def _fetch_failed_tests(workflow, run, critical, cache):
+    loop = asyncio.get_event_loop()
+    try:
+        await loop.run_in_executor(None, run.fetch_failed_tests, critical, cache)
+    except (
+        requests.RequestException,
+        RateLimitError,
+        OSError,
+        zipfile.BadZipFile,
+    ) as exc:
+        # report the run anyway, it is not reported again
+        logger.error("Unable to analyse test results of %s: %s", workflow, exc)
+
+
+def route_report(
+    store, source, room_ids, nightlies, workflow_runs, broadcast_unsubscribed=True
+):
+    """
+    Finds out which rooms get which results of a report. Rooms subscribed to
+    the source get the results of the branches they subscribed to; the
+    branch of a workflow run is the branch it ran on. Workflow runs without a
+    branch only go to rooms subscribed to all branches. Rooms without any
+    subscription to the source get all results, if ``broadcast_unsubscribed``.
+
+    :param room_ids: The rooms the bot is in.
+    :param nightlies: The (branch, result) pairs to report.
+    :param workflow_runs: The (workflow name, run) pairs to report.
+
+    :returns: A list of (nightlies, workflow_runs, room_ids) with the results
+        to send to the rooms, one for each distinct selection of results, so
+        every distinct message only needs to be rendered once.
+    """
+    nightlies = [(b, r) for b, r in nightlies if r]
+    workflow_runs = [(w, r) for w, r in workflow_runs if r]
+    everything = (tuple(range(len(nightlies))), tuple(range(len(workflow_runs))))
+    if store is None:
+        routes = {everything: list(room_ids)}
+    else:
+        # subscriptions to all branches are expanded to ALL_BRANCHES as well,
+        # which stands for the runs without a branch
+        branches = {b for b, _ in nightlies} | {
+            r.branch or ALL_BRANCHES for _, r in workflow_runs
+        }
+        subscribers = store.get_subscribers(source.name, branches)
+        subscribed_rooms = store.get_subscribed_rooms(source.name)
+        routes = {}
+        for room_id in room_ids:
+            if room_id in subscribers:
+                room_branches = subscribers[room_id]
+                selection = (
+                    tuple(
+                        i for i, (b, _) in enumerate(nightlies) if b in room_branches
+                    ),
+                    tuple(
+                        i
+                        for i, (_, r) in enumerate(workflow_runs)
+                        if (r.branch or ALL_BRANCHES) in room_branches
+                    ),
+                )
+            elif broadcast_unsubscribed and room_id not in subscribed_rooms:
+                selection = everything
+            else:
+                continue
+            routes.setdefault(selection, []).append(room_id)
+    return [
+        (
+            [nightlies[i] for i in nightly_indices],
+            [workflow_runs[i] for i in workflow_indices],
+            rooms,
+        )
+        for (nightly_indices, workflow_indices), rooms in routes.items()
+        if rooms and (nightly_indices or workflow_indices)
+    ]
+
+
+def report_keys(nightlies, workflow_runs):
+    """
+    Identifies the results of a report, to tell which of them a live status
+    message already shows.
+
+    :param nightlies: The (branch, result) pairs of the report.
+    :param workflow_runs: The (workflow name, run) pairs of the report.
+
+    :returns: The keys of all results and the keys of the failures among them.
+    """
+    results = set()
+    failures = set()
+    for branch, result in nightlies:
+        key = f'nightlies/{branch}/{result["commit"]}/{result["result"]}'
+        results.add(key)
+        if result["result"] == "errored":
+            failures.add(key)
+    for workflow, run in workflow_runs:
+        key = f"workflow/{workflow}/{run.id}/{run.conclusion}"
+        results.add(key)
+        if run.conclusion == "failure":
+            failures.add(key)
+    return results, failures
+
+
+async def send_live_status(client, store, source, room_id, msg, results, failures):
+    """
+    Updates the live status message of a source in a room. The message is
+    edited, unless it already shows all ``results``. A new message, which is
+    the live status message from then on, is only sent for failures the
+    message does not show, or if the room has no live status message yet.
+
+    :param results: The keys of all results of the report.
+    :param failures: The keys of the failures among them.
+    """
+    status = store.get_live_status(room_id, source.name)
+    if status is not None:
+        event_id, shown = status
+        if results <= shown:
+            logger.debug("Live status of %s in %s is up to date", source, room_id)
+            return
+        if failures <= shown:
+            response = await edit_text_in_room(client, room_id, event_id, msg)
+            if isinstance(response, RoomSendResponse):
+                store.set_live_status(room_id, source.name, event_id, results)
+                return
+            # e.g. the message was redacted, so post a new one
+            logger.warning(
+                "Unable to edit live status of %s in %s: %s", source, room_id, response
+            )
+    response = await send_text_to_room(client, room_id, msg, markdown_convert=True)
+    if isinstance(response, RoomSendResponse):
+        store.set_live_status(room_id, source.name, response.event_id, results)
+
+
+async def render_reports(
+    source,
+    store,
+    room_ids,
+    nightlies,
+    workflow_runs,
+    greeting,
+    show_source=False,
+    broadcast_unsubscribed=True,
+    status=False,
+):
+    """
+    Renders the messages of a report for the rooms that get it.
+
+    :param room_ids: The rooms that may get the report.
+    :param greeting: The greeting to start the messages with.
+    :param show_source: Whether to mention the name of the source.
+    :param broadcast_unsubscribed: Whether rooms without any subscription to
+        the source get the report.
+    :param status: Whether the results are the latest ones of `last_results`
+        instead of the changes found by `check_last_nightlies`.
+
+    :returns: A list of (message, nightlies, workflow_runs, room_ids), one for
+        every distinct message.
+    """
+    flaky_tests = []
+    if store is not None:
+        flaky_tests = await flaky_tests_of_source(source, store)
+    reports = []
+    routes = route_report(
+        store, source, room_ids, nightlies, workflow_runs, broadcast_unsubscribed
+    )
+    for room_nightlies, room_workflow_runs, route_room_ids in routes:
+        reported_workflows = {w for w, _ in room_workflow_runs}
+        msg = (generate_status_message if status else generate_message)(
+            source,
+            greeting,
+            room_nightlies,
+            room_workflow_runs,
+            source_name=source.name if show_source else None,
+            flaky_tests=[t for t in flaky_tests if t.workflow in reported_workflows],
+        )
+        reports.append((msg, room_nightlies, room_workflow_runs, route_room_ids))
+    return reports
+
+
+async def report_last_nightlies(
+    source,
+    client,
+    workflows=None,
+    show_source=False,
+    cache=None,
+    store=None,
+    broadcast_unsubscribed=True,
+    live_status=False,
+):
+    """
+    Reports last nightlies of a source to the rooms subscribed to them, or to
+    all rooms the bot is in, if there is no ``store`` to look up subscriptions
+
+    :param show_source: Whether to mention the name of the source in the report.
+    :param cache: A `FileCache` for downloads needed for the analysis of the
+        results.
+    :param store: A `Storage` to record all fetched results in as history and
+        to look up the subscriptions of rooms.
+    :param broadcast_unsubscribed: Whether to also send the report to rooms
+        without any subscription to the source.
+    :param live_status: Whether to edit the live status message of every room
+        instead of sending the report, unless there are new failures. Requires
+        ``store``.
+
+    :returns: The reported results as lists of (branch, result) and (workflow
+        name, result) pairs, ``None`` if there was nothing to report.
+    """
+    nightlies, workflow_runs = await check_last_nightlies(
+        source, workflows, cache, store
+    )
     if all(result is None for _, result in nightlies) and all(
         result is None for _, result in workflow_runs
     ):
         logger.info(
-            "Nothing to report for branches %s or workflows %s",
-            ",".join(config.nightlies_branches),
-            ",".join(w.name for w in workflows),
-        )
-        return
-    msg = generate_message(
-        config,
-        random.choice(("Hello", "Greetings", "Good Morning"))
-        + random.choice((" RIOTers!", " fellow humans!", "!")),
+            "Nothing to report for %s branches %s or workflows %s",
+            source,
+            ",".join(source.nightlies_branches),
+            ",".join(w.name for w in workflows or []),
+        )
+        return None
+    greeting = random.choice(("Hello", "Greetings", "Good Morning")) + random.choice(
+        (" RIOTers!", " fellow humans!", "!")
+    )
+    tasks = []
+    reports = await render_reports(
+        source,
+        store,
+        client.rooms,
         nightlies,
         workflow_runs,
+        greeting,
+        show_source,
+        broadcast_unsubscribed,
     )
-    tasks = []
-    for room_id in client.rooms:
-        tasks.append(
-            asyncio.create_task(
-                send_text_to_room(client, room_id, msg, markdown_convert=True)
+    for msg, room_nightlies, room_workflow_runs, room_ids in reports:
+        if live_status and store is not None:
+            results, failures = report_keys(room_nightlies, room_workflow_runs)
+            tasks.extend(
+                asyncio.create_task(
+                    send_live_status(
+                        client, store, source, room_id, msg, results, failures
+                    )
+                )
+                for room_id in room_ids
+            )
+            continue
+        for room_id in room_ids:
+            tasks.append(
+                asyncio.create_task(
+                    send_text_to_room(client, room_id, msg, markdown_convert=True)
+                )
             )
-        )
     if tasks:
         await asyncio.wait(tasks)
+    elif client.rooms:
+        logger.info("No room is subscribed to the changes of %s", source)
     else:
         logger.warning("I am in no rooms")
+    return nightlies, workflow_runs
@@ -0,0 +1,57 @@
+import asyncio
+import concurrent.futures
+import functools
+import logging
+from typing import Any, Callable, Optional, TypeVar
+
+from murdock_nio_bot.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Inputs smaller than this many bytes are processed on the event loop, as
+# handing them to a pool takes longer than processing them
+threshold = 64 * 1024
+_process_pool: Optional[concurrent.futures.ProcessPoolExecutor] = None
+
+
+def configure(offload_threshold: int, processes: int = 0) -> None:
+    """Configure when and where to offload CPU-bound work
+
+    Args:
+        offload_threshold: The size in bytes from which on inputs are processed
+            in a pool instead of on the event loop.
+
+        processes: How many processes to offload to. With 0, work is offloaded
+            to the default executor of the loop, a thread pool. Processes
+            are not held up by the GIL, but the functions and their arguments
+            must be picklable.
+    """
+    global threshold, _process_pool
+    threshold = offload_threshold
+    if _process_pool is not None:
+        _process_pool.shutdown(wait=False)
+        _process_pool = None
+    if processes > 0:
+        _process_pool = concurrent.futures.ProcessPoolExecutor(processes)
+
+
+async def offload(func: Callable[..., T], *args: Any, size: int = 0) -> T:
+    """Call a CPU-bound function without blocking the event loop, if its input
+    is large
+
+    Args:
+        func: The function to call.
+
+        size: The size of the input in bytes, e.g. the length of a text to
+            parse.
+
+    Returns:
+        The result of `func`.
+    """
+    if size < threshold:
+        return func(*args)
+    metrics.inc("offloaded_calls_total", function=func.__name__)
+    loop = asyncio.get_event_loop()
+    return await loop.run_in_executor(_process_pool, functools.partial(func, *args))
@@ -0,0 +1,215 @@
+import asyncio
+import cProfile
+import functools
+import logging
+import os
+import signal
+import sys
+import threading
+import time
+import traceback
+from typing import Optional
+
+from murdock_nio_bot.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+def timed_callback(func):
+    """Decorator for `Callbacks` methods that logs handlers which take longer than
+    `config.slow_callback_threshold` seconds.
+
+    The wrapped method must take the room and the event as its first two
+    arguments, as all nio event callbacks do.
+    """
+
+    @functools.wraps(func)
+    async def wrapper(self, room, event, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return await func(self, room, event, *args, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - start
+            if elapsed > self.config.slow_callback_threshold:
+                logger.warning(
+                    "Slow callback %s took %.3fs in room %s (event %s)",
+                    func.__name__,
+                    elapsed,
+                    room.room_id,
+                    getattr(event, "event_id", None),
+                )
+
+    return wrapper
+
+
+class Profiler:
+    """Toggles a profiling session and dumps its statistics to a file
+
+    Args:
+        output_dir: The directory to dump the profiles to.
+
+        backend: Either "cprofile" or "yappi". yappi also profiles the time
+            coroutines spend waiting, but needs to be installed separately.
+    """
+
+    def __init__(self, output_dir: str, backend: str = "cprofile"):
+        self.output_dir = output_dir
+        self.backend = backend
+        self._profile = None
+
+    @property
+    def running(self) -> bool:
+        return self._profile is not None
+
+    def start(self) -> None:
+        """Start a new profiling session"""
+        if self.running:
+            return
+        if self.backend == "yappi":
+            import yappi
+
+            yappi.set_clock_type("wall")
+            yappi.start()
+            self._profile = yappi
+        else:
+            self._profile = cProfile.Profile()
+            self._profile.enable()
+        logger.info("Started %s profiling session", self.backend)
+
+    def stop(self) -> Optional[str]:
+        """Stop the current profiling session and dump it in pstats format
+
+        Returns:
+            The path of the dumped profile or None if no session was running.
+        """
+        if not self.running:
+            return None
+        filepath = os.path.join(
+            self.output_dir,
+            "profile-{}.pstats".format(time.strftime("%Y%m%d-%H%M%S")),
+        )
+        if self.backend == "yappi":
+            self._profile.stop()
+            self._profile.get_func_stats().save(filepath, type="pstat")
+            self._profile.clear_stats()
+        else:
+            self._profile.disable()
+            self._profile.dump_stats(filepath)
+        self._profile = None
+        logger.info("Dumped profile to %s", filepath)
+        return filepath
+
+    def toggle(self) -> None:
+        """Start a profiling session or stop and dump the running one"""
+        if self.running:
+            self.stop()
+        else:
+            self.start()
+
+    def install(self, loop, signame: str = "SIGUSR1") -> None:
+        """Toggle profiling whenever the process receives the given signal
+
+        Args:
+            loop: The event loop to install the signal handler to.
+
+            signame: The name of the signal, e.g. "SIGUSR1".
+        """
+        loop.add_signal_handler(getattr(signal, signame), self.toggle)
+        logger.info("Send %s to toggle profiling (pid %d)", signame, os.getpid())
+
+
+class LoopLagMonitor:
+    """Measures how late the event loop wakes up a sleeping task, and logs the
+    stack of the event loop thread while it is blocked for longer than
+    `threshold` seconds.
+
+    The lag is exposed as the `event_loop_lag_seconds` gauge, the worst lag
+    as `event_loop_lag_max_seconds` and the number of stalls as
+    `event_loop_stalls_total`.
+
+    Args:
+        threshold: After how many seconds of lag to log the stack.
+
+        interval: How often to measure the lag, in seconds.
+    """
+
+    def __init__(self, threshold: float = 0.25, interval: float = 0.1):
+        self.threshold = threshold
+        self.interval = interval
+        self.max_lag = 0.0
+        self._heartbeat = time.monotonic()
+        self._loop_thread: Optional[int] = None
+        self._task: Optional[asyncio.Future] = None
+        self._stopped = threading.Event()
+        self._watchdog: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        """Start measuring the lag of the running event loop"""
+        if self._task is not None:
+            return
+        self._loop_thread = threading.get_ident()
+        self._heartbeat = time.monotonic()
+        self._stopped.clear()
+        self._task = asyncio.ensure_future(self._measure())
+        # the watchdog runs in a thread of its own, so it can look at the
+        # stack while the loop is blocked
+        self._watchdog = threading.Thread(
+            target=self._watch, name="loop-lag-watchdog", daemon=True
+        )
+        self._watchdog.start()
+
+    def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        self._task = None
+        self._stopped.set()
+        self._watchdog.join()
+
+    async def _measure(self) -> None:
+        while True:
+            start = time.monotonic()
+            await asyncio.sleep(self.interval)
+            self._heartbeat = time.monotonic()
+            lag = max(self._heartbeat - start - self.interval, 0)
+            metrics.set("event_loop_lag_seconds", round(lag, 4))
+            if lag > self.max_lag:
+                self.max_lag = lag
+                metrics.set("event_loop_lag_max_seconds", round(lag, 4))
+            if lag > self.threshold:
+                metrics.inc("event_loop_stalls_total")
+                logger.warning("Event loop lagged %.3fs behind", lag)
+
+    def _watch(self) -> None:
+        reported = False
+        while not self._stopped.wait(self.interval):
+            blocked = time.monotonic() - self._heartbeat - self.interval
+            if blocked <= self.threshold:
+                reported = False
+            elif not reported:
+                # only the first snapshot of a stall, it shows what blocks
+                reported = True
+                frame = sys._current_frames().get(self._loop_thread)
+                if frame is None:
+                    continue
+                logger.warning(
+                    "Event loop blocked for %.3fs, at:\n%s",
+                    blocked,
+                    "".join(traceback.format_stack(frame)),
+                )
+
+
+def install_uvloop() -> bool:
+    """Use uvloop for the event loops created from now on, if it is installed
+
+    Returns:
+        Whether uvloop is used.
+    """
+    try:
+        import uvloop
+    except ImportError:
+        logger.warning("uvloop is not installed, using the default event loop")
+        return False
+    asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+    logger.info("Using uvloop")
+    return True
@@ -0,0 +1,267 @@
+import logging
+from typing import Callable, Dict, List, Optional
+
+import yaml
+from nio import AsyncClient
+
+from murdock_nio_bot.cache import FileCache
+from murdock_nio_bot.config import Config, Source
+from murdock_nio_bot.errors import ConfigError
+from murdock_nio_bot.leader import LeaderElector
+from murdock_nio_bot.schedule import Scheduler
+from murdock_nio_bot.storage import Storage
+from murdock_nio_bot.worker import SourceWorker
+
+logger = logging.getLogger(__name__)
+
+# The name of the schedule compacting the history
+COMPACT_SCHEDULE = "compact_history"
+# Options that change the schedules of all sources
+SCHEDULE_OPTIONS = ("prewarm_lead", "schedule_jitter", "catch_up")
+# Options that are only applied on a restart, as they concern the session with
+# the homeserver or the storage
+RESTART_OPTIONS = (
+    "user_id",
+    "user_password",
+    "user_token",
+    "device_id",
+    "device_name",
+    "homeserver_url",
+    "store_path",
+    "database",
+    "ha_enabled",
+    "ha_instance_id",
+    "command_workers",
+    "join_concurrency",
+    "join_send_report",
+    "uvloop",
+    "offload_threshold",
+    "offload_processes",
+    "loop_lag_threshold",
+    "sent_events_size",
+    "persist_sent_events",
+    "processed_events_capacity",
+    "profile_signal",
+    "profiler_backend",
+)
+
+
+class ConfigReloader:
+    """Schedules the workers of the sources and applies changes of the config
+    while the bot keeps running. The group sessions of the rooms a source
+    reports to are pre-warmed `config.prewarm_lead` seconds before every check.
+
+    On a reload, only the workers of sources whose options changed are rebuilt,
+    and only the schedules whose crontab changed are rescheduled. The client
+    session, the caches and the outbound messages are left alone.
+
+    Args:
+        config: The running config.
+
+        client: The client to report with.
+
+        store: Bot storage.
+
+        cache: A `FileCache` for downloads needed for the analysis of results.
+
+        leader: If given, sources are only checked while this replica is the
+            leader.
+
+        listeners: Functions called with the new config on a reload, e.g.
+            `Callbacks.set_config`.
+
+        scheduler: The scheduler to run the checks with. Defaults to one
+            keeping the last runs in `store`.
+    """
+
+    def __init__(
+        self,
+        config: Config,
+        client: AsyncClient,
+        store: Storage,
+        cache: Optional[FileCache] = None,
+        leader: Optional[LeaderElector] = None,
+        listeners: Optional[List[Callable[[Config], None]]] = None,
+        scheduler: Optional[Scheduler] = None,
+    ):
+        self.config = config
+        self.client = client
+        self.store = store
+        self.cache = cache
+        self.leader = leader
+        self.listeners = listeners or []
+        self.scheduler = scheduler or Scheduler(store)
+        self.workers: Dict[str, SourceWorker] = {}
+        # the names of the schedules of every source
+        self.schedules: Dict[str, List[str]] = {}
+
+    def start(self) -> None:
+        """Schedule the workers of all sources and the compaction of the history
+        and the processed events
+        """
+        self._schedule_compaction()
+        for source in self.config.sources:
+            self._add_worker(source)
+
+    def _schedule_compaction(self) -> None:
+        self.scheduler.add(
+            COMPACT_SCHEDULE,
+            self.config.history_compact_crontab,
+            self._compact_history,
+            catch_up=False,
+        )
+
+    def _compact_history(self) -> None:
+        # every replica has its own filter of the processed events
+        self.store.prune_processed_events()
+        if self.leader is None or self.leader.is_leader:
+            self.store.compact_history()
+
+    def _make_worker(self, source: Source) -> SourceWorker:
+        return SourceWorker(
+            source,
+            self.client,
+            self.store,
+            backoff_initial=self.config.backoff_initial,
+            backoff_max_retries=self.config.backoff_max_retries,
+            show_source=len(self.config.sources) > 1,
+            cache=self.cache,
+            broadcast_unsubscribed=self.config.broadcast_unsubscribed,
+            leader=self.leader,
+            live_status=self.config.live_status,
+        )
+
+    def _schedule(self, source: Source, worker: SourceWorker) -> None:
+        """(Re-)schedule the checks of a source and the pre-warming before them.
+
+        The schedules are named after the crontabs, so a changed crontab never
+        catches up on runs missed according to the old one.
+        """
+        self._unschedule(source.name)
+        names = self.schedules[source.name] = []
+        for crontab in source.crontabs:
+            name = f"check/{source.name}/{crontab}"
+            self.scheduler.add(
+                name,
+                crontab,
+                worker.run,
+                jitter=self.config.schedule_jitter,
+                catch_up=self.config.catch_up,
+            )
+            names.append(name)
+            if self.config.prewarm_lead > 0:
+                name = f"prewarm/{source.name}/{crontab}"
+                self.scheduler.add(
+                    name,
+                    crontab,
+                    worker.prewarm,
+                    offset=-self.config.prewarm_lead,
+                    catch_up=False,
+                )
+                names.append(name)
+
+    def _unschedule(self, name: str) -> None:
+        for schedule in self.schedules.pop(name, ()):
+            self.scheduler.remove(schedule)
+
+    def _add_worker(self, source: Source) -> None:
+        worker = self._make_worker(source)
+        self.workers[source.name] = worker
+        self._schedule(source, worker)
+
+    def _remove_worker(self, name: str) -> None:
+        self._unschedule(name)
+        del self.workers[name]
+
+    async def send_last_reports(self, room_id: str) -> None:
+        """Send the last report of every source to a room, e.g. one that was
+        just joined
+        """
+        for worker in list(self.workers.values()):
+            await worker.send_last_report(room_id)
+
+    def reload(self) -> List[str]:
+        """Read the config file again and apply the changes
+
+        Returns:
+            A description of every change applied. If the new config is
+            invalid, the running config is kept.
+        """
+        try:
+            config = Config(self.config.filepath)
+        except (ConfigError, OSError, yaml.YAMLError) as exc:
+            logger.error("Unable to reload config, keeping the old one: %s", exc)
+            return [f"Invalid config, nothing changed: {exc}"]
+        old, self.config = self.config, config
+        changes = []
+
+        for option in RESTART_OPTIONS:
+            if getattr(old, option) != getattr(config, option):
+                logger.warning("Changing %s requires a restart", option)
+                changes.append(f"{option} changed, but requires a restart")
+
+        # cheap options of the storage, the cache and the leader election are
+        # updated in place
+        self.store.history_retention = config.history_retention
+        self.store.processed_events_window = config.processed_events_window
+        if self.cache is not None:
+            self.cache.max_bytes = config.cache_max_bytes
+        if self.leader is not None:
+            self.leader.lease_duration = config.ha_lease_duration
+            self.leader.renew_interval = config.ha_renew_interval
+
+        if old.history_compact_crontab != config.history_compact_crontab:
+            self._schedule_compaction()
+            changes.append("rescheduled the compaction of the history")
+        reschedule_all = any(
+            getattr(old, option) != getattr(config, option)
+            for option in SCHEDULE_OPTIONS
+        )
+
+        sources = {source.name: source for source in config.sources}
+        for name in list(self.workers):
+            if name not in sources:
+                self._remove_worker(name)
+                changes.append(f"removed source {name}")
+        for name, source in sources.items():
+            worker = self.workers.get(name)
+            if worker is None:
+                self._add_worker(source)
+                changes.append(f"added source {name}")
+                continue
+            changed = {
+                option
+                for option, value in vars(source).items()
+                if vars(worker.source).get(option) != value
+            }
+            if changed - {"crontab"}:
+                # e.g. other branches or workflows, so the cached workflows of
+                # the worker are outdated
+                new_worker = self._make_worker(source)
+                # a check still running must not overlap with the new worker
+                new_worker._lock = worker._lock
+                self.workers[name] = worker = new_worker
+                self._schedule(source, worker)
+                changes.append(
+                    "rebuilt the worker of {} ({})".format(
+                        name, ", ".join(sorted(changed))
+                    )
+                )
+            elif changed or reschedule_all:
+                self._schedule(source, worker)
+                changes.append(f"rescheduled source {name}")
+            # cheap options are updated in place
+            worker.backoff_initial = config.backoff_initial
+            worker.backoff_max_retries = config.backoff_max_retries
+            worker.show_source = len(config.sources) > 1
+            worker.broadcast_unsubscribed = config.broadcast_unsubscribed
+            worker.live_status = config.live_status
+
+        for listener in self.listeners:
+            listener(config)
+        logger.info(
+            "Reloaded config %s: %s",
+            config.filepath,
+            "; ".join(changes) or "nothing changed",
+        )
+        return changes
@@ -0,0 +1,169 @@
+import argparse
+import asyncio
+import logging
+import os
+import sys
+from typing import Any, Dict, List, Optional, TextIO
+
+from nio import (
+    AsyncClient,
+    AsyncClientConfig,
+    JoinedRoomsError,
+    LoginError,
+    MatrixRoom,
+    RoomGetStateEventResponse,
+    RoomSendResponse,
+)
+
+from murdock_nio_bot.cache import FileCache
+from murdock_nio_bot.config import Config
+from murdock_nio_bot.storage import Storage
+from murdock_nio_bot.worker import SourceWorker
+
+logger = logging.getLogger(__name__)
+
+# The room a `PrintClient` pretends to be in
+STDOUT = "<stdout>"
+
+
+class PrintClient:
+    """Stands in for the client to print reports instead of posting them"""
+
+    def __init__(self, out: TextIO = sys.stdout):
+        self.out = out
+        self.rooms = {STDOUT: None}
+
+    async def room_send(
+        self, room_id: str, message_type: str, content: Dict[str, Any], **kwargs
+    ) -> RoomSendResponse:
+        print(content["body"], file=self.out)
+        return RoomSendResponse(f"$printed{id(content)}", room_id)
+
+    async def close(self) -> None:
+        pass
+
+
+async def login(config: Config) -> Optional[AsyncClient]:
+    """Log in without syncing and look up the rooms the bot is in
+
+    Encryption is disabled, as the members and devices of the rooms are only
+    known after a sync, so encrypted rooms are left out.
+
+    Returns:
+        The client, None if logging in failed.
+    """
+    client = AsyncClient(
+        config.homeserver_url,
+        config.user_id,
+        device_id=config.device_id,
+        config=AsyncClientConfig(encryption_enabled=False, store_sync_tokens=False),
+    )
+    if config.user_token:
+        client.access_token = config.user_token
+        client.user_id = config.user_id
+    else:
+        response = await client.login(
+            password=config.user_password, device_name=config.device_name
+        )
+        if isinstance(response, LoginError):
+            logger.error("Failed to login: %s", response.message)
+            await client.close()
+            return None
+    response = await client.joined_rooms()
+    if isinstance(response, JoinedRoomsError):
+        logger.error("Unable to get the joined rooms: %s", response.message)
+        await client.close()
+        return None
+    for room_id in response.rooms:
+        encryption = await client.room_get_state_event(room_id, "m.room.encryption")
+        if isinstance(encryption, RoomGetStateEventResponse):
+            logger.warning("Not reporting to encrypted room %s", room_id)
+            continue
+        # the rooms are only needed to route the reports
+        client.rooms[room_id] = MatrixRoom(room_id, client.user_id)
+    return client
+
+
+async def report(
+    config_path: str, post: bool = False, dry_run: bool = False, out: TextIO = None
+) -> int:
+    """Check all sources once and print or post the reports, without syncing
+
+    Args:
+        config_path: The path to the config file.
+
+        post: Whether to post the reports to the rooms the bot is in, instead
+            of printing them.
+
+        dry_run: Whether to leave the storage alone, so neither the history
+            nor the last reported workflow runs are updated.
+
+        out: Where to print the reports to. Defaults to stdout.
+
+    Returns:
+        The exit status, 1 if checking any of the sources failed.
+    """
+    config = Config(config_path)
+    store = None
+    if not dry_run:
+        store = Storage(
+            config.database,
+            processed_events_window=config.processed_events_window,
+            processed_events_capacity=config.processed_events_capacity,
+            history_retention=config.history_retention,
+        )
+    if post:
+        client = await login(config)
+        if client is None:
+            return 1
+    else:
+        client = PrintClient(out or sys.stdout)
+    cache = FileCache(os.path.join(config.store_path, "cache"), config.cache_max_bytes)
+    workers: List[SourceWorker] = [
+        SourceWorker(
+            source,
+            client,
+            store,
+            # fail fast instead of waiting minutes for retries, a failed report
+            # is run again by whatever runs the subcommand
+            backoff_max_retries=0,
+            show_source=len(config.sources) > 1,
+            cache=cache,
+            # the printed report is not meant for any particular room
+            broadcast_unsubscribed=config.broadcast_unsubscribed or not post,
+            live_status=config.live_status and post,
+        )
+        for source in config.sources
+    ]
+    try:
+        checked = await asyncio.gather(*(worker.run() for worker in workers))
+    finally:
+        cache.flush()
+        await client.close()
+    for worker, ok in zip(workers, checked):
+        if not ok:
+            logger.error("Checking %s failed", worker)
+    return 0 if all(checked) else 1
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Run the `report` subcommand"""
+    parser = argparse.ArgumentParser(
+        prog="murdock-nio-bot report",
+        description="Check all sources once and print the reports, "
+        "or post them with --post. The bot is not synced.",
+    )
+    parser.add_argument("config", nargs="?", default="config.yaml")
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="print the reports without updating the storage",
+    )
+    mode.add_argument(
+        "--post",
+        action="store_true",
+        help="post the reports to the unencrypted rooms the bot is in",
+    )
+    args = parser.parse_args(argv)
+    return asyncio.run(report(args.config, post=args.post, dry_run=args.dry_run))
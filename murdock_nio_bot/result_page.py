@@ -0,0 +1,138 @@
+import codecs
+import re
+from html.parser import HTMLParser
+from typing import IO, Iterator, List, NamedTuple, Optional, Tuple
+
+# Murdock names its jobs e.g. "compile/examples/hello-world:native:gnu" or
+# "run_test/tests/xtimer/native:gnu"
+JOB_NAME_RE = re.compile(
+    r"(?P<kind>compile|run_test)/"
+    r"(?P<application>[\w.+-]+(?:/[\w.+-]+)*?)[:/]"
+    r"(?P<board>[\w.+-]+):(?P<toolchain>\w+)(?![\w:])"
+)
+# class names, ids, or headings that mark the failed jobs on a result page
+FAILED_CONTEXT_RE = re.compile(r"fail|error", re.IGNORECASE)
+HEADINGS = ("h1", "h2", "h3", "h4", "h5", "h6")
+# elements that are never closed, so they must not be put on the stack
+VOID_ELEMENTS = (
+    "area",
+    "base",
+    "br",
+    "col",
+    "embed",
+    "hr",
+    "img",
+    "input",
+    "link",
+    "meta",
+    "source",
+    "track",
+    "wbr",
+)
+CHUNK_SIZE = 64 * 1024
+
+
+class FailedJob(NamedTuple):
+    """A failed build or test job of a Murdock run"""
+
+    kind: str
+    application: str
+    board: str
+    toolchain: str
+
+    def __str__(self):
+        sep = ":" if self.kind == "compile" else "/"
+        return f"{self.kind}/{self.application}{sep}{self.board}:{self.toolchain}"
+
+
+class FailedJobsParser(HTMLParser):
+    """Collects the failed jobs of a Murdock result page while it is fed.
+
+    Job names count as failed if they are inside an element whose class or id
+    mentions a failure or an error, or below a heading that does.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.failed_jobs: List[FailedJob] = []
+        self._seen = set()
+        # (tag, marks failed context) of all open elements
+        self._stack: List[Tuple[str, bool]] = []
+        self._failed_section = False
+        self._heading_text: Optional[List[str]] = None
+        # character data may be split across calls to feed(), so it is only
+        # handled once the next tag starts
+        self._data: List[str] = []
+
+    @property
+    def _in_failed_context(self) -> bool:
+        return self._failed_section or any(failed for _, failed in self._stack)
+
+    def handle_starttag(self, tag, attrs):
+        self._flush_data()
+        if tag in HEADINGS:
+            self._heading_text = []
+        if tag in VOID_ELEMENTS:
+            return
+        attrs = dict(attrs)
+        marker = " ".join(attrs.get(name) or "" for name in ("class", "id"))
+        self._stack.append((tag, bool(FAILED_CONTEXT_RE.search(marker))))
+
+    def handle_endtag(self, tag):
+        self._flush_data()
+        if tag in HEADINGS and self._heading_text is not None:
+            self._failed_section = bool(
+                FAILED_CONTEXT_RE.search("".join(self._heading_text))
+            )
+            self._heading_text = None
+        # tolerate unclosed elements by popping up to the matching one
+        for i in range(len(self._stack) - 1, -1, -1):
+            if self._stack[i][0] == tag:
+                del self._stack[i:]
+                break
+
+    def handle_data(self, data):
+        self._data.append(data)
+
+    def close(self):
+        super().close()
+        self._flush_data()
+
+    def _flush_data(self):
+        data = "".join(self._data)
+        self._data.clear()
+        if self._heading_text is not None:
+            self._heading_text.append(data)
+            return
+        if not self._in_failed_context:
+            return
+        for match in JOB_NAME_RE.finditer(data):
+            job = FailedJob(**match.groupdict())
+            if job not in self._seen:
+                self._seen.add(job)
+                self.failed_jobs.append(job)
+
+
+def iter_failed_jobs(html_file: IO[bytes]) -> Iterator[FailedJob]:
+    """Parse the failed jobs of a Murdock result page incrementally.
+
+    The page is decoded and parsed in chunks, so it is never read into memory
+    as a whole.
+
+    Args:
+        html_file: A binary file object of the page.
+    """
+    parser = FailedJobsParser()
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    yielded = 0
+    while True:
+        chunk = html_file.read(CHUNK_SIZE)
+        if chunk:
+            parser.feed(decoder.decode(chunk))
+        else:
+            parser.feed(decoder.decode(b"", final=True))
+            parser.close()
+        yield from parser.failed_jobs[yielded:]
+        yielded = len(parser.failed_jobs)
+        if not chunk:
+            return
@@ -0,0 +1,219 @@
+import asyncio
+import datetime
+import functools
+import logging
+import random
+import time
+from typing import Any, Callable, Dict, NamedTuple, Optional
+
+from croniter import croniter
+
+from murdock_nio_bot.storage import Storage
+
+logger = logging.getLogger(__name__)
+
+
+class Clock:
+    """The time source of a `Scheduler`, replaced by a fake clock in tests"""
+
+    def time(self) -> float:
+        return time.time()
+
+    async def sleep(self, seconds: float) -> None:
+        await asyncio.sleep(seconds)
+
+
+class Schedule(NamedTuple):
+    name: str
+    crontab: str
+    func: Callable[[], Any]
+    # the maximum of a random delay of every run, in seconds
+    jitter: float = 0
+    # seconds to run before (negative) or after the times of the crontab
+    offset: float = 0
+    # whether to run once on start if a run was missed while the bot was down
+    catch_up: bool = True
+
+
+def next_time(crontab: str, after: float) -> float:
+    """Get the next time of a crontab in the local time zone after a UNIX
+    timestamp
+    """
+    start = datetime.datetime.fromtimestamp(after).astimezone()
+    return croniter(crontab, start).get_next(float)
+
+
+def prev_time(crontab: str, before: float) -> float:
+    """Get the previous time of a crontab in the local time zone before a UNIX
+    timestamp
+    """
+    start = datetime.datetime.fromtimestamp(before).astimezone()
+    return croniter(crontab, start).get_prev(float)
+
+
+class Scheduler:
+    """Runs functions at the times of their crontabs.
+
+    When a schedule last ran successfully is kept in the storage. A run fails
+    if its function raises, is cancelled or returns False. On start, a schedule that
+    missed a run while the bot was down runs once right away, so e.g. the
+    report of a day is not skipped because the bot was restarted at that time.
+
+    Args:
+        store: Bot storage to keep the last runs in. Without it, missed runs are
+            not caught up.
+
+        clock: The time source.
+
+        seed: The seed of the jitter, to reproduce a run.
+    """
+
+    def __init__(
+        self,
+        store: Optional[Storage] = None,
+        clock: Optional[Clock] = None,
+        seed: Optional[int] = None,
+    ):
+        self.store = store
+        self.clock = clock or Clock()
+        self.random = random.Random(seed)
+        self.schedules: Dict[str, Schedule] = {}
+        self._tasks: Dict[str, asyncio.Future] = {}
+        # the time every schedule runs next, jitter included
+        self._next_runs: Dict[str, float] = {}
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.schedules
+
+    def add(
+        self,
+        name: str,
+        crontab: str,
+        func: Callable[[], Any],
+        jitter: float = 0,
+        offset: float = 0,
+        catch_up: bool = True,
+    ) -> Schedule:
+        """Schedule a function, replacing any schedule of the same name
+
+        Args:
+            name: A unique name of the schedule, under which its last run is
+                stored.
+
+            crontab: When to run `func`.
+
+            func: A function or coroutine function to call without arguments.
+                It may return False to tell that the run failed.
+
+            jitter: The maximum of a random delay of every run, in seconds.
+
+            offset: Seconds to run before (negative) or after the times of the
+                crontab.
+
+            catch_up: Whether to run once on start if a run was missed.
+        """
+        if not croniter.is_valid(crontab):
+            raise ValueError(f"Invalid crontab {crontab!r} of {name}")
+        self.remove(name)
+        schedule = Schedule(name, crontab, func, jitter, offset, catch_up)
+        self.schedules[name] = schedule
+        self._tasks[name] = asyncio.ensure_future(self._run_schedule(schedule))
+        return schedule
+
+    def remove(self, name: str) -> None:
+        """Stop a schedule. A run in progress is not cancelled."""
+        if name in self.schedules:
+            del self.schedules[name]
+            self._next_runs.pop(name, None)
+            self._tasks.pop(name).cancel()
+
+    def stop(self) -> None:
+        """Stop all schedules"""
+        for name in list(self.schedules):
+            self.remove(name)
+
+    def next_run(self, name: str) -> Optional[float]:
+        """Get the UNIX timestamp a schedule runs next, if it is waiting"""
+        return self._next_runs.get(name)
+
+    def _last_run(self, schedule: Schedule) -> Optional[float]:
+        if self.store is None or not schedule.catch_up:
+            return None
+        try:
+            return self.store.get_last_run(schedule.name)
+        except Exception as exc:
+            logger.error("Unable to get last run of %s: %s", schedule.name, exc)
+            return None
+
+    def _record_run(self, schedule: Schedule, scheduled: float) -> None:
+        if self.store is None or not schedule.catch_up:
+            return
+        try:
+            self.store.set_last_run(schedule.name, int(scheduled))
+        except Exception as exc:
+            logger.error("Unable to store last run of %s: %s", schedule.name, exc)
+
+    async def _run_schedule(self, schedule: Schedule) -> None:
+        now = self.clock.time()
+        last_run = self._last_run(schedule)
+        if last_run is not None:
+            # the latest run that should have happened, however many were missed
+            missed = prev_time(schedule.crontab, now - schedule.offset) + (
+                schedule.offset
+            )
+            if missed > last_run:
+                logger.info(
+                    "Catching up on run of %s missed at %s",
+                    schedule.name,
+                    time.ctime(missed),
+                )
+                await self._delay(schedule, now + self._jitter(schedule))
+                self._call(schedule, missed)
+        after = now - schedule.offset
+        while True:
+            scheduled = next_time(schedule.crontab, after) + schedule.offset
+            await self._delay(schedule, scheduled + self._jitter(schedule))
+            self._call(schedule, scheduled)
+            after = scheduled - schedule.offset
+
+    def _jitter(self, schedule: Schedule) -> float:
+        return self.random.uniform(0, schedule.jitter) if schedule.jitter else 0
+
+    async def _delay(self, schedule: Schedule, until: float) -> None:
+        self._next_runs[schedule.name] = until
+        await self.clock.sleep(max(until - self.clock.time(), 0))
+
+    def _call(self, schedule: Schedule, scheduled: float) -> None:
+        """Run a schedule, and record the run once it succeeded, so a failed,
+        skipped or interrupted run is caught up on the next start
+        """
+        logger.debug("Running schedule %s", schedule.name)
+        try:
+            result = schedule.func()
+        except Exception:
+            logger.exception("Schedule %s failed", schedule.name)
+            return
+        if asyncio.iscoroutine(result):
+            # the schedule keeps its times, even if a run takes longer
+            task = asyncio.ensure_future(result)
+            task.add_done_callback(
+                functools.partial(self._run_done, schedule, scheduled)
+            )
+        elif result is False:
+            logger.warning("Run of schedule %s did not succeed", schedule.name)
+        else:
+            self._record_run(schedule, scheduled)
+
+    def _run_done(
+        self, schedule: Schedule, scheduled: float, task: asyncio.Future
+    ) -> None:
+        if task.cancelled():
+            logger.warning("Run of schedule %s was cancelled", schedule.name)
+            return
+        if task.exception() is not None:
+            logger.error("Schedule %s failed", schedule.name, exc_info=task.exception())
+            return
+        if task.result() is False:
+            logger.warning("Run of schedule %s did not succeed", schedule.name)
+            return
+        self._record_run(schedule, scheduled)
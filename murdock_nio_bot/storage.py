@@ -1,20 +1,76 @@
 import logging
-from typing import Any, Dict
+import time
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+import numpy as np
+
+from murdock_nio_bot.cache import BloomFilter
+from murdock_nio_bot.junit import RunOutcomes
+from murdock_nio_bot.migrations import load_migrations
 
 # The latest migration version of the database.
 #
 # Database migrations are applied starting from the number specified in the database's
 # `migration_version` table + 1 (or from 0 if this table does not yet exist) up until
-# the version specified here.
-#
-# When a migration is performed, the `migration_version` table should be incremented.
-latest_migration_version = 1
+# the version specified here. The migrations are the modules of
+# `murdock_nio_bot.migrations`, this is the version of the last one.
+latest_migration_version = load_migrations()[-1][0]
+
+# The length of the periods old results are summarized in, in seconds
+HISTORY_SUMMARY_PERIOD = 7 * 24 * 60 * 60
+
+# The branch of subscriptions to all branches of a source
+ALL_BRANCHES = "*"
+
+# A nightly result as (source, branch, commit, result, timestamp)
+NightlyResultRow = Tuple[str, str, str, str, int]
+# A workflow run as (source, workflow, run id, commit, branch, conclusion, timestamp)
+WorkflowRunResultRow = Tuple[str, str, int, str, Optional[str], str, int]
+
+# The results of the test cases of a run as (timestamp, test ids, failed), packed
+# by `pack_test_results`
+TestRunRow = Tuple[int, bytes, bytes]
+# How the ids of the test cases of a run are packed
+TEST_ID_DTYPE = np.dtype("<i8")
 
 logger = logging.getLogger(__name__)
 
 
+def pack_commit(commit: Optional[str]) -> Optional[bytes]:
+    """Convert a commit hash to the bytes it is stored as, half as long"""
+    if commit is None:
+        return None
+    return bytes.fromhex(commit)
+
+
+def pack_test_results(
+    test_ids: Sequence[int], failed: Sequence[bool]
+) -> Tuple[bytes, bytes]:
+    """Pack the ids of test cases and whether they failed into the bytes they
+    are stored as, 8 bytes per id and one per outcome
+    """
+    return (
+        np.asarray(test_ids, dtype=TEST_ID_DTYPE).tobytes(),
+        np.asarray(failed, dtype=bool).tobytes(),
+    )
+
+
+def unpack_commit(commit: Optional[bytes]) -> Optional[str]:
+    """Convert a stored commit hash back to hex"""
+    if commit is None:
+        return None
+    # postgres returns a memoryview
+    return bytes(commit).hex()
+
+
 class Storage:
-    def __init__(self, database_config: Dict[str, str]):
+    def __init__(
+        self,
+        database_config: Dict[str, str],
+        processed_events_window: int = 7 * 24 * 60 * 60,
+        processed_events_capacity: int = 100000,
+        history_retention: int = 2 * 365 * 24 * 60 * 60,
+    ):
         """Setup the database.
 
         Runs an initial setup or migrations depending on whether a database file has already
@@ -25,7 +81,20 @@ class Storage:
                 * type: A string, one of "sqlite" or "postgres".
                 * connection_string: A string, featuring a connection string that
                     be fed to each respective db library's `connect` method.
+
+            processed_events_window: How long to remember processed events, in
+                seconds.
+
+            processed_events_capacity: How many processed events the in-memory
+                filter in front of the database is sized for.
+
+            history_retention: How long to keep single results, in seconds. Older
+                results are only kept as weekly summaries.
         """
+        self.processed_events_window = processed_events_window
+        self.history_retention = history_retention
+        self.processed_events_capacity = processed_events_capacity
+        self._processed_events: Optional[BloomFilter] = None
         self.conn = self._get_database_connection(
             database_config["type"], database_config["connection_string"]
         )
@@ -44,7 +113,7 @@ class Storage:
             if migration_level < latest_migration_version:
                 self._run_migrations(migration_level)
 
-        logger.info(f"Database initialization of type '{self.db_type}' complete")
+        logger.info("Database initialization of type '%s' complete", self.db_type)
 
     def _get_database_connection(
         self, database_type: str, connection_string: str
@@ -54,7 +123,13 @@ class Storage:
             import sqlite3
 
             # Initialize a connection to the database, with autocommit on
-            return sqlite3.connect(connection_string, isolation_level=None)
+            conn = sqlite3.connect(connection_string, isolation_level=None)
+            # readers do not block the writer, and commits only sync the
+            # write-ahead log at checkpoints, which is still safe against
+            # corruption
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            return conn
         elif database_type == "postgres":
             import psycopg2
 
@@ -88,45 +163,40 @@ class Storage:
             (0,),
         )
 
-        # Set up any other necessary database tables here
-        self._execute(
-            """
-            CREATE TABLE github_workflow (
-                id INTEGER PRIMARY KEY,
-                last_run_commit VARCHAR(40) DEFAULT NULL
-            )
-        """
-        )
-
+        # All other tables are set up by the migrations
         logger.info("Database setup complete")
 
     def _run_migrations(self, current_migration_version: int) -> None:
         """Execute database migrations. Migrates the database to the
         `latest_migration_version`.
 
+        Every migration is applied in a transaction of its own, so a failed
+        migration leaves the database at the previous version.
+
         Args:
             current_migration_version: The migration version that the database is
                 currently at.
         """
         logger.debug("Checking for necessary database migrations...")
 
-        if current_migration_version < 1:
-            logger.info("Migrating the database from v0 to v1...")
-
-            # Add new table, delete old ones, etc.
-            self._execute(
-                """
-                CREATE TABLE github_workflow (
-                    id INTEGER PRIMARY KEY,
-                    last_run_commit VARCHAR(40) DEFAULT NULL
-                )
-            """
+        for version, description, upgrade in load_migrations():
+            if version <= current_migration_version:
+                continue
+            logger.info(
+                "Migrating the database from v%d to v%d: %s",
+                version - 1,
+                version,
+                description.splitlines()[0],
             )
-
-            # Update the stored migration version
-            self._execute("UPDATE migration_version SET version = 1")
-
-            logger.info("Database migrated to v1")
+            self._execute("BEGIN")
+            try:
+                upgrade(self)
+                self._execute("UPDATE migration_version SET version = ?", (version,))
+            except Exception:
+                self._execute("ROLLBACK")
+                raise
+            self._execute("COMMIT")
+            logger.info("Database migrated to v%d", version)
 
     def _execute(self, *args) -> None:
         """A wrapper around cursor.execute that transforms placeholder ?'s to %s for postgres.
@@ -141,6 +211,19 @@ class Storage:
         else:
             self.cursor.execute(*args)
 
+    def _executemany(self, query: str, rows: Iterable[Tuple]) -> None:
+        """A wrapper around cursor.executemany that transforms placeholder ?'s to %s
+        for postgres.
+
+        Args:
+            query: The query to execute for every row.
+
+            rows: The parameters of the rows.
+        """
+        if self.db_type == "postgres":
+            query = query.replace("?", "%s")
+        self.cursor.executemany(query, rows)
+
     def get_last_run_commit(self, workflow_id):
         self._execute(
             "SELECT last_run_commit FROM github_workflow WHERE id = ?",
@@ -149,16 +232,507 @@ class Storage:
         row = self.cursor.fetchone()
         if row is None:
             return None
-        return row[0]
+        return unpack_commit(row[0])
 
     def set_last_run_commit(self, workflow_id, last_run_commit):
-        if self.get_last_run_commit(workflow_id):
-            self._execute(
-                "UPDATE github_workflow SET last_run_commit = ? WHERE id = ?",
-                (last_run_commit, workflow_id),
+        self._execute(
+            "INSERT INTO github_workflow (id, last_run_commit) VALUES (?, ?) "
+            "ON CONFLICT (id) DO UPDATE SET last_run_commit = excluded.last_run_commit",
+            (workflow_id, pack_commit(last_run_commit)),
+        )
+
+    def add_sent_event(self, event_id: str, room_id: str) -> None:
+        """Remember an event the bot sent to a room"""
+        self._execute(
+            "INSERT INTO sent_event (event_id, room_id, sent_at) VALUES (?, ?, ?) "
+            "ON CONFLICT DO NOTHING",
+            (event_id, room_id, int(time.time())),
+        )
+
+    def get_sent_events(self, limit: int) -> List[Tuple[str, str]]:
+        """Get the (event_id, room_id) pairs of the `limit` most recently sent
+        events, oldest first.
+        """
+        self._execute(
+            "SELECT event_id, room_id FROM sent_event ORDER BY seq DESC LIMIT ?",
+            (limit,),
+        )
+        return list(reversed(self.cursor.fetchall()))
+
+    def prune_sent_events(self, keep: int) -> None:
+        """Forget all but the `keep` most recently sent events"""
+        self._execute(
+            "DELETE FROM sent_event WHERE event_id NOT IN ("
+            "SELECT event_id FROM sent_event ORDER BY seq DESC LIMIT ?"
+            ")",
+            (keep,),
+        )
+
+    def _load_processed_events(self) -> BloomFilter:
+        """Build the in-memory filter from the processed events"""
+        processed_events = BloomFilter(self.processed_events_capacity)
+        self._execute("SELECT event_id FROM processed_event")
+        for (event_id,) in self.cursor.fetchall():
+            processed_events.add(event_id)
+        return processed_events
+
+    def is_event_processed(self, event_id: str) -> bool:
+        """Check whether an event was already processed, e.g. before a restart.
+
+        Events the in-memory filter has never seen are answered without a query.
+        """
+        if self._processed_events is None:
+            self.prune_processed_events()
+        if event_id not in self._processed_events:
+            return False
+        self._execute(
+            "SELECT 1 FROM processed_event WHERE event_id = ?",
+            (event_id,),
+        )
+        return self.cursor.fetchone() is not None
+
+    def mark_event_processed(self, event_id: str) -> None:
+        """Remember that an event was processed"""
+        if self._processed_events is None:
+            self.prune_processed_events()
+        self._processed_events.add(event_id)
+        self._execute(
+            "INSERT INTO processed_event (event_id, processed_at) VALUES (?, ?) "
+            "ON CONFLICT DO NOTHING",
+            (event_id, int(time.time())),
+        )
+
+    def prune_processed_events(self) -> None:
+        """Forget processed events older than the de-duplication window, and
+        rebuild the in-memory filter, which cannot drop single events, from the
+        remaining ones.
+        """
+        self._execute(
+            "DELETE FROM processed_event WHERE processed_at < ?",
+            (int(time.time()) - self.processed_events_window,),
+        )
+        self._processed_events = self._load_processed_events()
+
+    def _history_cutoff(self) -> int:
+        """The start of the oldest summary period that still has single results"""
+        cutoff = int(time.time()) - self.history_retention
+        return cutoff - cutoff % HISTORY_SUMMARY_PERIOD
+
+    def add_nightly_results(self, rows: Iterable[NightlyResultRow]) -> None:
+        """Record the results of nightlies in a single batch.
+
+        Results that were recorded before, or are already past the retention,
+        are skipped.
+        """
+        cutoff = self._history_cutoff()
+        self._executemany(
+            "INSERT INTO nightly_result (source, branch, commit_hash, result, ts) "
+            "VALUES (?, ?, ?, ?, ?) ON CONFLICT DO NOTHING",
+            [
+                (source, branch, pack_commit(commit), result, ts)
+                for source, branch, commit, result, ts in rows
+                if ts >= cutoff
+            ],
+        )
+
+    def add_workflow_run_results(self, rows: Iterable[WorkflowRunResultRow]) -> None:
+        """Record the results of workflow runs in a single batch.
+
+        Runs that were recorded before, or are already past the retention, are
+        skipped.
+        """
+        cutoff = self._history_cutoff()
+        self._executemany(
+            "INSERT INTO workflow_run_result "
+            "(source, workflow, run_id, commit_hash, branch, conclusion, ts) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?) ON CONFLICT DO NOTHING",
+            [
+                (source, workflow, run_id, pack_commit(commit), branch, conclusion, ts)
+                for source, workflow, run_id, commit, branch, conclusion, ts in rows
+                if ts >= cutoff
+            ],
+        )
+
+    def get_nightly_results(
+        self, source: str, branch: str, since: int = 0
+    ) -> List[Tuple[int, str, str]]:
+        """Get the (timestamp, commit, result) of the nightlies of a branch since
+        a timestamp, oldest first.
+        """
+        self._execute(
+            "SELECT ts, commit_hash, result FROM nightly_result "
+            "WHERE source = ? AND branch = ? AND ts >= ? ORDER BY ts",
+            (source, branch, since),
+        )
+        return [
+            (ts, unpack_commit(commit), result)
+            for ts, commit, result in self.cursor.fetchall()
+        ]
+
+    def get_workflow_run_results(
+        self, source: str, workflow: str, since: int = 0
+    ) -> List[Tuple[int, int, str, str]]:
+        """Get the (timestamp, run id, commit, conclusion) of the runs of a
+        workflow since a timestamp, oldest first.
+        """
+        self._execute(
+            "SELECT ts, run_id, commit_hash, conclusion FROM workflow_run_result "
+            "WHERE source = ? AND workflow = ? AND ts >= ? ORDER BY ts",
+            (source, workflow, since),
+        )
+        return [
+            (ts, run_id, unpack_commit(commit), conclusion)
+            for ts, run_id, commit, conclusion in self.cursor.fetchall()
+        ]
+
+    def get_last_nightly_result(
+        self, source: str, branch: str
+    ) -> Optional[Tuple[int, str, str]]:
+        """Get the (timestamp, commit, result) of the latest recorded nightly of
+        a branch, if any.
+        """
+        self._execute(
+            "SELECT ts, commit_hash, result FROM nightly_result "
+            "WHERE source = ? AND branch = ? ORDER BY ts DESC LIMIT 1",
+            (source, branch),
+        )
+        row = self.cursor.fetchone()
+        if row is None:
+            return None
+        ts, commit, result = row
+        return ts, unpack_commit(commit), result
+
+    def get_last_workflow_run_result(
+        self, source: str, workflow: str
+    ) -> Optional[Tuple[int, int, str, Optional[str], str]]:
+        """Get the (timestamp, run id, commit, branch, conclusion) of the latest
+        recorded run of a workflow, if any.
+        """
+        self._execute(
+            "SELECT ts, run_id, commit_hash, branch, conclusion "
+            "FROM workflow_run_result "
+            "WHERE source = ? AND workflow = ? ORDER BY ts DESC LIMIT 1",
+            (source, workflow),
+        )
+        row = self.cursor.fetchone()
+        if row is None:
+            return None
+        ts, run_id, commit, branch, conclusion = row
+        return ts, run_id, unpack_commit(commit), branch, conclusion
+
+    def get_result_summaries(
+        self, kind: str, source: str, name: str
+    ) -> List[Tuple[int, int, int]]:
+        """Get the (period start, runs, failures) summaries of the results past
+        the retention, oldest first.
+
+        Args:
+            kind: Either "nightly" or "workflow".
+
+            source: The name of the source.
+
+            name: The branch of the nightlies or the name of the workflow.
+        """
+        self._execute(
+            "SELECT period_start, runs, failures FROM result_summary "
+            "WHERE kind = ? AND source = ? AND name = ? ORDER BY period_start",
+            (kind, source, name),
+        )
+        return self.cursor.fetchall()
+
+    def add_test_run(
+        self,
+        source: str,
+        workflow: str,
+        run_id: int,
+        timestamp: int,
+        outcomes: RunOutcomes,
+    ) -> None:
+        """Record the results of the test cases of a workflow run, unless they
+        were recorded before or are already past the retention.
+        """
+        if timestamp < self._history_cutoff():
+            return
+        self._executemany(
+            "INSERT INTO test_case (id, name) VALUES (?, ?) ON CONFLICT DO NOTHING",
+            list(outcomes.failed_names.items()),
+        )
+        self._execute(
+            "INSERT INTO test_run (source, run_id, workflow, ts, test_ids, failed) "
+            "VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT DO NOTHING",
+            (
+                source,
+                run_id,
+                workflow,
+                timestamp,
+                *pack_test_results(outcomes.test_ids, outcomes.failed),
+            ),
+        )
+
+    def has_test_results(self, source: str, run_id: int) -> bool:
+        """Check whether the test results of a workflow run were recorded"""
+        self._execute(
+            "SELECT 1 FROM test_run WHERE source = ? AND run_id = ?",
+            (source, run_id),
+        )
+        return self.cursor.fetchone() is not None
+
+    def get_test_runs(
+        self, source: str, workflow: str, since: int = 0
+    ) -> List[TestRunRow]:
+        """Get the packed results of the test cases of the runs of a workflow
+        since a timestamp
+        """
+        self._execute(
+            "SELECT ts, test_ids, failed FROM test_run "
+            "WHERE source = ? AND workflow = ? AND ts >= ?",
+            (source, workflow, since),
+        )
+        # postgres returns memoryviews
+        return [
+            (ts, bytes(test_ids), bytes(failed))
+            for ts, test_ids, failed in self.cursor.fetchall()
+        ]
+
+    def get_test_case_names(self, test_ids: Iterable[int]) -> Dict[int, str]:
+        """Get the names of test cases by their ids"""
+        test_ids = list(test_ids)
+        if not test_ids:
+            return {}
+        self._execute(
+            "SELECT id, name FROM test_case WHERE id IN ({})".format(
+                ", ".join("?" * len(test_ids))
+            ),
+            test_ids,
+        )
+        return dict(self.cursor.fetchall())
+
+    def add_subscription(self, room_id: str, source: str, branch: str) -> None:
+        """Subscribe a room to the reports of a branch of a source.
+
+        Args:
+            room_id: The room to send the reports to.
+
+            source: The name of the source.
+
+            branch: The branch of the nightlies and workflow runs, or
+                `ALL_BRANCHES`.
+        """
+        self._execute(
+            "INSERT INTO subscription (room_id, source, branch) VALUES (?, ?, ?) "
+            "ON CONFLICT DO NOTHING",
+            (room_id, source, branch),
+        )
+
+    def remove_subscription(self, room_id: str, source: str, branch: str) -> bool:
+        """Unsubscribe a room from the reports of a branch of a source.
+
+        Returns:
+            False if the room was not subscribed.
+        """
+        self._execute(
+            "DELETE FROM subscription WHERE room_id = ? AND source = ? AND branch = ?",
+            (room_id, source, branch),
+        )
+        return self.cursor.rowcount > 0
+
+    def get_room_subscriptions(self, room_id: str) -> List[Tuple[str, str]]:
+        """Get the (source, branch) subscriptions of a room"""
+        self._execute(
+            "SELECT source, branch FROM subscription WHERE room_id = ? "
+            "ORDER BY source, branch",
+            (room_id,),
+        )
+        return self.cursor.fetchall()
+
+    def get_subscribers(
+        self, source: str, branches: Iterable[str]
+    ) -> Dict[str, Set[str]]:
+        """Get the rooms subscribed to any of the branches of a source, with the
+        branches each room is subscribed to. Subscriptions to `ALL_BRANCHES`
+        are expanded to all of the given branches.
+        """
+        branches = set(branches)
+        self._execute(
+            "SELECT room_id, branch FROM subscription "
+            "WHERE source = ? AND branch IN ({})".format(
+                ", ".join("?" * (len(branches) + 1))
+            ),
+            (source, ALL_BRANCHES, *branches),
+        )
+        subscribers = {}
+        for room_id, branch in self.cursor.fetchall():
+            subscribers.setdefault(room_id, set()).update(
+                branches if branch == ALL_BRANCHES else {branch}
             )
-        else:
-            self._execute(
-                "INSERT INTO github_workflow (id, last_run_commit) " "VALUES (?, ?)",
-                (workflow_id, last_run_commit),
+        return subscribers
+
+    def get_workflow_branches(self, source: str) -> Set[str]:
+        """Get the branches recorded workflow runs of a source ran on"""
+        self._execute(
+            "SELECT DISTINCT branch FROM workflow_run_result "
+            "WHERE source = ? AND branch IS NOT NULL",
+            (source,),
+        )
+        return {branch for (branch,) in self.cursor.fetchall()}
+
+    def get_subscribed_rooms(self, source: str) -> Set[str]:
+        """Get the rooms with any subscription to a source"""
+        self._execute(
+            "SELECT DISTINCT room_id FROM subscription WHERE source = ?", (source,)
+        )
+        return {room_id for room_id, in self.cursor.fetchall()}
+
+    def acquire_lease(self, name: str, holder: str, duration: float) -> bool:
+        """Acquire or renew a lease, if it is free, expired, or already held by
+        `holder`. The lease is taken with a single conditional statement, so
+        only one holder can win it, even across processes.
+
+        Args:
+            name: The name of the lease.
+
+            holder: A unique id of the one acquiring the lease.
+
+            duration: For how many seconds to hold the lease.
+
+        Returns:
+            True if `holder` holds the lease now.
+        """
+        now = int(time.time() * 1000)
+        expires_at = now + int(duration * 1000)
+        self._execute(
+            "UPDATE lease SET holder = ?, expires_at = ? "
+            "WHERE name = ? AND (holder = ? OR expires_at < ?)",
+            (holder, expires_at, name, holder, now),
+        )
+        if self.cursor.rowcount > 0:
+            return True
+        self._execute(
+            "INSERT INTO lease (name, holder, expires_at) VALUES (?, ?, ?) "
+            "ON CONFLICT DO NOTHING",
+            (name, holder, expires_at),
+        )
+        return self.cursor.rowcount > 0
+
+    def release_lease(self, name: str, holder: str) -> None:
+        """Release a lease, if it is held by `holder`"""
+        self._execute(
+            "DELETE FROM lease WHERE name = ? AND holder = ?",
+            (name, holder),
+        )
+
+    def get_lease_holder(self, name: str) -> Optional[str]:
+        """Get the current holder of a lease, if it did not expire"""
+        self._execute(
+            "SELECT holder FROM lease WHERE name = ? AND expires_at >= ?",
+            (name, int(time.time() * 1000)),
+        )
+        row = self.cursor.fetchone()
+        if row is None:
+            return None
+        return row[0]
+
+    def get_last_run(self, name: str) -> Optional[int]:
+        """Get when a schedule last ran, as a UNIX timestamp, None if it never
+        ran
+        """
+        self._execute("SELECT last_run FROM schedule_run WHERE name = ?", (name,))
+        row = self.cursor.fetchone()
+        if row is None:
+            return None
+        return row[0]
+
+    def set_last_run(self, name: str, last_run: int) -> None:
+        """Store when a schedule last ran, as a UNIX timestamp"""
+        self._execute(
+            "INSERT INTO schedule_run (name, last_run) VALUES (?, ?) "
+            "ON CONFLICT (name) DO UPDATE SET last_run = excluded.last_run",
+            (name, last_run),
+        )
+
+    def get_live_status(
+        self, room_id: str, source: str
+    ) -> Optional[Tuple[str, Set[str]]]:
+        """Get the live status message of a source in a room
+
+        Returns:
+            The event ID of the message and the keys of the results it shows,
+            None if the room has no live status message of the source.
+        """
+        self._execute(
+            "SELECT event_id, results FROM live_status "
+            "WHERE room_id = ? AND source = ?",
+            (room_id, source),
+        )
+        row = self.cursor.fetchone()
+        if row is None:
+            return None
+        return row[0], set(row[1].split("\n")) - {""}
+
+    def set_live_status(
+        self, room_id: str, source: str, event_id: str, results: Iterable[str]
+    ) -> None:
+        """Store the live status message of a source in a room and the keys of
+        the results it shows
+        """
+        self._execute(
+            "INSERT INTO live_status (room_id, source, event_id, results) "
+            "VALUES (?, ?, ?, ?) ON CONFLICT (room_id, source) DO UPDATE SET "
+            "event_id = excluded.event_id, results = excluded.results",
+            (room_id, source, event_id, "\n".join(sorted(results))),
+        )
+
+    def compact_history(self) -> None:
+        """Summarize the results past the retention per week and delete them.
+        Results of single test cases are deleted without a summary.
+        """
+        cutoff = self._history_cutoff()
+        # the period is inlined, so postgres can match the grouped expression
+        period_start = f"(ts / {HISTORY_SUMMARY_PERIOD}) * {HISTORY_SUMMARY_PERIOD}"
+        self._execute("BEGIN")
+        try:
+            for kind, table, name, failed in (
+                ("nightly", "nightly_result", "branch", "result = 'errored'"),
+                (
+                    "workflow",
+                    "workflow_run_result",
+                    "workflow",
+                    "conclusion = 'failure'",
+                ),
+            ):
+                self._execute(
+                    "INSERT INTO result_summary "
+                    "(kind, source, name, period_start, runs, failures) "
+                    f"SELECT ?, source, {name}, {period_start}, COUNT(*), "
+                    f"SUM(CASE WHEN {failed} THEN 1 ELSE 0 END) "
+                    f"FROM {table} WHERE ts < ? "
+                    f"GROUP BY source, {name}, {period_start} "
+                    "ON CONFLICT (kind, source, name, period_start) DO UPDATE SET "
+                    "runs = result_summary.runs + excluded.runs, "
+                    "failures = result_summary.failures + excluded.failures",
+                    (kind, cutoff),
+                )
+                self._execute(f"DELETE FROM {table} WHERE ts < ?", (cutoff,))
+                logger.info("Summarized %d old %s results", self.cursor.rowcount, kind)
+            self._execute("DELETE FROM test_run WHERE ts < ?", (cutoff,))
+            self._delete_unused_test_cases()
+            self._execute("COMMIT")
+        except Exception:
+            self._execute("ROLLBACK")
+            raise
+
+    def _delete_unused_test_cases(self) -> None:
+        """Delete the names of the test cases no recorded run has anymore"""
+        self._execute("SELECT test_ids FROM test_run")
+        used = np.unique(
+            np.frombuffer(
+                b"".join(bytes(test_ids) for test_ids, in self.cursor.fetchall()),
+                dtype=TEST_ID_DTYPE,
             )
+        )
+        self._execute("SELECT id FROM test_case")
+        names = np.array([test_id for test_id, in self.cursor.fetchall()], np.int64)
+        unused = names[~np.isin(names, used)]
+        self._executemany(
+            "DELETE FROM test_case WHERE id = ?", [(int(i),) for i in unused]
+        )
@@ -0,0 +1,227 @@
+import asyncio
+import http.client
+import logging
+import time
+from typing import List, Optional
+
+import requests
+from nio import AsyncClient
+
+from murdock_nio_bot.cache import FileCache
+from murdock_nio_bot.chat_functions import prewarm_group_sessions, send_text_to_room
+from murdock_nio_bot.config import Source
+from murdock_nio_bot.errors import GitHubError, RateLimitError
+from murdock_nio_bot.github import Workflow
+from murdock_nio_bot.leader import LeaderElector
+from murdock_nio_bot.metrics import metrics
+from murdock_nio_bot.murdock import last_results, render_reports, report_last_nightlies
+from murdock_nio_bot.storage import Storage
+
+logger = logging.getLogger(__name__)
+
+# Errors of a source that are worth retrying
+TRANSIENT_ERRORS = (
+    requests.RequestException,
+    http.client.HTTPException,
+    OSError,
+    RateLimitError,
+    GitHubError,
+)
+
+
+class SourceWorker:
+    """Checks and reports a single source.
+
+    Every source gets its own worker, with its own cached workflow list and its
+    own backoff, so a slow or failing source never delays the others.
+
+    Args:
+        source: The source to check.
+
+        client: The client to report with.
+
+        store: Bot storage.
+
+        backoff_initial: Seconds to wait before the first retry of a failed
+            check. The delay doubles with every further retry.
+
+        backoff_max_retries: How often to retry a failed check before giving up
+            until the next scheduled run.
+
+        show_source: Whether to mention the name of the source in reports.
+
+        cache: A `FileCache` for downloads needed for the analysis of results.
+
+        broadcast_unsubscribed: Whether to report to rooms without any
+            subscription to the source.
+
+        leader: If given, the source is only checked while this replica is the
+            leader.
+
+        live_status: Whether to edit a status message per room instead of
+            sending a new report, unless there are new failures.
+    """
+
+    def __init__(
+        self,
+        source: Source,
+        client: AsyncClient,
+        store: Storage,
+        backoff_initial: float = 60,
+        backoff_max_retries: int = 5,
+        show_source: bool = False,
+        cache: Optional[FileCache] = None,
+        broadcast_unsubscribed: bool = True,
+        leader: Optional[LeaderElector] = None,
+        live_status: bool = False,
+    ):
+        self.source = source
+        self.client = client
+        self.store = store
+        self.backoff_initial = backoff_initial
+        self.backoff_max_retries = backoff_max_retries
+        self.show_source = show_source
+        self.cache = cache
+        self.broadcast_unsubscribed = broadcast_unsubscribed
+        self.leader = leader
+        self.live_status = live_status
+        self.workflows: Optional[List[Workflow]] = None
+        self.failures = 0
+        # how long the last pre-warming of the group sessions took, in seconds
+        self.prewarm_duration: Optional[float] = None
+        self._lock = asyncio.Lock()
+
+    def __str__(self):
+        return str(self.source)
+
+    async def get_workflows(self) -> List[Workflow]:
+        """Get the workflows of the source, fetching them until that succeeded
+        once
+
+        Raises:
+            GitHubError: If fetching the workflows failed.
+        """
+        if self.workflows is None:
+            loop = asyncio.get_event_loop()
+            self.workflows = await loop.run_in_executor(
+                None, Workflow.fetch_workflows, self.source, self.store
+            )
+        return self.workflows
+
+    async def report(self) -> None:
+        """Check the source and report the results"""
+        workflows = await self.get_workflows() if self.source.github_workflows else []
+        await report_last_nightlies(
+            self.source,
+            self.client,
+            workflows,
+            show_source=self.show_source,
+            cache=self.cache,
+            store=self.store,
+            broadcast_unsubscribed=self.broadcast_unsubscribed,
+            live_status=self.live_status,
+        )
+
+    async def send_last_report(self, room_id: str) -> bool:
+        """Send the latest recorded results of the source to a room, e.g. one
+        that was just joined, so it does not have to wait for the next change
+
+        Returns:
+            Whether the room got a report.
+        """
+        if self.store is None or self._is_standby():
+            return False
+        nightlies, workflow_runs = last_results(self.source, self.store)
+        if not nightlies and not workflow_runs:
+            return False
+        reports = await render_reports(
+            self.source,
+            self.store,
+            [room_id],
+            nightlies,
+            workflow_runs,
+            "Hello! Thanks for inviting me.",
+            self.show_source,
+            self.broadcast_unsubscribed,
+            status=True,
+        )
+        for msg, _, _, _ in reports:
+            await send_text_to_room(self.client, room_id, msg, markdown_convert=True)
+        return bool(reports)
+
+    def _is_standby(self) -> bool:
+        return self.leader is not None and not self.leader.is_leader
+
+    def report_rooms(self) -> List[str]:
+        """Get the rooms that may get a report of the source"""
+        room_ids = list(self.client.rooms)
+        if self.store is None or self.broadcast_unsubscribed:
+            return room_ids
+        subscribed_rooms = self.store.get_subscribed_rooms(self.source.name)
+        return [room_id for room_id in room_ids if room_id in subscribed_rooms]
+
+    async def prewarm(self) -> None:
+        """Share the group sessions of the encrypted rooms that may get the next
+        report, so sending the report is not delayed by it
+        """
+        if self._is_standby():
+            return
+        start = time.perf_counter()
+        try:
+            shared = await prewarm_group_sessions(self.client, self.report_rooms())
+        except Exception as exc:
+            # the sessions are shared when sending the report otherwise
+            logger.warning("Pre-warming the rooms of %s failed: %s", self, exc)
+            return
+        self.prewarm_duration = time.perf_counter() - start
+        metrics.set(
+            "group_session_prewarm_seconds",
+            round(self.prewarm_duration, 3),
+            source=self.source.name,
+        )
+        metrics.inc("group_sessions_prewarmed_total", shared, source=self.source.name)
+        logger.info(
+            "Pre-warmed %d group sessions for %s in %.3fs",
+            shared,
+            self,
+            self.prewarm_duration,
+        )
+
+    async def run(self) -> bool:
+        """Check and report the source, retrying with exponential backoff on
+        transient errors
+
+        Returns:
+            Whether the source was checked. False if the check gave up, was
+            skipped as the previous one is still running, or left to the
+            leader.
+        """
+        if self._lock.locked():
+            logger.warning("Previous check of %s still running, skipping", self)
+            return False
+        async with self._lock:
+            self.failures = 0
+            while True:
+                if self._is_standby():
+                    logger.info("Not the leader, skipping check of %s", self)
+                    return False
+                try:
+                    await self.report()
+                    return True
+                except TRANSIENT_ERRORS as exc:
+                    self.failures += 1
+                    if self.failures > self.backoff_max_retries:
+                        logger.error(
+                            "Giving up on %s after %d attempts: %s",
+                            self,
+                            self.failures,
+                            exc,
+                        )
+                        return False
+                    delay = self.backoff_initial * 2 ** (self.failures - 1)
+                    if isinstance(exc, RateLimitError):
+                        delay = max(delay, exc.retry_at - time.time())
+                    logger.warning(
+                        "Checking %s failed, retrying in %ds: %s", self, delay, exc
+                    )
+                    await asyncio.sleep(delay)
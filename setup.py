@@ -30,16 +30,19 @@ setup(
     url="https://github.com/anoadragon453/nio-template",
     description="A matrix bot to do amazing things!",
     packages=find_packages(exclude=["tests", "tests.*"]),
+    python_requires=">=3.8",
     install_requires=[
         "agithub>=2.2",
-        "aiocron>=1.4",
+        "croniter>=1.0",
         "matrix-nio[e2e]>=0.10.0",
         "Markdown>=3.1.1",
+        "numpy>=1.23",
         "PyYAML>=5.1.2",
         "requests>=2.25",
     ],
     extras_require={
         "postgres": ["psycopg2>=2.8.5"],
+        "uvloop": ["uvloop>=0.14"],
         "dev": [
             "isort==5.0.4",
             "flake8==3.8.3",
@@ -50,10 +53,8 @@ setup(
     classifiers=[
         "License :: OSI Approved :: Apache Software License",
         "Programming Language :: Python :: 3 :: Only",
-        "Programming Language :: Python :: 3.5",
-        "Programming Language :: Python :: 3.6",
-        "Programming Language :: Python :: 3.7",
         "Programming Language :: Python :: 3.8",
+        "Programming Language :: Python :: 3.9",
     ],
     long_description=long_description,
     long_description_content_type="text/markdown",
@@ -0,0 +1,19 @@
+import pytest
+
+
+def pytest_addoption(parser):
+    parser.addoption(
+        "--network",
+        action="store_true",
+        help="also run the tests against the live services, which need network "
+        "access and depend on their current state",
+    )
+
+
+def pytest_collection_modifyitems(config, items):
+    if config.getoption("--network"):
+        return
+    skip = pytest.mark.skip(reason="needs --network")
+    for item in items:
+        if "network" in item.keywords:
+            item.add_marker(skip)
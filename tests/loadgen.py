@@ -0,0 +1,411 @@
+# Synthetic load for `Callbacks`, to find out how many busy rooms one bot can
+# handle before processing the events of a sync falls behind.
+#
+# Messages, commands, invites, undecryptable events and reactions are generated
+# for a number of rooms and dispatched like nio dispatches the events of a sync
+# batch: one after the other. The messages the bot sends go to a `FakeClient`.
+#
+#     python -m tests.loadgen --rooms 50 --room-size 100 --rate 200 --events 5000
+import argparse
+import asyncio
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+import uuid
+from typing import Any, Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+from nio import (
+    InviteMemberEvent,
+    JoinResponse,
+    MatrixRoom,
+    MegolmEvent,
+    RoomMessageText,
+    RoomSendResponse,
+    UnknownEvent,
+)
+
+from murdock_nio_bot.callbacks import Callbacks
+from murdock_nio_bot.chat_functions import sent_events
+from murdock_nio_bot.command_pool import CommandPool
+from murdock_nio_bot.config import Config
+from murdock_nio_bot.storage import Storage
+
+BOT_USER = "@bot:localhost"
+# Commands that are answered without requests to a source
+COMMANDS = ("help", "echo load test", "react ok", "subscriptions", "metrics")
+CONFIG_TEMPLATE = """\
+command_prefix: "!c"
+matrix:
+  user_id: "{user_id}"
+  user_password: "password"
+  homeserver_url: "http://localhost"
+  device_id: LOADGEN
+storage:
+  database: "sqlite://{path}/bot.db"
+  store_path: "{path}/store"
+logging:
+  level: CRITICAL
+murdock:
+  crontab: "0 8 * * *"
+  branches: []
+  nightlies_url: "http://localhost/{{branch}}/nightlies.json"
+  result_url: "http://localhost/{{branch}}/{{commit}}/output.html"
+  commit_url: "http://localhost/{{commit}}"
+  github:
+    org: RIOT-OS
+    repo: RIOT
+"""
+
+
+class FakeClient:
+    """Stands in for the `AsyncClient` of the bot, answering every request after
+    `latency` seconds.
+    """
+
+    def __init__(self, user: str = BOT_USER, latency: float = 0):
+        self.user = user
+        self.user_id = user
+        self.latency = latency
+        self.rooms: Dict[str, MatrixRoom] = {}
+        self.sent = 0
+        self.joined = 0
+        # the latest event sent to a room, by room
+        self.last_sent: Dict[str, str] = {}
+
+    async def _respond(self) -> None:
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+    async def room_send(
+        self,
+        room_id: str,
+        message_type: str,
+        content: Dict[Any, Any],
+        tx_id: Optional[str] = None,
+        ignore_unverified_devices: bool = False,
+    ) -> RoomSendResponse:
+        await self._respond()
+        self.sent += 1
+        event_id = f"${uuid.uuid4().hex}"
+        self.last_sent[room_id] = event_id
+        return RoomSendResponse(event_id, room_id)
+
+    async def join(self, room_id: str) -> JoinResponse:
+        await self._respond()
+        self.joined += 1
+        return JoinResponse(room_id)
+
+
+class LoadReport(NamedTuple):
+    events: int
+    duration: float
+    # handler latencies in seconds
+    p50: float
+    p99: float
+    max_latency: float
+    # how far processing lagged behind the arrival of the sync batches, in
+    # seconds; a growing lag means the bot falls behind
+    max_lag: float
+    final_lag: float
+    # growth of the memory allocated by Python, None if not tracked
+    memory_growth: Optional[int]
+
+    @property
+    def events_per_sec(self) -> float:
+        return self.events / self.duration if self.duration else 0.0
+
+    def __str__(self):
+        lines = [
+            f"events:         {self.events}",
+            f"events/sec:     {self.events_per_sec:.1f}",
+            f"latency p50:    {self.p50 * 1000:.2f} ms",
+            f"latency p99:    {self.p99 * 1000:.2f} ms",
+            f"latency max:    {self.max_latency * 1000:.2f} ms",
+            f"lag max:        {self.max_lag * 1000:.2f} ms",
+            f"lag at the end: {self.final_lag * 1000:.2f} ms",
+        ]
+        if self.memory_growth is not None:
+            lines.append(f"memory growth:  {self.memory_growth / 1024:.1f} KiB")
+        return "\n".join(lines)
+
+
+class LoadGenerator:
+    """Generates the events of busy rooms and feeds them to `Callbacks`
+
+    Args:
+        rooms: The number of rooms.
+
+        room_size: The number of members of every room.
+
+        command_ratio: The fraction of messages that are commands for the bot.
+
+        invite_ratio: The fraction of events that are invites.
+
+        megolm_ratio: The fraction of events that failed to decrypt.
+
+        reaction_ratio: The fraction of events that are reactions. Half of them
+            react to messages of the bot.
+
+        rate: Events per second, 0 to generate them as fast as they are
+            handled.
+
+        batch_size: The number of events per sync.
+
+        seed: The seed of the random numbers, to reproduce a run.
+    """
+
+    def __init__(
+        self,
+        rooms: int = 10,
+        room_size: int = 20,
+        command_ratio: float = 0.1,
+        invite_ratio: float = 0.01,
+        megolm_ratio: float = 0.01,
+        reaction_ratio: float = 0.05,
+        rate: float = 0,
+        batch_size: int = 10,
+        seed: Optional[int] = None,
+    ):
+        self.command_ratio = command_ratio
+        self.invite_ratio = invite_ratio
+        self.megolm_ratio = megolm_ratio
+        self.reaction_ratio = reaction_ratio
+        self.rate = rate
+        self.batch_size = batch_size
+        self.random = random.Random(seed)
+        self.rooms = [self._make_room(i, room_size) for i in range(rooms)]
+        self._counter = 0
+
+    @staticmethod
+    def _make_room(index: int, size: int) -> MatrixRoom:
+        room = MatrixRoom(f"!load{index}:localhost", BOT_USER)
+        room.add_member(BOT_USER, "bot", None)
+        for member in range(size - 1):
+            room.add_member(f"@user{member}:localhost", f"user{member}", None)
+        return room
+
+    def _source(self, room: MatrixRoom, event_type: str, content: Dict) -> Dict:
+        self._counter += 1
+        return {
+            "type": event_type,
+            "event_id": f"$load{self._counter}",
+            "sender": self.random.choice(
+                [user for user in room.users if user != BOT_USER] or [BOT_USER]
+            ),
+            "origin_server_ts": int(time.time() * 1000),
+            "room_id": room.room_id,
+            "content": content,
+        }
+
+    def _message(self, room):
+        if self.random.random() < self.command_ratio:
+            body = "!c " + self.random.choice(COMMANDS)
+        else:
+            body = "hello world" if self.random.random() < 0.1 else "chatter"
+        return "message", RoomMessageText.from_dict(
+            self._source(room, "m.room.message", {"msgtype": "m.text", "body": body})
+        )
+
+    def _invite(self, room):
+        source = self._source(room, "m.room.member", {"membership": "invite"})
+        source["state_key"] = BOT_USER
+        return "invite", InviteMemberEvent.from_dict(source)
+
+    def _megolm(self, room):
+        return "decryption_failure", MegolmEvent.from_dict(
+            self._source(
+                room,
+                "m.room.encrypted",
+                {
+                    "algorithm": "m.megolm.v1.aes-sha2",
+                    "ciphertext": "AwgAEnAC",
+                    "device_id": "DEVICE",
+                    "sender_key": "sender-key",
+                    "session_id": "session",
+                },
+            )
+        )
+
+    def _reaction(self, room, own_events):
+        if own_events.get(room.room_id) and self.random.random() < 0.5:
+            reacted_to = own_events[room.room_id]
+        else:
+            reacted_to = f"$load{self.random.randint(1, max(self._counter, 1))}"
+        source = self._source(
+            room,
+            "m.reaction",
+            {
+                "m.relates_to": {
+                    "event_id": reacted_to,
+                    "key": "👍",
+                    "rel_type": "m.annotation",
+                }
+            },
+        )
+        return "unknown", UnknownEvent(source, "m.reaction")
+
+    def events(
+        self, own_events: Optional[Dict[str, str]] = None
+    ) -> Iterator[Tuple[str, MatrixRoom, Any]]:
+        """Generate (callback name, room, event) endlessly
+
+        Args:
+            own_events: The latest event the bot sent to a room, by room, to
+                react to.
+        """
+        own_events = own_events if own_events is not None else {}
+        while True:
+            room = self.random.choice(self.rooms)
+            draw = self.random.random()
+            if draw < self.invite_ratio:
+                name, event = self._invite(room)
+            elif draw < self.invite_ratio + self.megolm_ratio:
+                name, event = self._megolm(room)
+            elif draw < self.invite_ratio + self.megolm_ratio + self.reaction_ratio:
+                name, event = self._reaction(room, own_events)
+            else:
+                name, event = self._message(room)
+            yield name, room, event
+
+    async def run(
+        self, callbacks: Callbacks, count: int, track_memory: bool = False
+    ) -> LoadReport:
+        """Dispatch `count` events to `callbacks` in sync batches. With a
+        command pool, the run lasts until the pool ran all commands.
+
+        Args:
+            callbacks: The callbacks to load.
+
+            count: The number of events.
+
+            track_memory: Whether to measure the memory growth with tracemalloc,
+                which slows the handlers down.
+        """
+        if track_memory:
+            tracemalloc.start()
+            memory_before = tracemalloc.get_traced_memory()[0]
+        latencies: List[float] = []
+        lags: List[float] = []
+        events = self.events(getattr(callbacks.client, "last_sent", None))
+        if callbacks.pool is not None:
+            callbacks.pool.start()
+        start = time.perf_counter()
+        try:
+            for batch_start in range(0, count, self.batch_size):
+                if self.rate:
+                    due = start + batch_start / self.rate
+                    now = time.perf_counter()
+                    if now < due:
+                        await asyncio.sleep(due - now)
+                    lags.append(max(time.perf_counter() - due, 0.0))
+                for _ in range(min(self.batch_size, count - batch_start)):
+                    name, room, event = next(events)
+                    event_start = time.perf_counter()
+                    await getattr(callbacks, name)(room, event)
+                    latencies.append(time.perf_counter() - event_start)
+            if callbacks.pool is not None:
+                await callbacks.pool.join()
+            duration = time.perf_counter() - start
+        finally:
+            if callbacks.pool is not None:
+                await callbacks.pool.stop()
+            memory_growth = None
+            if track_memory:
+                memory_growth = tracemalloc.get_traced_memory()[0] - memory_before
+                tracemalloc.stop()
+        latency = np.asarray(latencies)
+        return LoadReport(
+            events=count,
+            duration=duration,
+            p50=float(np.percentile(latency, 50)) if count else 0.0,
+            p99=float(np.percentile(latency, 99)) if count else 0.0,
+            max_latency=float(latency.max()) if count else 0.0,
+            max_lag=max(lags, default=0.0),
+            final_lag=lags[-1] if lags else 0.0,
+            memory_growth=memory_growth,
+        )
+
+
+def make_callbacks(
+    directory: str,
+    latency: float = 0,
+    config_path: Optional[str] = None,
+    pool: bool = False,
+) -> Callbacks:
+    """Set up `Callbacks` with a `FakeClient` and a database in `directory`
+
+    Args:
+        directory: Where to keep the store and the database.
+
+        latency: Seconds the fake homeserver takes to answer.
+
+        config_path: A config file to use instead of a minimal one.
+
+        pool: Whether to run the commands on a `CommandPool`, like the bot
+            does, instead of in the callbacks.
+    """
+    if config_path is None:
+        config_path = os.path.join(directory, "config.yaml")
+        with open(config_path, "w") as config_file:
+            config_file.write(CONFIG_TEMPLATE.format(user_id=BOT_USER, path=directory))
+    config = Config(config_path)
+    store = Storage(
+        config.database,
+        processed_events_window=config.processed_events_window,
+        processed_events_capacity=config.processed_events_capacity,
+    )
+    sent_events.configure(config.sent_events_size)
+    command_pool = None
+    if pool:
+        command_pool = CommandPool(
+            config.command_workers, config.command_queue_size, config.command_timeout
+        )
+    return Callbacks(
+        FakeClient(config.user_id, latency), store, config, pool=command_pool
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load Callbacks with synthetic events")
+    parser.add_argument("--rooms", type=int, default=10)
+    parser.add_argument("--room-size", type=int, default=20)
+    parser.add_argument("--events", type=int, default=1000)
+    parser.add_argument("--rate", type=float, default=0, help="events/sec, 0: max")
+    parser.add_argument("--batch-size", type=int, default=10)
+    parser.add_argument("--command-ratio", type=float, default=0.1)
+    parser.add_argument("--invite-ratio", type=float, default=0.01)
+    parser.add_argument("--megolm-ratio", type=float, default=0.01)
+    parser.add_argument("--reaction-ratio", type=float, default=0.05)
+    parser.add_argument("--latency", type=float, default=0, help="of the homeserver")
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--config", help="config file, defaults to a minimal one")
+    parser.add_argument("--no-memory", action="store_true", help="skip tracemalloc")
+    parser.add_argument(
+        "--pool", action="store_true", help="run the commands on a command pool"
+    )
+    args = parser.parse_args()
+
+    generator = LoadGenerator(
+        rooms=args.rooms,
+        room_size=args.room_size,
+        command_ratio=args.command_ratio,
+        invite_ratio=args.invite_ratio,
+        megolm_ratio=args.megolm_ratio,
+        reaction_ratio=args.reaction_ratio,
+        rate=args.rate,
+        batch_size=args.batch_size,
+        seed=args.seed,
+    )
+    with tempfile.TemporaryDirectory() as directory:
+        callbacks = make_callbacks(directory, args.latency, args.config, args.pool)
+        report = asyncio.run(
+            generator.run(callbacks, args.events, track_memory=not args.no_memory)
+        )
+    print(report)
+
+
+if __name__ == "__main__":
+    main()
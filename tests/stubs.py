@@ -0,0 +1,390 @@
+# Local stand-ins for the nightlies feed, the GitHub API and the homeserver.
+#
+# A `StubServer` replays a `Recording` of the responses of an upstream server.
+# With an `upstream`, it forwards all requests to it instead and records the
+# responses, so recordings can be made by pointing the bot at a recording stub:
+#
+#     python -m tests.stubs record https://ci.riot-os.org tests/recordings/x.json
+#
+# and replayed for load tests of the whole bot, e.g. with injected latency and
+# errors:
+#
+#     python -m tests.stubs replay tests/recordings/x.json --latency 0.2 \
+#         --error-rate 0.1
+import argparse
+import asyncio
+import base64
+import json
+import random
+import threading
+import time
+import uuid
+from typing import Any, Dict, List, Optional, Tuple
+
+import aiohttp
+from aiohttp import web
+
+# Recorded bodies contain this placeholder instead of the URL of the upstream
+# server, so URLs in responses, e.g. of artifacts, point to the replaying stub.
+BASE_URL_PLACEHOLDER = "{{base_url}}"
+# Headers that describe the transfer of a response rather than the response
+HOP_HEADERS = {
+    "connection",
+    "content-encoding",
+    "content-length",
+    "date",
+    "keep-alive",
+    "server",
+    "transfer-encoding",
+}
+
+
+def _strip(path: str) -> str:
+    return path.split("?")[0]
+
+
+class Recording:
+    """The responses of a server, by method and path (with query string).
+
+    Requests are answered with the responses recorded for them in order. The
+    last one is repeated once the others were replayed.
+    """
+
+    def __init__(self, exchanges: Optional[List[Dict[str, Any]]] = None):
+        self.exchanges = exchanges or []
+        self._replayed: Dict[Tuple[str, str], int] = {}
+
+    @classmethod
+    def load(cls, path: str) -> "Recording":
+        with open(path) as recording_file:
+            return cls(json.load(recording_file)["exchanges"])
+
+    def save(self, path: str) -> None:
+        with open(path, "w") as recording_file:
+            json.dump({"exchanges": self.exchanges}, recording_file, indent=2)
+            recording_file.write("\n")
+
+    def add(
+        self,
+        method: str,
+        path: str,
+        status: int,
+        headers: Dict[str, str],
+        body: bytes,
+        upstream: str = "",
+    ) -> None:
+        response = {"status": status, "headers": headers}
+        try:
+            text = body.decode()
+        except UnicodeDecodeError:
+            response["body_base64"] = base64.b64encode(body).decode()
+        else:
+            if upstream:
+                text = text.replace(upstream.rstrip("/"), BASE_URL_PLACEHOLDER)
+            response["body"] = text
+        self.exchanges.append({"method": method, "path": path, "response": response})
+
+    def lookup(
+        self, method: str, path: str, base_url: str = "", repeat: bool = True
+    ) -> Optional[Tuple[int, Dict[str, str], bytes]]:
+        """Get the next response to a request, None if none was recorded.
+
+        Requests with a query string that was never recorded are answered with
+        the responses to the same path with any query string, e.g. `/sync` with
+        the token of the next batch. Without `repeat`, None is returned once
+        all responses were replayed.
+        """
+        for key, strip in (((method, path), False), ((method, _strip(path)), True)):
+            responses = [
+                exchange["response"]
+                for exchange in self.exchanges
+                if exchange["method"] == method
+                and (_strip(exchange["path"]) if strip else exchange["path"]) == key[1]
+            ]
+            if responses:
+                break
+        else:
+            return None
+        index = self._replayed.get(key, 0)
+        self._replayed[key] = index + 1
+        if not repeat and index >= len(responses):
+            return None
+        response = responses[min(index, len(responses) - 1)]
+        if "body_base64" in response:
+            body = base64.b64decode(response["body_base64"])
+        else:
+            body = response["body"].replace(BASE_URL_PLACEHOLDER, base_url).encode()
+        return response["status"], response["headers"], body
+
+
+class StubServer:
+    """An aiohttp server, running in a thread of its own, that replays a
+    recording or records the responses of an upstream server.
+
+    Args:
+        recording: The responses to replay or to record to.
+
+        upstream: The base URL of the server to forward requests to, to record
+            them.
+
+        latency: Seconds to delay every response.
+
+        jitter: The maximum of a random number of seconds added to the delay.
+
+        error_rate: The probability of answering a request with `error_status`
+            instead.
+
+        error_status: The status of injected errors.
+
+        seed: The seed of the random numbers, to reproduce a run.
+    """
+
+    def __init__(
+        self,
+        recording: Optional[Recording] = None,
+        upstream: Optional[str] = None,
+        latency: float = 0,
+        jitter: float = 0,
+        error_rate: float = 0,
+        error_status: int = 503,
+        seed: Optional[int] = None,
+    ):
+        self.recording = recording if recording is not None else Recording()
+        self.upstream = upstream
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.random = random.Random(seed)
+        # (method, path) of all requests received, for assertions
+        self.requests: List[Tuple[str, str]] = []
+        self.url = ""
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, daemon=True)
+        self._runner: Optional[web.AppRunner] = None
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    def routes(self) -> List[web.RouteDef]:
+        """Routes answered by the stub itself instead of the recording"""
+        return []
+
+    def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        """Start serving, by default on a free port, and return the base URL"""
+        self._thread.start()
+        asyncio.run_coroutine_threadsafe(self._start(host, port), self._loop).result()
+        return self.url
+
+    async def _start(self, host, port):
+        app = web.Application(middlewares=[self._inject])
+        app.add_routes(self.routes())
+        app.router.add_route("*", "/{path:.*}", self._handle)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        sockname = self._runner.addresses[0]
+        self.url = f"http://{sockname[0]}:{sockname[1]}"
+        if self.upstream:
+            self._session = aiohttp.ClientSession(auto_decompress=True)
+
+    def stop(self) -> None:
+        asyncio.run_coroutine_threadsafe(self._stop(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+
+    async def _stop(self):
+        if self._session:
+            await self._session.close()
+        await self._runner.cleanup()
+
+    def __enter__(self) -> "StubServer":
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.stop()
+
+    @web.middleware
+    async def _inject(self, request, handler):
+        self.requests.append((request.method, request.path_qs))
+        delay = self.latency + self.random.uniform(0, self.jitter)
+        if delay:
+            await asyncio.sleep(delay)
+        if self.random.random() < self.error_rate:
+            return web.json_response(
+                {"message": "injected error"}, status=self.error_status
+            )
+        return await handler(request)
+
+    async def _handle(self, request: web.Request) -> web.StreamResponse:
+        if self.upstream:
+            return await self._forward(request)
+        response = self.recording.lookup(request.method, request.path_qs, self.url)
+        if response is None:
+            return web.json_response(
+                {"message": f"{request.method} {request.path_qs} was not recorded"},
+                status=404,
+            )
+        status, headers, body = response
+        return web.Response(status=status, headers=headers, body=body)
+
+    async def _forward(self, request):
+        headers = {
+            name: value
+            for name, value in request.headers.items()
+            if name.lower() not in HOP_HEADERS and name.lower() != "host"
+        }
+        async with self._session.request(
+            request.method,
+            self.upstream.rstrip("/") + request.path_qs,
+            headers=headers,
+            data=await request.read(),
+            allow_redirects=False,
+        ) as upstream_response:
+            body = await upstream_response.read()
+            headers = {
+                name: value
+                for name, value in upstream_response.headers.items()
+                if name.lower() not in HOP_HEADERS
+            }
+        self.recording.add(
+            request.method,
+            request.path_qs,
+            upstream_response.status,
+            headers,
+            body,
+            self.upstream,
+        )
+        location = headers.get("Location", "")
+        if location.startswith(self.upstream.rstrip("/")):
+            headers["Location"] = self.url + location[len(self.upstream.rstrip("/")) :]
+        return web.Response(status=upstream_response.status, headers=headers, body=body)
+
+
+class MatrixStub(StubServer):
+    """A stand-in for a homeserver. Logins, sends and joins are answered by
+    the stub, the messages sent are collected in `sent`. `/sync` replays the
+    recorded syncs, followed by empty syncs that wait for at most
+    `sync_timeout` seconds. The rooms in `encrypted` have an encryption state
+    event.
+    """
+
+    def __init__(self, *args, user_id="@bot:localhost", sync_timeout=0.1, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.user_id = user_id
+        self.sync_timeout = sync_timeout
+        # (room id, event type, content) of all messages sent
+        self.sent: List[Tuple[str, str, Dict[str, Any]]] = []
+        self.joined: List[str] = []
+        self.encrypted: List[str] = []
+
+    def routes(self):
+        prefix = "/_matrix/client/{version}"
+        return [
+            web.post(prefix + "/login", self._login),
+            web.get(prefix + "/sync", self._sync),
+            web.put(prefix + "/rooms/{room_id}/send/{type}/{txn_id}", self._send),
+            web.post(prefix + "/join/{room_id}", self._join),
+            web.post(prefix + "/rooms/{room_id}/join", self._join),
+            web.get(prefix + "/joined_rooms", self._joined_rooms),
+            web.get(prefix + "/rooms/{room_id}/state/{type}/", self._state),
+            web.get(prefix + "/rooms/{room_id}/state/{type}", self._state),
+        ]
+
+    async def _login(self, request):
+        body = await request.json()
+        return web.json_response(
+            {
+                "user_id": self.user_id,
+                "access_token": "stub-token",
+                "device_id": body.get("device_id") or "STUBDEVICE",
+            }
+        )
+
+    async def _sync(self, request):
+        if self.upstream:
+            return await self._forward(request)
+        response = self.recording.lookup(
+            request.method, request.path, self.url, repeat=False
+        )
+        if response is not None:
+            status, headers, body = response
+            return web.Response(status=status, headers=headers, body=body)
+        timeout = int(request.query.get("timeout", 0)) / 1000
+        await asyncio.sleep(min(timeout, self.sync_timeout))
+        return web.json_response({"next_batch": "stub-{}".format(time.monotonic())})
+
+    async def _send(self, request):
+        self.sent.append(
+            (
+                request.match_info["room_id"],
+                request.match_info["type"],
+                await request.json(),
+            )
+        )
+        return web.json_response({"event_id": f"${uuid.uuid4().hex}"})
+
+    async def _join(self, request):
+        room_id = request.match_info["room_id"]
+        self.joined.append(room_id)
+        return web.json_response({"room_id": room_id})
+
+    async def _joined_rooms(self, request):
+        return web.json_response({"joined_rooms": self.joined})
+
+    async def _state(self, request):
+        room_id = request.match_info["room_id"]
+        if request.match_info["type"] == "m.room.encryption" and (
+            room_id in self.encrypted
+        ):
+            return web.json_response({"algorithm": "m.megolm.v1.aes-sha2"})
+        return web.json_response(
+            {"errcode": "M_NOT_FOUND", "error": "Event not found."}, status=404
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    record = subparsers.add_parser("record", help="record the responses of a server")
+    record.add_argument("upstream", help="base URL of the server to record")
+    record.add_argument("recording", help="file to save the recording to")
+    replay = subparsers.add_parser("replay", help="replay a recording")
+    replay.add_argument("recording", help="file of the recording")
+    replay.add_argument("--matrix", action="store_true", help="act as homeserver")
+    replay.add_argument("--latency", type=float, default=0)
+    replay.add_argument("--jitter", type=float, default=0)
+    replay.add_argument("--error-rate", type=float, default=0)
+    replay.add_argument("--error-status", type=int, default=503)
+    replay.add_argument("--seed", type=int)
+    for subparser in (record, replay):
+        subparser.add_argument("--host", default="127.0.0.1")
+        subparser.add_argument("--port", type=int, default=0)
+    args = parser.parse_args()
+
+    if args.command == "record":
+        stub = StubServer(upstream=args.upstream)
+    else:
+        stub = (MatrixStub if args.matrix else StubServer)(
+            Recording.load(args.recording),
+            latency=args.latency,
+            jitter=args.jitter,
+            error_rate=args.error_rate,
+            error_status=args.error_status,
+            seed=args.seed,
+        )
+    print("Serving on", stub.start(args.host, args.port))
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stub.stop()
+        if args.command == "record":
+            stub.recording.save(args.recording)
+            print(f"Recorded {len(stub.recording.exchanges)} responses")
+
+
+if __name__ == "__main__":
+    main()
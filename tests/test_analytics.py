@@ -0,0 +1,136 @@
+import asyncio
+
+import numpy as np
+
+from murdock_nio_bot import junit, offload
+from murdock_nio_bot.analytics import (
+    analyse,
+    analyse_nightlies,
+    analyse_tests,
+    find_flaky_tests,
+)
+from murdock_nio_bot.metrics import metrics
+
+from tests.test_storage import make_storage
+
+
+def test_analyse():
+    analysis = analyse(
+        ["master", "master", "release", "master", "master", "release"],
+        [1, 2, 1, 4, 3, 2],
+        [True, True, False, True, False, True],
+    )
+    assert list(analysis.keys) == ["master", "release"]
+    assert list(analysis.runs) == [4, 2]
+    assert list(analysis.failures) == [3, 1]
+    # master: failed, failed, passed, failed
+    assert list(analysis.flips) == [2, 1]
+    assert list(analysis.longest_streak) == [2, 1]
+    assert list(analysis.current_streak) == [1, 1]
+    assert list(analysis.failure_rate) == [0.75, 0.5]
+    assert list(analysis.flip_rate) == [2 / 3, 1.0]
+
+
+def test_analyse_empty():
+    analysis = analyse([], [], [])
+    assert len(analysis.keys) == 0
+    assert len(analysis.flakiest(5)) == 0
+
+
+def test_flakiest():
+    rng = np.random.default_rng(0)
+    tests, runs = 1000, 365
+    keys = np.repeat(np.arange(tests), runs)
+    timestamps = np.tile(np.arange(runs), tests)
+    # test case i fails with a probability of i / 2000
+    failed = rng.random(tests * runs) < keys / (2 * tests)
+    analysis = analyse(keys, timestamps, failed)
+    flakiest = analysis.flakiest(5)
+    assert len(flakiest) == 5
+    assert all(analysis.keys[flakiest] > tests // 2)
+    # test case 0 never fails, so it is not flaky
+    assert 0 not in analysis.flakiest(tests)
+
+
+def make_outcomes(results):
+    outcomes = junit.RunOutcomes()
+    for name, failed in results:
+        outcomes.add(junit.TestCase("", name, failed))
+    return outcomes
+
+
+def test_find_flaky_tests(tmp_path):
+    store = make_storage(tmp_path, history_retention=10 ** 10)
+    for run_id in range(1, 11):
+        store.add_test_run(
+            "RIOT",
+            "release-tests",
+            run_id,
+            run_id,
+            make_outcomes(
+                (
+                    ("native.tests_xtimer.test", run_id % 2 == 0),
+                    ("native.tests_xtimer.flash", run_id > 8),
+                    ("native.tests_xtimer.compile", False),
+                )
+            ),
+        )
+    assert store.has_test_results("RIOT", 10)
+    assert not store.has_test_results("RIOT", 11)
+    analysis = asyncio.run(analyse_tests(store, "RIOT", "release-tests"))
+    assert len(analysis.keys) == 3
+    flaky = asyncio.run(
+        find_flaky_tests(store, "RIOT", ["release-tests"], since=0, limit=5)
+    )
+    assert [(t.name, t.runs, t.failures, t.flips) for t in flaky] == [
+        ("native.tests_xtimer.test", 10, 5, 9),
+        ("native.tests_xtimer.flash", 10, 2, 1),
+    ]
+    assert (
+        asyncio.run(
+            find_flaky_tests(store, "RIOT", ["release-tests"], since=11, limit=5)
+        )
+        == []
+    )
+    # only the names of test cases that failed are kept
+    assert (
+        store.get_test_case_names([junit.test_case_id("native.tests_xtimer.compile")])
+        == {}
+    )
+
+
+def test_analyse_tests_offloaded(tmp_path, mocker):
+    store = make_storage(tmp_path, history_retention=10 ** 10)
+    mocker.patch("murdock_nio_bot.offload.threshold", 0)
+    store.add_test_run(
+        "RIOT", "release-tests", 1, 1, make_outcomes([("native.test", True)])
+    )
+    analysis = asyncio.run(analyse_tests(store, "RIOT", "release-tests"))
+    assert list(analysis.failures) == [1]
+    assert metrics.get("offloaded_calls_total", function="analyse_test_runs") >= 1
+
+
+def test_find_flaky_tests_processes(tmp_path):
+    """The analyses can be offloaded to processes, so their inputs pickle"""
+    store = make_storage(tmp_path, history_retention=10 ** 10)
+    for run_id in range(1, 5):
+        store.add_test_run(
+            "RIOT",
+            "release-tests",
+            run_id,
+            run_id,
+            make_outcomes([("native.test", run_id % 2 == 0)]),
+        )
+    store.add_nightly_results(
+        [("RIOT", "master", f"{ts:040x}", "errored", ts) for ts in range(3)]
+    )
+    offload.configure(0, processes=1)
+    try:
+        flaky = asyncio.run(
+            find_flaky_tests(store, "RIOT", ["release-tests"], since=0, limit=5)
+        )
+        nightlies = asyncio.run(analyse_nightlies(store, "RIOT", "master"))
+    finally:
+        offload.configure(64 * 1024)
+    assert [(t.name, t.flips) for t in flaky] == [("native.test", 3)]
+    assert list(nightlies.failures) == [3]
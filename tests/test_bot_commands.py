@@ -0,0 +1,37 @@
+import asyncio
+
+from murdock_nio_bot.bot_commands import Command
+
+from tests.test_storage import make_storage
+from tests.test_worker import make_source
+
+
+def test_subscribe(tmp_path, mocker):
+    send = mocker.patch(
+        "murdock_nio_bot.bot_commands.send_text_to_room", return_value=None
+    )
+    store = make_storage(tmp_path, history_retention=10 ** 10)
+    store.add_workflow_run_results(
+        [("RIOT", "release-tests", 1, "c89739f7f0", "2022.01-branch", "success", 5)]
+    )
+    config = mocker.Mock(sources=[make_source("RIOT")])
+    room = mocker.Mock(room_id="!room:example.com")
+
+    def subscribe(branch):
+        command = Command(
+            mocker.Mock(), store, config, f"subscribe {branch}", room, mocker.Mock()
+        )
+        asyncio.run(command.process())
+        return send.call_args.args[2]
+
+    assert subscribe("mastr").startswith("Unknown branch 'mastr' of `RIOT`")
+    assert store.get_room_subscriptions("!room:example.com") == []
+    # the branches of the nightlies and of the recorded workflow runs are known
+    subscribe("master")
+    subscribe("2022.01-branch")
+    subscribe("*")
+    assert sorted(store.get_room_subscriptions("!room:example.com")) == [
+        ("RIOT", "*"),
+        ("RIOT", "2022.01-branch"),
+        ("RIOT", "master"),
+    ]
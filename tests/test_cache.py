@@ -0,0 +1,99 @@
+import io
+import os
+import time
+
+from murdock_nio_bot.cache import BloomFilter, FileCache, LRUCache
+
+
+def test_lru_cache():
+    cache = LRUCache(2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1
+    cache.put("c", 3)
+    # "b" was least recently used
+    assert "b" not in cache
+    assert list(cache) == ["a", "c"]
+    assert cache.get("b", "default") == "default"
+
+
+def test_bloom_filter():
+    bloom = BloomFilter(1000, error_rate=0.01)
+    for i in range(1000):
+        bloom.add(f"$event{i}")
+    assert all(f"$event{i}" in bloom for i in range(1000))
+    false_positives = sum(f"$other{i}" in bloom for i in range(1000))
+    assert false_positives < 50
+
+
+def test_file_cache_fetch(tmp_path):
+    cache = FileCache(str(tmp_path), max_bytes=1024)
+    downloads = []
+
+    def download(fileobj):
+        downloads.append(1)
+        fileobj.write(b"artifact")
+
+    for _ in range(2):
+        with cache.fetch("artifact/1234", download) as cached:
+            assert cached.read() == b"artifact"
+    assert len(downloads) == 1
+
+    # the cache survives a restart
+    with FileCache(str(tmp_path), max_bytes=1024).open("artifact/1234") as cached:
+        assert cached.read() == b"artifact"
+
+
+def test_file_cache_hits_write_lazily(tmp_path, mocker):
+    cache = FileCache(str(tmp_path), max_bytes=1024, index_save_interval=60)
+    cache.put("artifact/1234", io.BytesIO(b"artifact"))
+    monotonic = mocker.patch(
+        "murdock_nio_bot.cache.time.monotonic", return_value=time.monotonic()
+    )
+    save_index = mocker.spy(cache, "_save_index")
+    for _ in range(3):
+        cache.open("artifact/1234").close()
+    save_index.assert_not_called()
+    monotonic.return_value += 60
+    cache.open("artifact/1234").close()
+    assert save_index.call_count == 1
+    # nothing to write, as no entry was used since
+    cache.flush()
+    assert save_index.call_count == 1
+    cache.open("artifact/1234").close()
+    cache.flush()
+    assert save_index.call_count == 2
+
+
+def test_file_cache_content_addressed(tmp_path):
+    cache = FileCache(str(tmp_path), max_bytes=1024)
+    cache.put("result/master/abc", io.BytesIO(b"same"))
+    cache.put("result/2023.01-branch/abc", io.BytesIO(b"same"))
+    assert cache.size == 4
+    assert len(os.listdir(str(tmp_path / "blobs"))) == 1
+
+
+def test_file_cache_eviction(tmp_path, mocker):
+    cache = FileCache(str(tmp_path), max_bytes=10)
+    clock = mocker.patch("murdock_nio_bot.cache.time.time", return_value=1)
+    cache.put("a", io.BytesIO(b"aaaa"))
+    clock.return_value = 2
+    cache.put("b", io.BytesIO(b"bbbb"))
+    clock.return_value = 3
+    cache.open("a").close()
+    clock.return_value = 4
+    cache.put("c", io.BytesIO(b"cccc"))
+    # "b" was least recently used
+    assert "a" in cache
+    assert "b" not in cache
+    assert "c" in cache
+    assert cache.size == 8
+    assert len(os.listdir(str(tmp_path / "blobs"))) == 2
+
+
+def test_file_cache_too_large(tmp_path):
+    cache = FileCache(str(tmp_path), max_bytes=2)
+    with cache.fetch("large", lambda fileobj: fileobj.write(b"large")) as cached:
+        assert cached.read() == b"large"
+    assert "large" not in cache
+    assert cache.size == 0
@@ -1,9 +1,11 @@
+import asyncio
 import unittest
 from unittest.mock import Mock
 
 import nio
 
 from murdock_nio_bot.callbacks import Callbacks
+from murdock_nio_bot.chat_functions import sent_events
 from murdock_nio_bot.storage import Storage
 
 from tests.utils import make_awaitable, run_coroutine
@@ -11,14 +13,22 @@ from tests.utils import make_awaitable, run_coroutine
 
 class CallbacksTestCase(unittest.TestCase):
     def setUp(self) -> None:
+        # run_coroutine closes the event loop, so give each test a fresh one
+        asyncio.set_event_loop(asyncio.new_event_loop())
+
         # Create a Callbacks object and give it some Mock'd objects to use
         self.fake_client = Mock(spec=nio.AsyncClient)
         self.fake_client.user = "@fake_user:example.com"
 
         self.fake_storage = Mock(spec=Storage)
+        self.fake_storage.is_event_processed.return_value = False
 
         # We don't spec config, as it doesn't currently have well defined attributes
         self.fake_config = Mock()
+        self.fake_config.slow_callback_threshold = 0.5
+        self.fake_config.message_log_sample_rate = 1.0
+        self.fake_config.join_max_attempts = 3
+        self.fake_config.join_backoff_initial = 0
 
         self.callbacks = Callbacks(
             self.fake_client, self.fake_storage, self.fake_config
@@ -39,12 +49,112 @@ class CallbacksTestCase(unittest.TestCase):
         # Pretend that attempting to join a room is always successful
         self.fake_client.join.return_value = make_awaitable(None)
 
-        # Pretend that we received an invite event
-        run_coroutine(self.callbacks.invite(fake_room, fake_invite_event))
+        async def invite():
+            # Pretend that we received an invite event
+            await self.callbacks.invite(fake_room, fake_invite_event)
+            # The room is joined in the background
+            await self.callbacks.join_queue.join()
+
+        run_coroutine(invite())
 
         # Check that we attempted to join the room
         self.fake_client.join.assert_called_once_with(fake_room_id)
 
+    def test_reaction_to_own_event(self):
+        """Tests that reactions to the bot's events are handled without requests"""
+        fake_room = Mock(spec=nio.MatrixRoom)
+        fake_room.room_id = "!abcdefg:example.com"
+
+        sent_events.configure(16)
+        sent_events.add(fake_room.room_id, "$own_event")
+
+        def reaction_to(event_id):
+            fake_reaction = Mock(spec=nio.UnknownEvent)
+            fake_reaction.type = "m.reaction"
+            fake_reaction.sender = "@some_other_fake_user:example.com"
+            fake_reaction.source = {
+                "content": {
+                    "m.relates_to": {
+                        "event_id": event_id,
+                        "key": "👍",
+                        "rel_type": "m.annotation",
+                    }
+                }
+            }
+            return fake_reaction
+
+        # Reactions to events of other users are ignored
+        run_coroutine(self.callbacks.unknown(fake_room, reaction_to("$other_event")))
+        self.fake_client.room_send.assert_not_called()
+
+        asyncio.set_event_loop(asyncio.new_event_loop())
+        self.fake_client.room_send.return_value = make_awaitable(
+            nio.RoomSendResponse("$ack", fake_room.room_id)
+        )
+        run_coroutine(self.callbacks.unknown(fake_room, reaction_to("$own_event")))
+        self.fake_client.room_get_event.assert_not_called()
+        self.fake_client.room_send.assert_called_once()
+        content = self.fake_client.room_send.call_args[0][2]
+        self.assertEqual(
+            content["m.relates_to"], {"m.in_reply_to": {"event_id": "$own_event"}}
+        )
+
+    def test_message_processed_once(self):
+        """Tests that already processed messages are skipped"""
+        fake_room = Mock(spec=nio.MatrixRoom)
+        fake_room.room_id = "!abcdefg:example.com"
+        fake_room.member_count = 3
+
+        fake_message_event = Mock(spec=nio.RoomMessageText)
+        fake_message_event.event_id = "$message"
+        fake_message_event.sender = "@some_other_fake_user:example.com"
+        fake_message_event.body = "!c echo hello"
+        self.fake_config.command_prefix = "!c "
+        self.callbacks.command_prefix = "!c "
+
+        self.fake_storage.is_event_processed.return_value = True
+        run_coroutine(self.callbacks.message(fake_room, fake_message_event))
+        self.fake_storage.mark_event_processed.assert_not_called()
+        self.fake_client.room_send.assert_not_called()
+
+    def test_message_standby(self):
+        """Tests that a standby replica leaves messages to the leader"""
+        fake_room = Mock(spec=nio.MatrixRoom)
+        fake_room.room_id = "!abcdefg:example.com"
+        fake_room.member_count = 3
+
+        fake_message_event = Mock(spec=nio.RoomMessageText)
+        fake_message_event.event_id = "$message"
+        fake_message_event.sender = "@some_other_fake_user:example.com"
+        fake_message_event.body = "!c echo hello"
+        self.callbacks.command_prefix = "!c "
+        self.callbacks.leader = Mock(is_leader=False)
+
+        run_coroutine(self.callbacks.message(fake_room, fake_message_event))
+        self.fake_storage.mark_event_processed.assert_not_called()
+        self.fake_client.room_send.assert_not_called()
+
+    def test_message_pool_busy(self):
+        """Tests that a message the pool has no room for is logged by its ID"""
+        fake_room = Mock(spec=nio.MatrixRoom)
+        fake_room.room_id = "!abcdefg:example.com"
+        fake_room.member_count = 3
+
+        fake_message_event = Mock(spec=nio.RoomMessageText)
+        fake_message_event.event_id = "$message"
+        fake_message_event.sender = "@some_other_fake_user:example.com"
+        fake_message_event.body = "!c echo hello"
+        self.callbacks.command_prefix = "!c "
+        self.callbacks.pool = Mock()
+        self.callbacks.pool.submit.return_value = False
+
+        with self.assertLogs("murdock_nio_bot.callbacks", "WARNING") as logs:
+            run_coroutine(self.callbacks.message(fake_room, fake_message_event))
+        self.assertEqual(
+            logs.records[0].getMessage(),
+            "Too busy, ignored $message in !abcdefg:example.com",
+        )
+
 
 if __name__ == "__main__":
     unittest.main()
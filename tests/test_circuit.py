@@ -0,0 +1,73 @@
+import pytest
+import requests
+
+from murdock_nio_bot.circuit import CLOSED, HALF_OPEN, OPEN, CircuitBreaker
+from murdock_nio_bot.errors import CircuitOpenError, RateLimitError
+from murdock_nio_bot.metrics import metrics
+
+
+def fail():
+    raise requests.ConnectionError("unreachable")
+
+
+def test_breaker_serves_last_good(mocker):
+    breaker = CircuitBreaker("test-stale", failure_threshold=2, reset_timeout=60)
+    assert breaker.call("nightlies", lambda: ["good"]) == ["good"]
+    with pytest.raises(requests.ConnectionError):
+        breaker.call("nightlies", fail)
+    assert breaker.state == CLOSED
+    # the second failure trips the breaker
+    assert breaker.call("nightlies", fail) == ["good"]
+    assert breaker.state == OPEN
+    assert metrics.get("circuit_breaker_state", source="test-stale") == 2
+    assert metrics.get("circuit_breaker_trips_total", source="test-stale") == 1
+    # while open, nothing is sent
+    func = mocker.Mock()
+    assert breaker.call("nightlies", func) == ["good"]
+    func.assert_not_called()
+    with pytest.raises(CircuitOpenError):
+        breaker.call("runs", func)
+
+
+def test_breaker_half_open(mocker):
+    monotonic = mocker.patch("time.monotonic", return_value=0)
+    breaker = CircuitBreaker("test-half-open", failure_threshold=1, reset_timeout=60)
+    with pytest.raises(requests.ConnectionError):
+        breaker.call("nightlies", fail)
+    assert breaker.state == OPEN
+    monotonic.return_value = 61
+    # a failed trial opens the breaker again
+    with pytest.raises(requests.ConnectionError):
+        breaker.call("nightlies", fail)
+    assert breaker.state == OPEN
+    monotonic.return_value = 122
+
+    def trial():
+        assert breaker.state == HALF_OPEN
+        # concurrent calls during the trial are not sent
+        with pytest.raises(CircuitOpenError):
+            breaker.call("nightlies", fail)
+        return ["good"]
+
+    assert breaker.call("nightlies", trial) == ["good"]
+    assert breaker.state == CLOSED
+
+
+def test_breaker_ignores_rate_limit():
+    breaker = CircuitBreaker("test-rate-limit", failure_threshold=1)
+
+    def rate_limited():
+        raise RateLimitError("GitHub rate limit hit", 0)
+
+    with pytest.raises(RateLimitError):
+        breaker.call("runs", rate_limited)
+    assert breaker.state == CLOSED
+
+
+def test_metrics_render():
+    metrics.inc("test_requests_total", source="RIOT")
+    metrics.inc("test_requests_total", 2, source="RIOT")
+    metrics.set("test_queue_length", 5)
+    rendered = metrics.render().splitlines()
+    assert 'test_requests_total{source="RIOT"} 3' in rendered
+    assert "test_queue_length 5" in rendered
@@ -0,0 +1,60 @@
+import asyncio
+
+from murdock_nio_bot.command_pool import CommandPool
+from murdock_nio_bot.metrics import metrics
+
+
+def test_command_pool_order():
+    metrics.clear()
+    ran = []
+
+    def command(room_id, index, delay):
+        async def process():
+            await asyncio.sleep(delay)
+            ran.append((room_id, index))
+
+        return process
+
+    async def run():
+        pool = CommandPool(workers=2)
+        # the commands of a room run in order, even if the first one is slower
+        assert pool.submit("!a", command("!a", 0, 0.05))
+        assert pool.submit("!a", command("!a", 1, 0))
+        assert pool.submit("!b", command("!b", 0, 0))
+        await pool.join()
+        await pool.stop()
+
+    asyncio.run(run())
+    # the command of another room does not wait for the slow one
+    assert ran == [("!b", 0), ("!a", 0), ("!a", 1)]
+    assert metrics.get("commands_total", outcome="ok") == 3
+    assert metrics.get("command_execution_seconds_total") >= 0.05
+    assert metrics.get("command_queue_wait_seconds_total") >= 0.05
+
+
+def test_command_pool_timeout_and_shedding(caplog):
+    metrics.clear()
+
+    async def slow():
+        await asyncio.sleep(10)
+
+    async def failing():
+        raise ValueError("broken")
+
+    async def run():
+        pool = CommandPool(workers=1, queue_size=2, timeout=0.01)
+        assert pool.submit("!a", slow)
+        # the first command is running, so two more fit into the queue
+        await asyncio.sleep(0)
+        assert pool.submit("!a", failing)
+        assert pool.submit("!b", slow)
+        assert not pool.submit("!c", slow)
+        assert pool.queued == 2
+        await pool.join()
+        await pool.stop()
+
+    asyncio.run(run())
+    assert metrics.get("commands_total", outcome="timeout") == 2
+    assert metrics.get("commands_total", outcome="error") == 1
+    assert metrics.get("commands_shed_total") == 1
+    assert "Command in !a failed" in caplog.text
@@ -1,6 +1,9 @@
 import unittest
 from unittest.mock import Mock
 
+import pytest
+import yaml
+
 from murdock_nio_bot.config import Config
 from murdock_nio_bot.errors import ConfigError
 
@@ -77,5 +80,115 @@ class ConfigTestCase(unittest.TestCase):
     # TODO: Test creating a test yaml file, passing the path to Config and _parse_config_values is called correctly
 
 
+URLS = {
+    "nightlies_url": "https://ci.riot-os.org/RIOT-OS/RIOT/{branch}/nightlies.json",
+    "result_url": "https://ci.riot-os.org/RIOT-OS/RIOT/{branch}/{commit}/output.html",
+    "commit_url": "https://github.com/RIOT-OS/RIOT/commit/{commit}",
+}
+
+
+def write_config(tmp_path, murdock, **sections):
+    config_dict = {
+        "matrix": {
+            "user_id": "@bot:example.com",
+            "user_password": "password",
+            "homeserver_url": "https://example.com",
+            "device_id": "ABCDEFGHIJ",
+        },
+        "murdock": murdock,
+        "storage": {
+            "database": "sqlite://" + str(tmp_path / "bot.db"),
+            "store_path": str(tmp_path / "store"),
+        },
+        "logging": {"console_logging": {"enabled": False}},
+        **sections,
+    }
+    config_path = tmp_path / "config.yaml"
+    config_path.write_text(yaml.safe_dump(config_dict))
+    return str(config_path)
+
+
+def test_single_source(tmp_path):
+    config = Config(
+        write_config(
+            tmp_path,
+            {
+                "crontab": "0 8 * * *",
+                "branches": ["master"],
+                "github": {"org": "RIOT-OS", "repo": "RIOT", "token": "secret"},
+                **URLS,
+                "github_workflows": [{"name": "release-tests"}],
+            },
+        )
+    )
+    assert len(config.sources) == 1
+    source = config.sources[0]
+    assert source.name == "RIOT-OS/RIOT"
+    assert source.crontab == "0 8 * * *"
+    assert source.nightlies_branches == ["master"]
+    assert source.github_token == "secret"
+    assert source.github_workflows == [
+        {"name": "release-tests", "report_xml": False, "critical": True}
+    ]
+
+
+def test_multiple_sources(tmp_path):
+    config = Config(
+        write_config(
+            tmp_path,
+            {
+                "crontab": "0 8 * * *",
+                "sources": [
+                    dict(
+                        name="RIOT", github={"org": "RIOT-OS", "repo": "RIOT"}, **URLS
+                    ),
+                    dict(
+                        github={"org": "RIOT-OS", "repo": "riotdocker"},
+                        crontab="0 9 * * *",
+                        **URLS,
+                    ),
+                ],
+            },
+        )
+    )
+    assert [s.name for s in config.sources] == ["RIOT", "RIOT-OS/riotdocker"]
+    assert [s.crontab for s in config.sources] == ["0 8 * * *", "0 9 * * *"]
+
+
+def test_source_crontabs(tmp_path):
+    """murdock.crontab is only required by sources without their own"""
+    source = dict(
+        name="RIOT", github={"org": "RIOT-OS", "repo": "RIOT"}, crontab="0 9 * * *"
+    )
+    config = Config(write_config(tmp_path, {"sources": [dict(source, **URLS)]}))
+    assert config.crontab is None
+    assert config.sources[0].crontab == "0 9 * * *"
+    del source["crontab"]
+    with pytest.raises(ConfigError, match="Source RIOT has no crontab"):
+        Config(write_config(tmp_path, {"sources": [dict(source, **URLS)]}))
+
+
+def test_profile_signal(tmp_path):
+    murdock = dict(crontab="0 8 * * *", github={"org": "RIOT-OS", "repo": "RIOT"})
+    murdock.update(URLS)
+    config = Config(write_config(tmp_path, murdock, profiling={"signal": "SIGUSR2"}))
+    assert config.profile_signal == "SIGUSR2"
+    config = Config(write_config(tmp_path, murdock, profiling={"signal": False}))
+    assert not config.profile_signal
+    for name in ("SIGUSR", "SIGKILL", 10):
+        with pytest.raises(ConfigError, match="profiling.signal"):
+            Config(write_config(tmp_path, murdock, profiling={"signal": name}))
+
+
+def test_sources_unique(tmp_path):
+    source = dict(name="RIOT", github={"org": "RIOT-OS", "repo": "RIOT"}, **URLS)
+    with pytest.raises(ConfigError):
+        Config(
+            write_config(
+                tmp_path, {"crontab": "0 8 * * *", "sources": [source, source]}
+            )
+        )
+
+
 if __name__ == "__main__":
     unittest.main()
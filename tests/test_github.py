@@ -6,7 +6,26 @@
 #
 # Distributed under terms of the MIT license.
 
-from murdock_nio_bot.github import Workflow
+import io
+import time
+import zipfile
+
+import pytest
+
+from murdock_nio_bot.cache import FileCache
+from murdock_nio_bot.errors import GitHubError, RateLimitError
+from murdock_nio_bot.github import (
+    GITHUB_API_URL,
+    GITHUB_TOKEN,
+    RateLimitGovernor,
+    Workflow,
+    WorkflowRun,
+    _governor,
+    governor,
+)
+
+from tests.stubs import Recording, StubServer
+from tests.test_junit import JUNIT_XML
 
 
 class MockConfig:
@@ -19,6 +38,38 @@ class MockConfig:
     def github_repo(self):
         return "RIOT"
 
+    @property
+    def github_token(self):
+        return GITHUB_TOKEN
+
+    @property
+    def github_rate_limit_reserve(self):
+        return 100
+
+    @property
+    def github_api_url(self):
+        return GITHUB_API_URL
+
+    @property
+    def github_timeout(self):
+        return 30
+
+    @property
+    def download_timeout(self):
+        return 60
+
+    @property
+    def name(self):
+        return "RIOT"
+
+    @property
+    def breaker_failure_threshold(self):
+        return 3
+
+    @property
+    def breaker_reset_timeout(self):
+        return 300
+
     @property
     def github_workflows(self):
         return [
@@ -28,6 +79,7 @@ class MockConfig:
         ]
 
 
+@pytest.mark.network
 def test_fetch_workflows():
     config = MockConfig()
     workflows = Workflow.fetch_workflows(config)
@@ -42,9 +94,152 @@ def test_fetch_workflows():
         assert workflow.report_xml == exp_report_xml[workflow.name]
 
 
+@pytest.mark.network
 def test_workflow_scheduled_runs():
     config = MockConfig()
     workflow = Workflow.fetch_workflows(config)[1]
     for run in workflow.scheduled_runs:
         print(run.conclusion)
         assert isinstance(run.id, int)
+
+
+class StubConfig(MockConfig):
+    def __init__(self, url):
+        self.url = url
+
+    @property
+    def github_api_url(self):
+        return self.url
+
+    @property
+    def name(self):
+        return "RIOT-stub"
+
+
+def test_workflow_scheduled_runs_replay():
+    with StubServer(Recording.load("tests/recordings/github.json")) as stub:
+        config = StubConfig(stub.url)
+        workflows = Workflow.fetch_workflows(config)
+        assert [w.name for w in workflows] == [
+            "release-tests",
+            "test-on-iotlab",
+            "test-on-ryot",
+        ]
+        assert workflows[1].id == 9146537
+        runs = workflows[1].scheduled_runs
+    assert stub.requests == [
+        ("GET", "/repos/RIOT-OS/RIOT/actions/workflows"),
+        ("GET", "/repos/RIOT-OS/RIOT/actions/workflows/9146537/runs"),
+    ]
+    # only scheduled runs count
+    assert [run.id for run in runs] == [1345687123, 1341234567]
+    assert runs[0].conclusion == "failure"
+    assert runs[0].branch == "master"
+    assert governor is not _governor(config)
+    assert _governor(config).remaining == 4987
+
+
+def test_fetch_workflows_error():
+    recording = Recording.load("tests/recordings/github.json")
+    with StubServer(recording, error_rate=1, error_status=502) as stub:
+        with pytest.raises(GitHubError) as exc_info:
+            Workflow.fetch_workflows(StubConfig(stub.url))
+    assert exc_info.value.status == 502
+
+
+def test_governor_reserve():
+    governor = RateLimitGovernor(reserve=10)
+    assert governor.allow(critical=False)
+    reset = time.time() + 3600
+    assert not governor.update(
+        200,
+        [("X-RateLimit-Remaining", "5"), ("X-RateLimit-Reset", str(reset))],
+    )
+    assert governor.remaining == 5
+    assert governor.allow(critical=True)
+    assert not governor.allow(critical=False)
+    governor.update(200, [("X-RateLimit-Remaining", "0")])
+    assert not governor.allow(critical=True)
+    # the budget is replenished after the reset
+    governor.reset = time.time() - 1
+    assert governor.allow(critical=False)
+
+
+def test_governor_secondary_rate_limit(mocker):
+    github = mocker.patch("murdock_nio_bot.github.TimeoutGitHub").return_value
+    github.getheaders.return_value = [
+        ("X-RateLimit-Remaining", "4000"),
+        ("Retry-After", "60"),
+    ]
+    governor = RateLimitGovernor()
+    with pytest.raises(RateLimitError) as exc:
+        governor.request(lambda github: (403, {"message": "secondary rate limit"}))
+    assert exc.value.retry_at > time.time() + 50
+    # no further requests are sent until Retry-After passed
+    with pytest.raises(RateLimitError):
+        governor.request(lambda github: (200, {}))
+    assert github.getheaders.call_count == 1
+
+
+def test_workflow_deferred(mocker):
+    mocker.patch.object(governor, "retry_at", time.time() + 60)
+    store = mocker.Mock()
+    workflow = Workflow(
+        MockConfig(), "test-on-iotlab", 1234, critical=False, store=store
+    )
+    assert workflow.check_if_last_errored_or_changed_to_passed() is None
+    store.set_last_run_commit.assert_not_called()
+
+
+def test_workflow_run_failed_tests(mocker, tmp_path):
+    zip_file = io.BytesIO()
+    with zipfile.ZipFile(zip_file, "w") as archive:
+        archive.writestr("xunit.xml", JUNIT_XML)
+
+    def download(url, fileobj, critical=True, timeout=None):
+        fileobj.write(zip_file.getvalue())
+
+    mocker.patch.object(
+        governor,
+        "request",
+        return_value=(
+            200,
+            {
+                "artifacts": [
+                    {
+                        "id": 1,
+                        "archive_download_url": "https://example.org/1",
+                        "expired": False,
+                    },
+                    {
+                        "id": 2,
+                        "archive_download_url": "https://example.org/2",
+                        "expired": True,
+                    },
+                ]
+            },
+        ),
+    )
+    mocker.patch.object(governor, "download", side_effect=download)
+    cache = FileCache(str(tmp_path), max_bytes=1024 * 1024)
+    # analysing the run again uses the cached artifact
+    for _ in range(2):
+        run = WorkflowRun(
+            MockConfig(), 1234, "c89739f7f0", "failure", "https://example.org"
+        )
+        run.fetch_failed_tests(cache=cache)
+        assert [str(t) for t in run.failed_tests] == [
+            "native.tests_xtimer.test",
+            "native.tests_xtimer.flash",
+        ]
+        assert run.failed_tests_count == 2
+    governor.download.assert_called_once()
+
+
+def test_github_timeout(mocker):
+    connection = mocker.patch("agithub.base.HTTPSConnection")
+    connection.return_value.getresponse.side_effect = TimeoutError("timed out")
+    governor = RateLimitGovernor()
+    with pytest.raises(TimeoutError):
+        governor.request(lambda github: github.rate_limit.get(), timeout=5)
+    assert connection.return_value.timeout == 5
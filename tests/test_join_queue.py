@@ -0,0 +1,80 @@
+import asyncio
+
+import aiohttp
+from nio import JoinError, JoinResponse
+
+from murdock_nio_bot.join_queue import JoinQueue
+from murdock_nio_bot.metrics import metrics
+
+
+def test_join_queue(mocker):
+    metrics.clear()
+    client = mocker.Mock()
+    responses = {
+        "!ok": [JoinResponse("!ok")],
+        "!limited": [
+            JoinError("Too many requests", "M_LIMIT_EXCEEDED", retry_after_ms=30),
+            JoinError("Internal error", "M_UNKNOWN"),
+            JoinResponse("!limited"),
+        ],
+        "!forbidden": [JoinError("You are not invited", "M_FORBIDDEN")],
+        "!down": [JoinError("Bad gateway")] * 3,
+    }
+    running = []
+    max_running = []
+
+    async def join(room_id):
+        running.append(room_id)
+        max_running.append(len(running))
+        await asyncio.sleep(0.01)
+        running.remove(room_id)
+        return responses[room_id].pop(0)
+
+    client.join = join
+    on_join = mocker.AsyncMock()
+    sleep = mocker.patch("asyncio.sleep", wraps=asyncio.sleep)
+
+    async def run():
+        queue = JoinQueue(
+            client, concurrency=2, max_attempts=3, backoff_initial=0.01, on_join=on_join
+        )
+        futures = [queue.submit(room_id) for room_id in responses]
+        # a room is only joined once, however often the bot is invited
+        assert queue.submit("!ok") is futures[0]
+        await queue.join()
+        return [future.result() for future in futures]
+
+    assert asyncio.run(run()) == [True, True, False, False]
+    assert max(max_running) == 2
+    # retry_after_ms is honoured, otherwise the delay doubles with every retry
+    delays = [call.args[0] for call in sleep.call_args_list if call.args[0] != 0.01]
+    assert sorted(delays) == [0.02, 0.02, 0.03]
+    assert {call.args[0] for call in on_join.await_args_list} == {"!ok", "!limited"}
+    assert metrics.get("joins_total", outcome="joined") == 2
+    assert metrics.get("joins_total", outcome="failed") == 2
+
+
+def test_join_queue_transport_errors(mocker):
+    metrics.clear()
+    client = mocker.Mock()
+    client.join = mocker.AsyncMock(
+        side_effect=[
+            aiohttp.ClientConnectionError("Connection reset"),
+            asyncio.TimeoutError(),
+            JoinResponse("!flaky"),
+            RuntimeError("unexpected"),
+        ]
+    )
+    sleep = mocker.patch("asyncio.sleep", return_value=None)
+
+    async def run():
+        queue = JoinQueue(client, max_attempts=3, backoff_initial=1)
+        flaky = await queue.submit("!flaky")
+        # an unexpected error is not retried, but still counted
+        broken = await queue.submit("!broken")
+        return flaky, broken
+
+    assert asyncio.run(run()) == (True, False)
+    assert [call.args[0] for call in sleep.call_args_list] == [1, 2]
+    assert metrics.get("joins_total", outcome="joined") == 1
+    assert metrics.get("joins_total", outcome="failed") == 1
@@ -0,0 +1,52 @@
+import io
+import zipfile
+
+from murdock_nio_bot.junit import iter_testcases, iter_zipped_testcases
+
+JUNIT_XML = b"""<?xml version="1.0" encoding="UTF-8"?>
+<testsuites>
+  <testsuite name="tests_xtimer" tests="3">
+    <properties><property name="board" value="native"/></properties>
+    <testcase classname="native.tests_xtimer" name="compile"/>
+    <testcase classname="native.tests_xtimer" name="test">
+      <failure message="Timeout">timeout waiting for output</failure>
+      <system-out>lots of output</system-out>
+    </testcase>
+    <testcase classname="native.tests_xtimer" name="flash">
+      <error message="Board not found"/>
+    </testcase>
+  </testsuite>
+</testsuites>
+"""
+
+
+def test_iter_testcases():
+    testcases = list(iter_testcases(io.BytesIO(JUNIT_XML)))
+    assert [str(t) for t in testcases] == [
+        "native.tests_xtimer.compile",
+        "native.tests_xtimer.test",
+        "native.tests_xtimer.flash",
+    ]
+    assert [t.failed for t in testcases] == [False, True, True]
+    assert testcases[1].message == "Timeout"
+    assert testcases[2].message == "Board not found"
+
+
+def test_iter_testcases_large():
+    testcases = b"".join(
+        b'<testcase classname="native" name="test%d"><failure/></testcase>' % i
+        for i in range(10000)
+    )
+    xml = b"<testsuites><testsuite>" + testcases + b"</testsuite></testsuites>"
+    assert sum(t.failed for t in iter_testcases(io.BytesIO(xml))) == 10000
+
+
+def test_iter_zipped_testcases():
+    zip_file = io.BytesIO()
+    with zipfile.ZipFile(zip_file, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr("native/xunit.xml", JUNIT_XML)
+        archive.writestr("native/output.txt", b"not a report")
+        archive.writestr("samr21-xpro/xunit.xml", b"<testsuites><testsuite>")
+    zip_file.seek(0)
+    testcases = list(iter_zipped_testcases(zip_file))
+    assert len(testcases) == 3
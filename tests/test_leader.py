@@ -0,0 +1,37 @@
+import time
+
+from murdock_nio_bot.leader import LeaderElector
+
+from tests.test_storage import make_storage
+
+
+def test_single_leader(tmp_path):
+    first = LeaderElector(make_storage(tmp_path), "first")
+    second = LeaderElector(make_storage(tmp_path), "second")
+    assert first.try_acquire()
+    assert not second.try_acquire()
+    # renewing keeps the lease
+    assert first.try_acquire()
+    assert not second.try_acquire()
+    assert first.store.get_lease_holder("leader") == "first"
+
+
+def test_standby_takes_over(tmp_path):
+    first = LeaderElector(make_storage(tmp_path), "first", lease_duration=0.1)
+    second = LeaderElector(make_storage(tmp_path), "second", lease_duration=0.1)
+    assert first.try_acquire()
+    assert not second.try_acquire()
+    # the first replica dies and stops renewing its lease
+    time.sleep(0.2)
+    assert not first.is_leader
+    assert second.try_acquire()
+    assert not first.try_acquire()
+
+
+def test_release(tmp_path):
+    first = LeaderElector(make_storage(tmp_path), "first")
+    second = LeaderElector(make_storage(tmp_path), "second")
+    assert first.try_acquire()
+    first.release()
+    assert not first.is_leader
+    assert second.try_acquire()
@@ -0,0 +1,50 @@
+import asyncio
+
+from tests.loadgen import LoadGenerator, make_callbacks
+
+
+def test_load(tmp_path):
+    callbacks = make_callbacks(str(tmp_path))
+    generator = LoadGenerator(
+        rooms=3,
+        room_size=5,
+        command_ratio=0.5,
+        invite_ratio=0.05,
+        reaction_ratio=0.2,
+        rate=2000,
+        seed=1,
+    )
+    report = asyncio.run(generator.run(callbacks, 200, track_memory=True))
+    assert report.events == 200
+    assert report.events_per_sec > 0
+    assert 0 < report.p50 <= report.p99 <= report.max_latency
+    assert report.memory_growth is not None
+    assert callbacks.client.sent > 0
+    assert callbacks.client.joined > 0
+    # every event is marked as processed once
+    assert callbacks.store.is_event_processed("$load1")
+
+
+def test_load_pool(tmp_path):
+    def run(directory, pool):
+        callbacks = make_callbacks(str(directory), latency=0.001, pool=pool)
+        generator = LoadGenerator(
+            rooms=3,
+            room_size=5,
+            command_ratio=1.0,
+            invite_ratio=0,
+            megolm_ratio=0,
+            reaction_ratio=0,
+            seed=1,
+        )
+        report = asyncio.run(generator.run(callbacks, 50))
+        assert report.events == 50
+        return callbacks
+
+    (tmp_path / "direct").mkdir()
+    (tmp_path / "pool").mkdir()
+    direct = run(tmp_path / "direct", False)
+    pooled = run(tmp_path / "pool", True)
+    # the run lasts until the pool answered every command
+    assert pooled.client.sent == direct.client.sent
+    assert not pooled.pool._pending
@@ -0,0 +1,31 @@
+import logging
+
+from murdock_nio_bot.log import Sampler, setup_logging, stop_logging
+
+
+class ListHandler(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+
+def test_setup_logging_queue():
+    logger = logging.getLogger("test_setup_logging_queue")
+    handler = ListHandler()
+    setup_logging(logger, "INFO", [handler])
+    logger.debug("not logged")
+    logger.info("logged %s", "lazily")
+    # stopping the listener flushes the queue
+    stop_logging()
+    assert [r.getMessage() for r in handler.records] == ["logged lazily"]
+    assert not logger.handlers
+
+
+def test_sampler():
+    assert all(Sampler(1.0).sample() for _ in range(10))
+    assert not any(Sampler(0).sample() for _ in range(10))
+    sampler = Sampler(0.25)
+    assert sum(sampler.sample() for _ in range(100)) == 25
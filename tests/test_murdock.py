@@ -1,10 +1,34 @@
+import asyncio
 import datetime
+import io
 import logging
+import time
 
 import pytest
+from nio import RoomSendError, RoomSendResponse
 
+from murdock_nio_bot.analytics import FlakyTest
+from murdock_nio_bot.cache import FileCache
 from murdock_nio_bot.github import WorkflowRun
-from murdock_nio_bot.murdock import Nightlies, commit_markdown_link, generate_message
+from murdock_nio_bot.junit import iter_testcases
+from murdock_nio_bot.metrics import metrics
+from murdock_nio_bot.murdock import (
+    Nightlies,
+    commit_markdown_link,
+    generate_message,
+    generate_statistics_message,
+    record_history,
+    report_keys,
+    route_report,
+    send_live_status,
+)
+from murdock_nio_bot.result_page import iter_failed_jobs
+from murdock_nio_bot.storage import ALL_BRANCHES
+
+from tests.stubs import Recording, StubServer
+from tests.test_junit import JUNIT_XML
+from tests.test_result_page import RESULT_HTML
+from tests.test_storage import make_storage
 
 
 class MockConfig:
@@ -21,7 +45,24 @@ class MockConfig:
     def commit_url(self):
         return "https://github.com/RIOT-OS/RIOT/commit/{commit}"
 
+    @property
+    def name(self):
+        return "RIOT"
+
+    @property
+    def nightlies_timeout(self):
+        return 10
+
+    @property
+    def breaker_failure_threshold(self):
+        return 3
+
+    @property
+    def breaker_reset_timeout(self):
+        return 300
+
 
+@pytest.mark.network
 def test_get_nightlies_real(caplog):
     with caplog.at_level(logging.ERROR):
         nightlies = Nightlies(MockConfig(), "master").get_nightlies()
@@ -39,6 +80,69 @@ def test_get_nightlies_real(caplog):
         ), "unexpected log output"
 
 
+class StubConfig(MockConfig):
+    def __init__(self, url, name="RIOT-stub"):
+        self.url = url
+        self._name = name
+
+    @property
+    def nightlies_url(self):
+        return self.url + "/RIOT-OS/RIOT/{branch}/nightlies.json"
+
+    @property
+    def name(self):
+        return self._name
+
+
+def test_get_nightlies_replay():
+    with StubServer(Recording.load("tests/recordings/nightlies.json")) as stub:
+        nightlies = Nightlies(StubConfig(stub.url), "master")
+        res = nightlies.check_if_last_errored_or_changed_to_passed()
+    assert stub.requests == [("GET", "/RIOT-OS/RIOT/master/nightlies.json")]
+    assert res["commit"] == "11fadfcc9ddac1a6b5051cc93572fac6b9a9d838"
+    assert res["result"] == "errored"
+    assert res["url"] == (
+        "https://ci.riot-os.org/RIOT-OS/RIOT/master/"
+        "11fadfcc9ddac1a6b5051cc93572fac6b9a9d838/output.html"
+    )
+
+
+def test_get_nightlies_replay_errors(caplog):
+    recording = Recording.load("tests/recordings/nightlies.json")
+    with StubServer(recording, error_rate=1, error_status=502) as stub:
+        with caplog.at_level(logging.ERROR):
+            nightlies = Nightlies(StubConfig(stub.url, "RIOT-errors"), "master")
+            assert nightlies.get_nightlies() == []
+    assert "Unable to GET" in caplog.text
+
+
+def test_get_nightlies_stale_after_errored(tmp_path):
+    class FragileConfig(StubConfig):
+        @property
+        def breaker_failure_threshold(self):
+            return 1
+
+    store = make_storage(tmp_path, history_retention=int(time.time()))
+    with StubServer(Recording.load("tests/recordings/nightlies.json")) as stub:
+        config = FragileConfig(stub.url, "RIOT-stale")
+        nightlies = Nightlies(config, "master")
+        res = nightlies.check_if_last_errored_or_changed_to_passed()
+    assert res["result"] == "errored"
+    # the server is gone, so the breaker opens and serves the last good result,
+    # untouched by the check before
+    results = nightlies.get_nightlies()
+    assert results[0]["since"] == 1634252403.5
+    record_history(store, config, [nightlies], [], [results], [])
+    assert store.get_nightly_results("RIOT-stale", "master")[-1] == (
+        1634252403,
+        "11fadfcc9ddac1a6b5051cc93572fac6b9a9d838",
+        "errored",
+    )
+    stale = nightlies.check_if_last_errored_or_changed_to_passed(results)
+    assert stale["commit"] == "11fadfcc9ddac1a6b5051cc93572fac6b9a9d838"
+    assert stale["since"] == datetime.datetime.utcfromtimestamp(1634252403.5)
+
+
 def test_check_if_last__empty(mocker):
     mocker.patch("murdock_nio_bot.murdock.Nightlies.get_nightlies", return_value=[])
     res = Nightlies(MockConfig(), "master").check_if_last_errored_or_changed_to_passed()
@@ -220,3 +324,237 @@ def test_generate_message(workflows):
 
     msg = generate_message(MockConfig(), "Hello!", nightlies, workflows)
     assert msg == exp_msg
+
+
+def test_generate_message_failed_tests():
+    run = WorkflowRun(
+        MockConfig(),
+        2485316784,
+        "c89739f7f0a339ba22e8f5cc92ce74a4e0c99adc",
+        "failure",
+        "https://github.com/RIOT-OS/RIOT/actions/runs/2485316784",
+    )
+    run.failed_tests = list(iter_testcases(io.BytesIO(JUNIT_XML)))[1:]
+    run.failed_tests_count = 5
+    msg = generate_message(MockConfig(), "Hello!", [], [("release-tests", run)])
+    assert msg.endswith(
+        "- [`release-tests` workflow errored](https://github.com/RIOT-OS/RIOT/actions/runs/2485316784) on [c89739f7f0](https://github.com/RIOT-OS/RIOT/commit/c89739f7f0a339ba22e8f5cc92ce74a4e0c99adc)\n"
+        "    - `native.tests_xtimer.test` failed\n"
+        "    - `native.tests_xtimer.flash` failed\n"
+        "    - ... and 3 more failing test cases\n"
+    )
+
+
+def test_fetch_failed_jobs(mocker, tmp_path):
+    config = MockConfig()
+    config.result_max_size = 1024 * 1024
+    config.result_timeout = 30
+    response = mocker.MagicMock()
+    response.iter_content.return_value = [RESULT_HTML[:100], RESULT_HTML[100:]]
+    get = mocker.patch("requests.get")
+    get.return_value.__enter__.return_value = response
+    cache = FileCache(str(tmp_path), 1024 * 1024)
+    result = {
+        "result": "errored",
+        "url": "https://example.org/errored",
+        "commit": "f9fa7382909d4a6096a2d79c0bb4d625ff8389f8",
+    }
+    nightlies = Nightlies(config, "master")
+    nightlies.fetch_failed_jobs(result, cache)
+    assert result["failed_jobs_count"] == 3
+    assert str(result["failed_jobs"][0]) == "compile/examples/hello-world:native:gnu"
+    # the result page of a commit is only fetched once
+    result.pop("failed_jobs")
+    nightlies.fetch_failed_jobs(result, cache)
+    assert result["failed_jobs_count"] == 3
+    get.assert_called_once_with(result["url"], stream=True, timeout=30)
+
+
+def test_generate_message_failed_jobs():
+    result = {
+        "result": "errored",
+        "url": "https://example.org/errored",
+        "commit": "f9fa7382909d4a6096a2d79c0bb4d625ff8389f8",
+        "failed_jobs": list(iter_failed_jobs(io.BytesIO(RESULT_HTML)))[:2],
+        "failed_jobs_count": 4,
+    }
+    msg = generate_message(MockConfig(), "Hello!", [("master", result)])
+    assert msg.endswith(
+        "- [`master` nightlies errored](https://example.org/errored) on [f9fa738290](https://github.com/RIOT-OS/RIOT/commit/f9fa7382909d4a6096a2d79c0bb4d625ff8389f8)\n"
+        "    - `examples/hello-world` on `native` failed (compile)\n"
+        "    - `tests/xtimer_now64_continuity` on `native` failed (run_test)\n"
+        "    - ... and 2 more failed jobs\n"
+    )
+
+
+def test_record_history(tmp_path):
+    config = MockConfig()
+    store = make_storage(tmp_path, history_retention=int(time.time()))
+    run = WorkflowRun(
+        config,
+        2485316784,
+        "c89739f7f0a339ba22e8f5cc92ce74a4e0c99adc",
+        "failure",
+        "https://github.com/RIOT-OS/RIOT/actions/runs/2485316784",
+        head_branch="master",
+        run_started_at="2022-06-11T01:50:11Z",
+    )
+    workflow = type("Workflow", (), {"name": "release-tests"})()
+    record_history(
+        store,
+        config,
+        [Nightlies(config, "master")],
+        [workflow, workflow],
+        [[{"result": "errored", "commit": "11fadfcc9d", "since": 1617726641}]],
+        [[run], None],
+    )
+    assert store.get_nightly_results("RIOT", "master") == [
+        (1617726641, "11fadfcc9d", "errored")
+    ]
+    assert store.get_workflow_run_results("RIOT", "release-tests") == [
+        (1654912211, 2485316784, run.commit, "failure")
+    ]
+
+
+def test_generate_message_flaky_tests():
+    flaky_tests = [FlakyTest("release-tests", "native.tests_xtimer.test", 10, 5, 9)]
+    msg = generate_message(MockConfig(), "Hello!", [], flaky_tests=flaky_tests)
+    assert msg.endswith(
+        "\nFlaky test cases:\n\n"
+        "- `native.tests_xtimer.test` of `release-tests` flipped 9 times in 10 runs "
+        "(5 failed)\n"
+    )
+
+
+def test_generate_statistics_message(tmp_path, mocker):
+    source = MockConfig()
+    source.nightlies_branches = ["master", "2020.07-branch"]
+    source.github_workflows = [{"name": "release-tests", "report_xml": True}]
+    source.analytics_window = 90 * 24 * 60 * 60
+    source.max_flaky_tests = 5
+    now = int(time.time())
+    store = make_storage(tmp_path)
+    store.add_nightly_results(
+        ("RIOT", "master", f"{i:040x}", result, now - 3600 * (4 - i))
+        for i, result in enumerate(("errored", "passed", "errored", "errored"))
+    )
+    msg = asyncio.run(generate_statistics_message(source, store))
+    assert msg == (
+        "Failure statistics of the last 90 days:\n\n"
+        "- `master` nightlies: 3 of 4 runs failed, changed 2 times, longest "
+        "failure streak 2, failing for the last 2 runs\n"
+        "- `2020.07-branch` nightlies: no results recorded\n"
+        "- `release-tests` workflow: no results recorded\n"
+    )
+    # the statistics of many results are computed off the event loop
+    mocker.patch("murdock_nio_bot.offload.threshold", 0)
+    offloaded = metrics.get("offloaded_calls_total", function="analyse")
+    assert asyncio.run(generate_statistics_message(source, store)) == msg
+    assert metrics.get("offloaded_calls_total", function="analyse") == offloaded + 3
+
+
+def test_route_report(tmp_path):
+    source = MockConfig()
+    store = make_storage(tmp_path)
+    store.add_subscription("!master:example.com", "RIOT", "master")
+    store.add_subscription("!all:example.com", "RIOT", ALL_BRANCHES)
+    store.add_subscription("!other:example.com", "other", ALL_BRANCHES)
+    store.add_subscription("!release:example.com", "RIOT", "2020.07-branch")
+    master = {"result": "errored", "commit": "11fadfcc9d"}
+    release = {"result": "passed", "commit": "f9fa738290"}
+    run = WorkflowRun(
+        source,
+        2485316784,
+        "c89739f7f0a339ba22e8f5cc92ce74a4e0c99adc",
+        "failure",
+        "https://github.com/RIOT-OS/RIOT/actions/runs/2485316784",
+        head_branch="master",
+    )
+    nightlies = [("master", master), ("2020.07-branch", release), ("2021.01", None)]
+    workflow_runs = [("release-tests", run)]
+    rooms = [
+        "!master:example.com",
+        "!all:example.com",
+        "!other:example.com",
+        "!release:example.com",
+        "!unsubscribed:example.com",
+    ]
+    routes = route_report(store, source, rooms, nightlies, workflow_runs)
+    assert sorted(routes, key=lambda route: route[2]) == [
+        (
+            [("master", master), ("2020.07-branch", release)],
+            workflow_runs,
+            ["!all:example.com", "!other:example.com", "!unsubscribed:example.com"],
+        ),
+        ([("master", master)], workflow_runs, ["!master:example.com"]),
+        ([("2020.07-branch", release)], [], ["!release:example.com"]),
+    ]
+    routes = route_report(
+        store, source, rooms, nightlies, workflow_runs, broadcast_unsubscribed=False
+    )
+    assert [room_ids for _, _, room_ids in routes] == [
+        ["!master:example.com"],
+        ["!all:example.com"],
+        ["!release:example.com"],
+    ]
+    # runs without a branch only go to the subscribers of all branches
+    run.branch = None
+    routes = route_report(
+        store, source, rooms, nightlies, workflow_runs, broadcast_unsubscribed=False
+    )
+    assert [
+        (room_ids, room_workflow_runs) for _, room_workflow_runs, room_ids in routes
+    ] == [
+        (["!master:example.com"], []),
+        (["!all:example.com"], workflow_runs),
+        (["!release:example.com"], []),
+    ]
+
+
+def test_send_live_status(tmp_path, mocker):
+    source = MockConfig()
+    store = make_storage(tmp_path)
+    client = mocker.Mock()
+    client.room_send = mocker.AsyncMock(
+        side_effect=lambda room_id, *args, **kwargs: RoomSendResponse(
+            f"$event{client.room_send.call_count}", room_id
+        )
+    )
+    room_id = "!room:example.com"
+    errored = {"result": "errored", "commit": "11fadfcc9d"}
+    passed = {"result": "passed", "commit": "f9fa738290"}
+
+    def send(nightlies):
+        results, failures = report_keys(nightlies, [])
+        asyncio.run(
+            send_live_status(client, store, source, room_id, "msg", results, failures)
+        )
+        return client.room_send.call_args.args[2]
+
+    # the first report is a new message, the live status from then on
+    content = send([("master", errored)])
+    assert "m.relates_to" not in content
+    assert store.get_live_status(room_id, "RIOT") == (
+        "$event1",
+        {"nightlies/master/11fadfcc9d/errored"},
+    )
+    # nothing changed
+    send([("master", errored)])
+    assert client.room_send.call_count == 1
+    # a nightly passed again, so the live status is edited
+    content = send([("master", errored), ("2020.07-branch", passed)])
+    assert content["m.relates_to"] == {"rel_type": "m.replace", "event_id": "$event1"}
+    assert content["m.new_content"]["body"] == "msg"
+    assert store.get_live_status(room_id, "RIOT")[0] == "$event1"
+    # a new failure is a new message
+    content = send([("master", dict(errored, commit="0123456789"))])
+    assert "m.relates_to" not in content
+    assert store.get_live_status(room_id, "RIOT")[0] == "$event3"
+    # a failed edit is a new message as well
+    client.room_send.side_effect = [
+        RoomSendError("redacted"),
+        RoomSendResponse("$new", room_id),
+    ]
+    content = send([("2020.07-branch", passed)])
+    assert "m.relates_to" not in content
+    assert store.get_live_status(room_id, "RIOT")[0] == "$new"
@@ -0,0 +1,31 @@
+import asyncio
+import threading
+
+from murdock_nio_bot import offload
+from murdock_nio_bot.metrics import metrics
+
+
+def thread_name(text):
+    return threading.current_thread().name
+
+
+def test_offload():
+    metrics.clear()
+
+    async def run():
+        small = await offload.offload(thread_name, "x", size=1)
+        large = await offload.offload(thread_name, "x", size=offload.threshold)
+        return small, large
+
+    small, large = asyncio.run(run())
+    assert small == "MainThread"
+    assert large != "MainThread"
+    assert metrics.get("offloaded_calls_total", function="thread_name") == 1
+
+
+def test_offload_processes():
+    offload.configure(10, processes=1)
+    try:
+        assert asyncio.run(offload.offload(sum, [1, 2, 3], size=10)) == 6
+    finally:
+        offload.configure(64 * 1024)
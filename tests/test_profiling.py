@@ -0,0 +1,76 @@
+import asyncio
+import logging
+import os
+import time
+from unittest.mock import Mock
+
+from murdock_nio_bot.metrics import metrics
+from murdock_nio_bot.profiling import LoopLagMonitor, Profiler, timed_callback
+
+
+class FakeCallbacks:
+    def __init__(self, threshold):
+        self.config = Mock()
+        self.config.slow_callback_threshold = threshold
+
+    @timed_callback
+    async def message(self, room, event):
+        await asyncio.sleep(0.01)
+        return event.event_id
+
+
+def test_timed_callback_slow(caplog):
+    room = Mock(room_id="!abcdefg:example.com")
+    event = Mock(event_id="$event")
+    with caplog.at_level(logging.WARNING):
+        res = asyncio.run(FakeCallbacks(0).message(room, event))
+    assert res == "$event"
+    assert "Slow callback message" in caplog.text
+    assert "!abcdefg:example.com" in caplog.text
+    assert "$event" in caplog.text
+
+
+def test_timed_callback_fast(caplog):
+    room = Mock(room_id="!abcdefg:example.com")
+    event = Mock(event_id="$event")
+    with caplog.at_level(logging.WARNING):
+        asyncio.run(FakeCallbacks(10).message(room, event))
+    assert "Slow callback" not in caplog.text
+
+
+def test_profiler_toggle(tmp_path):
+    profiler = Profiler(str(tmp_path))
+    assert profiler.stop() is None
+    profiler.toggle()
+    assert profiler.running
+    sum(range(1000))
+    profiler.toggle()
+    assert not profiler.running
+    dumps = os.listdir(str(tmp_path))
+    assert len(dumps) == 1
+    assert dumps[0].endswith(".pstats")
+
+
+def blocking_step():
+    time.sleep(0.3)
+
+
+def test_loop_lag_monitor(caplog):
+    metrics.clear()
+
+    async def run():
+        monitor = LoopLagMonitor(threshold=0.1, interval=0.02)
+        monitor.start()
+        await asyncio.sleep(0.05)
+        blocking_step()
+        await asyncio.sleep(0.05)
+        monitor.stop()
+        return monitor
+
+    with caplog.at_level(logging.WARNING):
+        monitor = asyncio.run(run())
+    assert monitor.max_lag >= 0.2
+    assert metrics.get("event_loop_stalls_total") == 1
+    # the snapshot shows what blocked the loop
+    assert "Event loop blocked for" in caplog.text
+    assert "in blocking_step" in caplog.text
@@ -0,0 +1,194 @@
+import asyncio
+import copy
+import datetime
+
+import yaml
+
+from murdock_nio_bot.bot_commands import Command
+from murdock_nio_bot.config import Config
+from murdock_nio_bot.reloader import ConfigReloader
+from murdock_nio_bot.schedule import Scheduler
+
+from tests.utils import FakeClock
+
+CONFIG = {
+    "command_prefix": "!c",
+    "admins": ["@admin:example.com"],
+    "matrix": {
+        "user_id": "@bot:example.com",
+        "user_password": "password",
+        "homeserver_url": "https://example.com",
+        "device_id": "BOT",
+    },
+    "logging": {"console_logging": {"enabled": False}},
+    "murdock": {
+        "crontab": "0 8 * * *",
+        "sources": [
+            {
+                "name": name,
+                "branches": ["master"],
+                "nightlies_url": "https://ci.riot-os.org/{branch}/nightlies.json",
+                "result_url": "https://ci.riot-os.org/{branch}/{commit}/output.html",
+                "commit_url": "https://github.com/RIOT-OS/RIOT/commit/{commit}",
+                "github": {"org": "RIOT-OS", "repo": name},
+            }
+            for name in ("RIOT", "Release-Specs", "RIOT-wt")
+        ],
+    },
+}
+
+
+def write_config(tmp_path, config_dict, **storage):
+    config_dict = copy.deepcopy(config_dict)
+    config_dict["storage"] = {
+        "database": f"sqlite://{tmp_path}/bot.db",
+        "store_path": str(tmp_path / "store"),
+        **storage,
+    }
+    path = tmp_path / "config.yaml"
+    path.write_text(yaml.safe_dump(config_dict))
+    return str(path)
+
+
+def test_reload(tmp_path, mocker):
+    listener = mocker.Mock()
+
+    async def run():
+        config = Config(write_config(tmp_path, CONFIG))
+        reloader = ConfigReloader(
+            config, mocker.Mock(), mocker.Mock(), listeners=[listener]
+        )
+        reloader.start()
+        workers = dict(reloader.workers)
+        schedules = dict(reloader.schedules)
+        workers["RIOT"].workflows = []
+
+        assert reloader.reload() == []
+        assert reloader.workers == workers
+        assert reloader.schedules == schedules
+
+        new = copy.deepcopy(CONFIG)
+        sources = new["murdock"]["sources"]
+        sources[0]["branches"].append("2022.01-branch")
+        sources[1]["crontab"] = "0 9 * * *"
+        del sources[2]
+        sources.append(dict(sources[0], name="RIOT-new"))
+        new["matrix"]["device_id"] = "OTHER"
+        write_config(tmp_path, new)
+        changes = reloader.reload()
+        assert set(changes) == {
+            "device_id changed, but requires a restart",
+            "rebuilt the worker of RIOT (nightlies_branches)",
+            "rescheduled source Release-Specs",
+            "removed source RIOT-wt",
+            "added source RIOT-new",
+        }
+        # the worker of RIOT fetches its workflows again
+        assert reloader.workers["RIOT"] is not workers["RIOT"]
+        assert reloader.workers["RIOT"].workflows is None
+        assert reloader.workers["RIOT"]._lock is workers["RIOT"]._lock
+        assert reloader.workers["Release-Specs"] is workers["Release-Specs"]
+        assert "check/Release-Specs/0 8 * * *" not in reloader.scheduler
+        assert reloader.schedules["Release-Specs"] == [
+            "check/Release-Specs/0 9 * * *",
+            "prewarm/Release-Specs/0 9 * * *",
+        ]
+        assert "check/RIOT-wt/0 8 * * *" not in reloader.scheduler
+        assert "RIOT-wt" not in reloader.workers
+        assert "RIOT-new" in reloader.schedules
+        reloader.scheduler.stop()
+        listener.assert_called_with(reloader.config)
+
+        # an invalid config is not applied
+        (tmp_path / "config.yaml").write_text("murdock: {}")
+        config = reloader.config
+        assert reloader.reload()[0].startswith("Invalid config")
+        assert reloader.config is config
+
+    asyncio.run(run())
+
+
+def test_reload_options(tmp_path, mocker):
+    """Options of the storage, the cache and the leader election are applied,
+    the ones only read on start are reported
+    """
+    store = mocker.Mock()
+    cache = mocker.Mock()
+    leader = mocker.Mock()
+
+    async def run():
+        config = Config(write_config(tmp_path, CONFIG))
+        reloader = ConfigReloader(
+            config, mocker.Mock(), store, cache=cache, leader=leader
+        )
+        reloader.start()
+        new = copy.deepcopy(CONFIG)
+        new["ha"] = {"lease_seconds": 30, "renew_seconds": 5}
+        write_config(
+            tmp_path,
+            new,
+            history={"retention_days": 1},
+            processed_events={"window_days": 2, "capacity": 10},
+            cache={"max_size_mb": 1},
+            sent_events={"size": 10},
+        )
+        assert set(reloader.reload()) == {
+            "processed_events_capacity changed, but requires a restart",
+            "sent_events_size changed, but requires a restart",
+        }
+        assert store.history_retention == 24 * 60 * 60
+        assert store.processed_events_window == 2 * 24 * 60 * 60
+        assert cache.max_bytes == 1024 * 1024
+        assert (leader.lease_duration, leader.renew_interval) == (30, 5)
+        reloader.scheduler.stop()
+
+    asyncio.run(run())
+
+
+def test_reload_command(mocker):
+    send = mocker.patch(
+        "murdock_nio_bot.bot_commands.send_text_to_room", return_value=None
+    )
+    reloader = mocker.Mock()
+    reloader.reload.return_value = ["added source RIOT-new"]
+    config = mocker.Mock(admins=["@admin:example.com"])
+    room = mocker.Mock(room_id="!room:example.com")
+
+    def command(sender):
+        event = mocker.Mock(sender=sender)
+        return Command(mocker.Mock(), None, config, "reload", room, event, reloader)
+
+    asyncio.run(command("@user:example.com").process())
+    reloader.reload.assert_not_called()
+    assert "Only admins" in send.call_args.args[2]
+    asyncio.run(command("@admin:example.com").process())
+    reloader.reload.assert_called_once()
+    assert send.call_args.args[2] == (
+        "Reloaded the config:\n\n- added source RIOT-new\n"
+    )
+
+
+def test_prewarm_before_check(tmp_path, mocker):
+    prewarm = mocker.patch("murdock_nio_bot.worker.SourceWorker.prewarm")
+    config_dict = copy.deepcopy(CONFIG)
+    # with a check every minute, the next one is within the lead
+    config_dict["murdock"]["crontab"] = "* * * * *"
+    config_dict["murdock"]["prewarm_minutes"] = 1
+
+    clock = FakeClock(datetime.datetime(2021, 10, 1, 7, 59, 30).timestamp())
+
+    async def run():
+        config = Config(write_config(tmp_path, config_dict))
+        reloader = ConfigReloader(
+            config, mocker.Mock(), mocker.Mock(), scheduler=Scheduler(clock=clock)
+        )
+        reloader.start()
+        # the pre-warming runs a minute before the check at 8:01
+        await clock.advance(30)
+        assert prewarm.await_count == 3
+        reloader._remove_worker("RIOT")
+        assert "prewarm/RIOT/* * * * *" not in reloader.scheduler
+        assert "prewarm/RIOT-wt/* * * * *" in reloader.scheduler
+        reloader.scheduler.stop()
+
+    asyncio.run(run())
@@ -0,0 +1,98 @@
+import asyncio
+import io
+
+import yaml
+
+from murdock_nio_bot.report import report
+
+from tests.stubs import MatrixStub, Recording, StubServer
+
+
+def write_config(
+    tmp_path, nightlies_url, homeserver_url="http://127.0.0.1:1", **murdock
+):
+    path = tmp_path / "config.yaml"
+    path.write_text(
+        yaml.safe_dump(
+            {
+                "matrix": {
+                    "user_id": "@bot:localhost",
+                    "user_password": "password",
+                    "homeserver_url": homeserver_url,
+                    "device_id": "REPORT",
+                },
+                "storage": {
+                    "database": f"sqlite://{tmp_path}/bot.db",
+                    "store_path": str(tmp_path / "store"),
+                },
+                "logging": {"level": "CRITICAL"},
+                "murdock": {
+                    "crontab": "0 8 * * *",
+                    "branches": ["master"],
+                    "nightlies_url": nightlies_url + "/RIOT-OS/RIOT/{branch}/"
+                    "nightlies.json",
+                    "result_url": nightlies_url + "/{branch}/{commit}/output.html",
+                    "commit_url": "https://github.com/RIOT-OS/RIOT/commit/{commit}",
+                    "github": {"org": "RIOT-OS", "repo": "RIOT-report"},
+                    **murdock,
+                },
+            }
+        )
+    )
+    return str(path)
+
+
+def test_report_print(tmp_path):
+    out = io.StringIO()
+    with StubServer(Recording.load("tests/recordings/nightlies.json")) as stub:
+        config_path = write_config(tmp_path, stub.url)
+        assert asyncio.run(report(config_path, dry_run=True, out=out)) == 0
+    assert "[`master` nightlies errored]" in out.getvalue()
+    # a dry run does not create the database
+    assert not (tmp_path / "bot.db").exists()
+
+
+def test_report_fails(tmp_path):
+    """A source that cannot be checked fails the report right away"""
+    out = io.StringIO()
+    config_path = write_config(
+        tmp_path,
+        "http://127.0.0.1:1",
+        github={"org": "RIOT-OS", "repo": "RIOT-down"},
+        backoff={"initial": 3600},
+    )
+    assert asyncio.run(report(config_path, dry_run=True, out=out)) == 1
+    assert out.getvalue() == ""
+
+
+def test_report_print_workflows(tmp_path):
+    out = io.StringIO()
+    recording = Recording.load("tests/recordings/nightlies.json")
+    recording.exchanges += Recording.load("tests/recordings/github.json").exchanges
+    with StubServer(recording) as stub:
+        config_path = write_config(
+            tmp_path,
+            stub.url,
+            github={"org": "RIOT-OS", "repo": "RIOT", "api_url": stub.url},
+            github_workflows=[{"name": "test-on-iotlab"}],
+        )
+        assert asyncio.run(report(config_path, dry_run=True, out=out)) == 0
+        # without a store, the last reported run is not skipped on a second run
+        assert asyncio.run(report(config_path, dry_run=True, out=out)) == 0
+    assert out.getvalue().count("test-on-iotlab") == 2
+    assert not (tmp_path / "bot.db").exists()
+
+
+def test_report_post(tmp_path):
+    with StubServer(Recording.load("tests/recordings/nightlies.json")) as stub:
+        with MatrixStub() as matrix:
+            matrix.joined = ["!plain:localhost", "!encrypted:localhost"]
+            matrix.encrypted = ["!encrypted:localhost"]
+            config_path = write_config(tmp_path, stub.url, matrix.url)
+            assert asyncio.run(report(config_path, post=True)) == 0
+    # only the room it can post to without a sync gets the report
+    assert [(room_id, event_type) for room_id, event_type, _ in matrix.sent] == [
+        ("!plain:localhost", "m.room.message")
+    ]
+    assert "nightlies errored" in matrix.sent[0][2]["body"]
+    assert not any("/sync" in path for _, path in matrix.requests)
@@ -0,0 +1,45 @@
+import io
+
+from murdock_nio_bot.result_page import FailedJob, iter_failed_jobs
+
+RESULT_HTML = b"""<!DOCTYPE html>
+<html>
+<head><meta charset="utf-8"><title>Murdock results</title></head>
+<body>
+  <h2>Build successes</h2>
+  <ul><li>compile/examples/hello-world:samr21-xpro:gnu</li></ul>
+  <h2>Build failures</h2>
+  <ul>
+    <li>compile/examples/hello-world:native:gnu</li>
+    <li><br>run_test/tests/xtimer_now64_continuity/native:llvm</li>
+    <li>compile/examples/hello-world:native:gnu</li>
+  </ul>
+  <h2>Worker statistics</h2>
+  <p>compile/tests/pkg_lwip:esp32-wroom-32:gnu took 3s</p>
+  <div class="job failed">compile/tests/pkg_lwip:nrf52dk:gnu</div>
+</body>
+</html>
+"""
+
+
+def test_iter_failed_jobs():
+    jobs = list(iter_failed_jobs(io.BytesIO(RESULT_HTML)))
+    assert jobs == [
+        FailedJob("compile", "examples/hello-world", "native", "gnu"),
+        FailedJob("run_test", "tests/xtimer_now64_continuity", "native", "llvm"),
+        FailedJob("compile", "tests/pkg_lwip", "nrf52dk", "gnu"),
+    ]
+    assert str(jobs[0]) == "compile/examples/hello-world:native:gnu"
+    assert str(jobs[1]) == "run_test/tests/xtimer_now64_continuity/native:llvm"
+
+
+def test_iter_failed_jobs_chunked():
+    jobs = b"".join(
+        b"<li>compile/tests/app%d:native:gnu</li>" % i for i in range(10000)
+    )
+    html = b'<ul class="errors">' + jobs + b"</ul>"
+    assert sum(1 for _ in iter_failed_jobs(io.BytesIO(html))) == 10000
+
+
+def test_iter_failed_jobs_garbage():
+    assert list(iter_failed_jobs(io.BytesIO(b"\xff\xfe<h1>fail</h1><p"))) == []
@@ -0,0 +1,176 @@
+import asyncio
+import datetime
+
+import pytest
+import requests
+
+from murdock_nio_bot.schedule import Scheduler, next_time
+from murdock_nio_bot.worker import SourceWorker
+
+from tests.test_storage import make_storage
+from tests.test_worker import make_source
+from tests.utils import FakeClock
+
+HOUR = 60 * 60
+DAY = 24 * HOUR
+
+
+def at(hour, minute=0, day=1):
+    return datetime.datetime(2021, 10, day, hour, minute).timestamp()
+
+
+def test_next_time():
+    assert next_time("0 8 * * *", at(7, 59)) == at(8)
+    assert next_time("0 8 * * *", at(8)) == at(8, day=2)
+    assert next_time("*/30 * * * *", at(8, 10)) == at(8, 30)
+
+
+def test_scheduler_runs_at_crontab():
+    clock = FakeClock(at(7))
+    runs = []
+
+    async def run():
+        scheduler = Scheduler(clock=clock)
+        scheduler.add("check", "0 8 * * *", lambda: runs.append(clock.time()))
+        await clock.advance(HOUR - 1)
+        assert runs == []
+        assert scheduler.next_run("check") == at(8)
+        await clock.advance(1)
+        assert runs == [at(8)]
+        await clock.advance(2 * DAY)
+        assert runs == [at(8), at(8, day=2), at(8, day=3)]
+        scheduler.stop()
+        await clock.advance(DAY)
+        assert len(runs) == 3
+
+    asyncio.run(run())
+
+
+def test_scheduler_jitter_and_offset():
+    clock = FakeClock(at(7))
+    runs = []
+
+    async def run():
+        scheduler = Scheduler(clock=clock, seed=1)
+        scheduler.add("check", "0 8 * * *", lambda: runs.append(clock.time()), 60)
+        scheduler.add(
+            "before", "0 8 * * *", lambda: runs.append(-clock.time()), offset=-300
+        )
+        await clock.advance(HOUR + 60)
+        assert runs[0] == -at(7, 55)
+        assert at(8) <= runs[1] <= at(8, 1)
+
+    asyncio.run(run())
+
+
+def test_scheduler_catches_up(tmp_path):
+    store = make_storage(tmp_path)
+    runs = []
+
+    async def run(clock, advance):
+        scheduler = Scheduler(store, clock=clock)
+        scheduler.add("check", "0 8 * * *", lambda: runs.append(clock.time()))
+        await clock.advance(advance)
+        scheduler.stop()
+
+    # the first start does not catch up, as there was no run
+    asyncio.run(run(FakeClock(at(9)), 0))
+    assert runs == []
+    asyncio.run(run(FakeClock(at(7, day=2)), 2 * HOUR))
+    assert runs == [at(8, day=2)]
+    assert store.get_last_run("check") == at(8, day=2)
+    # the bot was down at 8:00 of the third and the fourth day
+    asyncio.run(run(FakeClock(at(12, day=4)), 0))
+    assert runs == [at(8, day=2), at(12, day=4)]
+    assert store.get_last_run("check") == at(8, day=4)
+    # the run was caught up already
+    asyncio.run(run(FakeClock(at(13, day=4)), 0))
+    assert len(runs) == 2
+
+
+def test_scheduler_records_successful_runs(tmp_path):
+    store = make_storage(tmp_path)
+    store.set_last_run("check", int(at(8)))
+    outcomes = ["failed", "interrupted", "ok"]
+    runs = []
+
+    async def check():
+        outcome = outcomes.pop(0)
+        runs.append(outcome)
+        if outcome == "failed":
+            raise RuntimeError("failed check")
+        if outcome == "interrupted":
+            await asyncio.sleep(60)
+
+    async def run(clock):
+        scheduler = Scheduler(store, clock=clock)
+        scheduler.add("check", "0 8 * * *", check)
+        await clock.advance(0)
+        scheduler.stop()
+        for task in asyncio.all_tasks() - {asyncio.current_task()}:
+            # a restart interrupts the runs in progress
+            task.cancel()
+
+    # neither a failed nor an interrupted run counts, so it is caught up again
+    asyncio.run(run(FakeClock(at(9, day=2))))
+    assert store.get_last_run("check") == at(8)
+    asyncio.run(run(FakeClock(at(9, day=2))))
+    assert store.get_last_run("check") == at(8)
+    asyncio.run(run(FakeClock(at(9, day=2))))
+    assert store.get_last_run("check") == at(8, day=2)
+    assert runs == ["failed", "interrupted", "ok"]
+
+
+def test_scheduler_records_worker_runs(tmp_path, mocker):
+    """A worker that gave up or left the check to the leader did not run"""
+    store = make_storage(tmp_path)
+    store.set_last_run("check", int(at(8)))
+    get_nightlies = mocker.patch(
+        "murdock_nio_bot.murdock.Nightlies.get_nightlies",
+        side_effect=[requests.ConnectionError("unreachable"), []],
+    )
+    leader = mocker.Mock(is_leader=True)
+    worker = SourceWorker(
+        make_source("RIOT"),
+        mocker.Mock(),
+        mocker.Mock(),
+        backoff_max_retries=0,
+        leader=leader,
+    )
+
+    async def run(clock):
+        scheduler = Scheduler(store, clock=clock)
+        scheduler.add("check", "0 8 * * *", worker.run)
+        await clock.advance(0)
+        scheduler.stop()
+
+    asyncio.run(run(FakeClock(at(9, day=2))))
+    assert store.get_last_run("check") == at(8)
+    leader.is_leader = False
+    asyncio.run(run(FakeClock(at(9, day=2))))
+    assert store.get_last_run("check") == at(8)
+    assert get_nightlies.call_count == 1
+    leader.is_leader = True
+    asyncio.run(run(FakeClock(at(9, day=2))))
+    assert store.get_last_run("check") == at(8, day=2)
+    assert get_nightlies.call_count == 2
+
+
+def test_scheduler_coroutines():
+    clock = FakeClock(at(7))
+    runs = []
+
+    async def check():
+        runs.append(clock.time())
+        raise RuntimeError("failed check")
+
+    async def run():
+        scheduler = Scheduler(clock=clock)
+        scheduler.add("check", "0 * * * *", check)
+        await clock.advance(2 * HOUR)
+        # a failed run does not stop the schedule
+        assert runs == [at(8), at(9)]
+        with pytest.raises(ValueError):
+            scheduler.add("invalid", "0 8 * *", check)
+
+    asyncio.run(run())
@@ -0,0 +1,277 @@
+import sqlite3
+import time
+
+import pytest
+
+from murdock_nio_bot import junit
+from murdock_nio_bot.chat_functions import SentEvents
+from murdock_nio_bot.migrations import load_migrations
+from murdock_nio_bot.storage import (
+    ALL_BRANCHES,
+    Storage,
+    latest_migration_version,
+    pack_test_results,
+)
+
+
+def make_storage(tmp_path, **kwargs):
+    return Storage(
+        {"type": "sqlite", "connection_string": str(tmp_path / "bot.db")}, **kwargs
+    )
+
+
+def test_initial_setup(tmp_path):
+    store = make_storage(tmp_path)
+    store._execute("SELECT version FROM migration_version")
+    assert store.cursor.fetchone()[0] == latest_migration_version
+    # opening an existing database does not run the migrations again
+    make_storage(tmp_path)
+    store._execute("PRAGMA journal_mode")
+    assert store.cursor.fetchone()[0] == "wal"
+
+
+def test_migrate_commits(tmp_path, mocker):
+    # a database of before commit hashes were stored as bytes
+    migrations = load_migrations()
+    mocker.patch("murdock_nio_bot.storage.load_migrations", return_value=migrations[:9])
+    store = make_storage(tmp_path)
+    store._execute(
+        "INSERT INTO nightly_result (source, branch, commit_hash, result, ts) "
+        "VALUES ('RIOT', 'master', '11fadfcc9d', 'errored', 5)"
+    )
+    store._execute(
+        "INSERT INTO github_workflow (id, last_run_commit) VALUES (1234, NULL)"
+    )
+    mocker.stopall()
+
+    store = make_storage(tmp_path)
+    assert store.get_nightly_results("RIOT", "master") == [(5, "11fadfcc9d", "errored")]
+    assert store.get_last_run_commit(1234) is None
+    store._execute("SELECT commit_hash FROM nightly_result")
+    assert store.cursor.fetchone()[0] == bytes.fromhex("11fadfcc9d")
+
+
+def test_migrate_test_results(tmp_path, mocker):
+    # a database of before the results of test cases were packed per run
+    migrations = load_migrations()
+    mocker.patch(
+        "murdock_nio_bot.storage.load_migrations", return_value=migrations[:10]
+    )
+    store = make_storage(tmp_path, history_retention=10 ** 10)
+    store._executemany(
+        "INSERT INTO test_result (source, run_id, test_id, workflow, failed, ts) "
+        "VALUES ('RIOT', ?, ?, 'release-tests', ?, ?)",
+        [
+            (run_id, test_id, test_id == run_id, run_id)
+            for run_id in (1, 2)
+            for test_id in (1, 2, 3)
+        ],
+    )
+    mocker.stopall()
+
+    store = make_storage(tmp_path, history_retention=10 ** 10)
+    assert store.has_test_results("RIOT", 2)
+    runs = sorted(store.get_test_runs("RIOT", "release-tests"))
+    assert [ts for ts, _, _ in runs] == [1, 2]
+    assert runs[0][1:] == pack_test_results([1, 2, 3], [True, False, False])
+
+
+def test_failed_migration(tmp_path, mocker):
+    def upgrade(store):
+        store._execute("CREATE TABLE broken (id INTEGER)")
+        raise RuntimeError("broken migration")
+
+    migrations = load_migrations()
+    mocker.patch(
+        "murdock_nio_bot.storage.load_migrations",
+        return_value=migrations + [(len(migrations) + 1, "Broken", upgrade)],
+    )
+    with pytest.raises(RuntimeError):
+        make_storage(tmp_path)
+    mocker.stopall()
+    # the failed migration was rolled back, the others were applied
+    store = make_storage(tmp_path)
+    store._execute("SELECT version FROM migration_version")
+    assert store.cursor.fetchone()[0] == latest_migration_version
+    with pytest.raises(sqlite3.OperationalError):
+        store._execute("SELECT * FROM broken")
+
+
+def test_last_run_commit(tmp_path):
+    store = make_storage(tmp_path)
+    assert store.get_last_run_commit(1234) is None
+    store.set_last_run_commit(1234, "11fadfcc9ddac1a6b5051cc93572fac6b9a9d838")
+    store.set_last_run_commit(1234, "f9fa7382909d4a6096a2d79c0bb4d625ff8389f8")
+    assert store.get_last_run_commit(1234) == "f9fa7382909d4a6096a2d79c0bb4d625ff8389f8"
+
+
+def test_sent_events_persisted(tmp_path):
+    store = make_storage(tmp_path)
+    sent_events = SentEvents(2, store)
+    for i in range(4):
+        sent_events.add("!room:example.com", f"$event{i}")
+    assert not sent_events.sent_by_us("!room:example.com", "$event1")
+    assert sent_events.sent_by_us("!room:example.com", "$event3")
+    assert not sent_events.sent_by_us("!other:example.com", "$event3")
+
+    restored = SentEvents(2, make_storage(tmp_path))
+    assert restored.sent_by_us("!room:example.com", "$event3")
+    assert len(store.get_sent_events(10)) <= 2
+
+
+def test_sent_events_order(tmp_path, mocker):
+    """Events sent within the same second are kept in the order they were sent"""
+    mocker.patch("time.time", return_value=1617726641)
+    store = make_storage(tmp_path)
+    for i in (3, 1, 4, 2):
+        store.add_sent_event(f"$event{i}", "!room:example.com")
+    store.prune_sent_events(2)
+    assert store.get_sent_events(10) == [
+        ("$event4", "!room:example.com"),
+        ("$event2", "!room:example.com"),
+    ]
+
+
+def test_migrate_sent_events(tmp_path, mocker):
+    # a database of before the sent events were ordered by a sequence
+    migrations = load_migrations()
+    mocker.patch(
+        "murdock_nio_bot.storage.load_migrations", return_value=migrations[:11]
+    )
+    store = make_storage(tmp_path)
+    store._executemany(
+        "INSERT INTO sent_event (event_id, room_id, sent_at) VALUES (?, ?, ?)",
+        [("$new", "!room:example.com", 2), ("$old", "!room:example.com", 1)],
+    )
+    mocker.stopall()
+
+    store = make_storage(tmp_path)
+    assert [event_id for event_id, _ in store.get_sent_events(10)] == ["$old", "$new"]
+    store.add_sent_event("$newest", "!room:example.com")
+    assert store.get_sent_events(1) == [("$newest", "!room:example.com")]
+
+
+def test_processed_events(tmp_path):
+    store = make_storage(tmp_path)
+    assert not store.is_event_processed("$event1")
+    store.mark_event_processed("$event1")
+    store.mark_event_processed("$event1")
+    assert store.is_event_processed("$event1")
+    assert not store.is_event_processed("$event2")
+
+    # processed events survive a restart
+    assert make_storage(tmp_path).is_event_processed("$event1")
+
+
+def test_processed_events_window(tmp_path):
+    store = make_storage(tmp_path)
+    store.mark_event_processed("$event1")
+    store._execute("UPDATE processed_event SET processed_at = 0")
+    restarted = Storage(
+        {"type": "sqlite", "connection_string": str(tmp_path / "bot.db")},
+        processed_events_window=60,
+    )
+    assert not restarted.is_event_processed("$event1")
+
+
+def test_prune_processed_events(tmp_path):
+    store = make_storage(tmp_path, processed_events_window=60)
+    store.mark_event_processed("$event1")
+    store.mark_event_processed("$event2")
+    store._execute("UPDATE processed_event SET processed_at = 0")
+    store.mark_event_processed("$event3")
+    store.prune_processed_events()
+    # the pruned events are dropped from the in-memory filter, too
+    assert "$event1" not in store._processed_events
+    assert not store.is_event_processed("$event2")
+    assert store.is_event_processed("$event3")
+
+
+def test_history(tmp_path):
+    store = make_storage(tmp_path, history_retention=int(time.time()))
+    store.add_nightly_results(
+        [
+            ("RIOT", "master", "11fadfcc9d", "errored", 1617726641),
+            ("RIOT", "master", "f9fa738290", "passed", 1617813041),
+            ("RIOT", "2020.07-branch", "f9fa738290", "passed", 1617813041),
+        ]
+    )
+    # results are recorded only once
+    store.add_nightly_results([("RIOT", "master", "11fadfcc9d", "errored", 1617726641)])
+    store.add_workflow_run_results(
+        [("RIOT", "release-tests", 2485316784, "c89739f7f0", "master", "failure", 5)]
+    )
+    assert store.get_nightly_results("RIOT", "master") == [
+        (1617726641, "11fadfcc9d", "errored"),
+        (1617813041, "f9fa738290", "passed"),
+    ]
+    assert store.get_nightly_results("RIOT", "master", since=1617813041) == [
+        (1617813041, "f9fa738290", "passed"),
+    ]
+    assert store.get_workflow_run_results("RIOT", "release-tests") == [
+        (5, 2485316784, "c89739f7f0", "failure"),
+    ]
+
+
+def test_compact_history(tmp_path, mocker):
+    week = 7 * 24 * 60 * 60
+    now = mocker.patch("time.time", return_value=week)
+    store = make_storage(tmp_path, history_retention=week)
+    rows = [
+        ("RIOT", "master", f"{day:040x}", "errored" if day % 2 else "passed", ts)
+        for day, ts in enumerate(range(0, 3 * week, 24 * 60 * 60))
+    ]
+    store.add_nightly_results(rows)
+    for run_id, (ts, name) in enumerate(((0, "old"), (2 * week + 1, "new"))):
+        outcomes = junit.RunOutcomes()
+        outcomes.add(junit.TestCase("", name, True))
+        store.add_test_run("RIOT", "release-tests", run_id, ts, outcomes)
+    now.return_value = 3 * week
+    store.compact_history()
+    assert [ts for ts, _, _ in store.get_test_runs("RIOT", "release-tests")] == [
+        2 * week + 1
+    ]
+    # the names of test cases are only kept as long as runs of them are
+    assert list(
+        store.get_test_case_names(
+            [junit.test_case_id("old"), junit.test_case_id("new")]
+        ).values()
+    ) == ["new"]
+    # the weeks past the retention are summarized, the last one is kept
+    assert store.get_result_summaries("nightly", "RIOT", "master") == [
+        (0, 7, 3),
+        (week, 7, 4),
+    ]
+    assert len(store.get_nightly_results("RIOT", "master")) == 7
+    # results past the retention are not recorded again
+    store.add_nightly_results(rows)
+    assert len(store.get_nightly_results("RIOT", "master")) == 7
+
+
+def test_subscriptions(tmp_path):
+    store = make_storage(tmp_path)
+    store.add_subscription("!a:example.com", "RIOT", "master")
+    store.add_subscription("!a:example.com", "RIOT", "master")
+    store.add_subscription("!b:example.com", "RIOT", ALL_BRANCHES)
+    store.add_subscription("!c:example.com", "RIOT", "2020.07-branch")
+    assert store.get_subscribers("RIOT", ["master"]) == {
+        "!a:example.com": {"master"},
+        "!b:example.com": {"master"},
+    }
+    assert store.get_subscribed_rooms("RIOT") == {
+        "!a:example.com",
+        "!b:example.com",
+        "!c:example.com",
+    }
+    assert store.get_room_subscriptions("!a:example.com") == [("RIOT", "master")]
+    assert store.remove_subscription("!a:example.com", "RIOT", "master")
+    assert not store.remove_subscription("!a:example.com", "RIOT", "master")
+    assert store.get_subscribers("RIOT", ["master"]) == {"!b:example.com": {"master"}}
+
+
+def test_last_run(tmp_path):
+    store = make_storage(tmp_path)
+    assert store.get_last_run("check/RIOT/0 8 * * *") is None
+    store.set_last_run("check/RIOT/0 8 * * *", 1633068000)
+    store.set_last_run("check/RIOT/0 8 * * *", 1633154400)
+    assert store.get_last_run("check/RIOT/0 8 * * *") == 1633154400
@@ -0,0 +1,76 @@
+import asyncio
+import time
+
+import nio
+import requests
+
+from tests.stubs import MatrixStub, Recording, StubServer
+
+RECORDINGS = "tests/recordings"
+
+
+def test_replay_in_order():
+    recording = Recording()
+    recording.add("GET", "/a?page=1", 200, {}, b"first")
+    recording.add("GET", "/a?page=1", 500, {}, b"second")
+    recording.add("GET", "/b", 200, {}, b"{{base_url}}/b")
+    with StubServer(recording) as stub:
+        assert requests.get(stub.url + "/a?page=1").text == "first"
+        assert requests.get(stub.url + "/a?page=1").status_code == 500
+        # the last response is repeated
+        assert requests.get(stub.url + "/a?page=1").text == "second"
+        # unrecorded query strings are answered by the path
+        assert requests.get(stub.url + "/b?page=2").text == stub.url + "/b"
+        assert requests.get(stub.url + "/c").status_code == 404
+    assert stub.requests[-1] == ("GET", "/c")
+
+
+def test_record_upstream(tmp_path):
+    with StubServer(Recording.load(f"{RECORDINGS}/nightlies.json")) as upstream:
+        with StubServer(upstream=upstream.url) as recorder:
+            response = requests.get(
+                recorder.url + "/RIOT-OS/RIOT/master/nightlies.json"
+            )
+            assert response.status_code == 200
+    recorder.recording.save(tmp_path / "recording.json")
+    recording = Recording.load(tmp_path / "recording.json")
+    with StubServer(recording) as stub:
+        replayed = requests.get(stub.url + "/RIOT-OS/RIOT/master/nightlies.json")
+    assert replayed.json() == response.json()
+
+
+def test_latency_and_errors():
+    recording = Recording.load(f"{RECORDINGS}/nightlies.json")
+    with StubServer(recording, latency=0.1) as stub:
+        start = time.monotonic()
+        requests.get(stub.url + "/RIOT-OS/RIOT/master/nightlies.json")
+        assert time.monotonic() - start >= 0.1
+    with StubServer(recording, error_rate=0.5, error_status=502, seed=1) as stub:
+        statuses = [
+            requests.get(stub.url + "/RIOT-OS/RIOT/master/nightlies.json").status_code
+            for _ in range(20)
+        ]
+    assert set(statuses) == {200, 502}
+
+
+def test_matrix_stub(tmp_path):
+    async def run(url):
+        client = nio.AsyncClient(url, "@bot:localhost", store_path=str(tmp_path))
+        await client.login("password", device_name="test")
+        response = await client.sync(timeout=0)
+        assert "!room:localhost" in response.rooms.join
+        room = response.rooms.join["!room:localhost"]
+        assert room.timeline.events[0].body == "!c help"
+        await client.room_send(
+            "!room:localhost", "m.room.message", {"msgtype": "m.text", "body": "hi"}
+        )
+        # once the recorded syncs were replayed, the syncs are empty
+        response = await client.sync(timeout=0)
+        assert not response.rooms.join
+        await client.close()
+
+    with MatrixStub(Recording.load(f"{RECORDINGS}/matrix.json")) as stub:
+        asyncio.run(run(stub.url))
+    assert stub.sent == [
+        ("!room:localhost", "m.room.message", {"msgtype": "m.text", "body": "hi"})
+    ]
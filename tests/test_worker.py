@@ -0,0 +1,177 @@
+import asyncio
+
+import requests
+
+from murdock_nio_bot.config import Source
+from murdock_nio_bot.errors import GitHubError
+from murdock_nio_bot.metrics import metrics
+from murdock_nio_bot.worker import SourceWorker
+
+from tests.test_storage import make_storage
+
+
+def make_source(name, **kwargs):
+    return Source(
+        name=name,
+        crontab="0 8 * * *",
+        nightlies_branches=["master"],
+        nightlies_url="https://ci.riot-os.org/RIOT-OS/RIOT/{branch}/nightlies.json",
+        result_url="https://ci.riot-os.org/RIOT-OS/RIOT/{branch}/{commit}/output.html",
+        commit_url="https://github.com/RIOT-OS/RIOT/commit/{commit}",
+        github_org="RIOT-OS",
+        github_repo="RIOT",
+        **kwargs,
+    )
+
+
+def test_worker_backoff(mocker):
+    get_nightlies = mocker.patch(
+        "murdock_nio_bot.murdock.Nightlies.get_nightlies",
+        side_effect=[requests.ConnectionError("unreachable"), []],
+    )
+    sleep = mocker.patch("asyncio.sleep", return_value=None)
+    worker = SourceWorker(make_source("RIOT"), mocker.Mock(), mocker.Mock())
+    asyncio.run(worker.run())
+    assert get_nightlies.call_count == 2
+    sleep.assert_called_once_with(60)
+
+
+def test_worker_gives_up(mocker):
+    get_nightlies = mocker.patch(
+        "murdock_nio_bot.murdock.Nightlies.get_nightlies",
+        side_effect=requests.ConnectionError("unreachable"),
+    )
+    sleep = mocker.patch("asyncio.sleep", return_value=None)
+    worker = SourceWorker(
+        make_source("RIOT"), mocker.Mock(), mocker.Mock(), backoff_max_retries=2
+    )
+    asyncio.run(worker.run())
+    assert get_nightlies.call_count == 3
+    assert [c.args[0] for c in sleep.call_args_list] == [60, 120]
+
+
+def test_worker_retries_workflows(mocker):
+    """A failed fetch of the workflows is retried, not taken as no workflows"""
+    workflow = mocker.Mock()
+    fetch_workflows = mocker.patch(
+        "murdock_nio_bot.worker.Workflow.fetch_workflows",
+        side_effect=[GitHubError("Unable to fetch workflow list", 502), [workflow]],
+    )
+    report = mocker.patch(
+        "murdock_nio_bot.worker.report_last_nightlies", return_value=None
+    )
+    sleep = mocker.patch("asyncio.sleep", return_value=None)
+    source = make_source(
+        "RIOT", github_workflows=[{"name": "release-tests", "report_xml": False}]
+    )
+    worker = SourceWorker(source, mocker.Mock(), mocker.Mock())
+    asyncio.run(worker.run())
+    asyncio.run(worker.run())
+    assert fetch_workflows.call_count == 2
+    sleep.assert_called_once_with(60)
+    assert report.call_count == 2
+    assert report.call_args.args[2] == [workflow]
+
+
+def test_workers_independent(mocker):
+    """A slow source does not delay the report of another one"""
+    reported = []
+
+    async def report(worker):
+        if worker.source.name == "slow":
+            await asyncio.sleep(0.2)
+        reported.append(worker.source.name)
+
+    mocker.patch.object(SourceWorker, "report", report)
+
+    async def run_workers():
+        slow = SourceWorker(make_source("slow"), mocker.Mock(), mocker.Mock())
+        fast = SourceWorker(make_source("fast"), mocker.Mock(), mocker.Mock())
+        slow_task = asyncio.ensure_future(slow.run())
+        await fast.run()
+        assert reported == ["fast"]
+        await slow_task
+
+    asyncio.run(run_workers())
+    assert reported == ["fast", "slow"]
+
+
+def test_worker_standby(mocker):
+    """Only the leader checks the sources"""
+    report = mocker.patch.object(SourceWorker, "report")
+    leader = mocker.Mock(is_leader=False)
+    worker = SourceWorker(
+        make_source("RIOT"), mocker.Mock(), mocker.Mock(), leader=leader
+    )
+    asyncio.run(worker.run())
+    report.assert_not_called()
+    leader.is_leader = True
+    asyncio.run(worker.run())
+    report.assert_called_once()
+
+
+def test_prewarm_group_sessions(mocker):
+    client = mocker.Mock()
+    client.rooms = {
+        "!plain:example.com": mocker.Mock(encrypted=False),
+        "!fresh:example.com": mocker.Mock(encrypted=True, members_synced=True),
+        "!stale:example.com": mocker.Mock(encrypted=True, members_synced=False),
+    }
+    client.sharing_session = {}
+    client.should_query_keys = False
+    client.olm.should_share_group_session.side_effect = lambda room_id: (
+        room_id == "!stale:example.com"
+    )
+    client.joined_members = mocker.AsyncMock()
+    client.share_group_session = mocker.AsyncMock()
+    store = mocker.Mock()
+    store.get_subscribed_rooms.return_value = {"!stale:example.com"}
+    worker = SourceWorker(make_source("RIOT"), client, store)
+    asyncio.run(worker.prewarm())
+    client.joined_members.assert_awaited_once_with("!stale:example.com")
+    client.share_group_session.assert_awaited_once_with(
+        "!stale:example.com", ignore_unverified_devices=True
+    )
+    assert worker.prewarm_duration is not None
+    assert metrics.get("group_sessions_prewarmed_total", source="RIOT") == 1
+
+    # without broadcasts, only the subscribed rooms get reports
+    worker = SourceWorker(
+        make_source("RIOT"), client, store, broadcast_unsubscribed=False
+    )
+    assert worker.report_rooms() == ["!stale:example.com"]
+
+
+def test_send_last_report(tmp_path, mocker):
+    """A joined room gets the latest results, not the last reported change"""
+    send = mocker.patch("murdock_nio_bot.worker.send_text_to_room", return_value=None)
+    store = make_storage(tmp_path, history_retention=10 ** 10)
+    source = make_source(
+        "RIOT", github_workflows=[{"name": "release-tests", "report_xml": False}]
+    )
+    worker = SourceWorker(source, mocker.Mock(), store)
+    assert not asyncio.run(worker.send_last_report("!new:example.com"))
+    store.add_nightly_results(
+        [
+            ("RIOT", "master", "11fadfcc9d", "errored", 1617726641),
+            ("RIOT", "master", "f9fa738290", "passed", 1617813041),
+        ]
+    )
+    store.add_workflow_run_results(
+        [("RIOT", "release-tests", 2485316784, "c89739f7f0", "master", "failure", 5)]
+    )
+    # e.g. after a restart
+    worker = SourceWorker(source, mocker.Mock(), store)
+    assert asyncio.run(worker.send_last_report("!new:example.com"))
+    assert send.call_args.args[1] == "!new:example.com"
+    msg = send.call_args.args[2]
+    assert "current status" in msg
+    assert (
+        "[`master` nightlies passed](https://ci.riot-os.org/RIOT-OS/RIOT/master/"
+        "f9fa738290/output.html)" in msg
+    )
+    assert "errored](https://ci.riot-os.org" not in msg
+    assert (
+        "[`release-tests` workflow errored]"
+        "(https://github.com/RIOT-OS/RIOT/actions/runs/2485316784)" in msg
+    )
@@ -1,6 +1,10 @@
 # Utility functions to make testing easier
 import asyncio
-from typing import Any, Awaitable
+import heapq
+import itertools
+from typing import Any, Awaitable, List, Tuple
+
+from murdock_nio_bot.schedule import Clock
 
 
 def run_coroutine(result: Awaitable[Any]) -> Any:
@@ -20,3 +24,44 @@ def make_awaitable(result: Any) -> Awaitable[Any]:
     future = asyncio.Future()  # type: ignore
     future.set_result(result)
     return future
+
+
+class FakeClock(Clock):
+    """A clock for a `Scheduler` whose time only passes with `advance()`"""
+
+    def __init__(self, now: float = 0.0):
+        self.now = now
+        # (wake up time, sequence number, future) of all sleeping tasks
+        self._sleepers: List[Tuple[float, int, asyncio.Future]] = []
+        self._counter = itertools.count()
+
+    def time(self) -> float:
+        return self.now
+
+    async def sleep(self, seconds: float) -> None:
+        if seconds <= 0:
+            await asyncio.sleep(0)
+            return
+        future = asyncio.get_event_loop().create_future()
+        heapq.heappush(
+            self._sleepers, (self.now + seconds, next(self._counter), future)
+        )
+        await future
+
+    async def advance(self, seconds: float) -> None:
+        """Let `seconds` pass, waking up the sleeping tasks in order"""
+        target = self.now + seconds
+        await _settle()
+        while self._sleepers and self._sleepers[0][0] <= target:
+            wake_up, _, future = heapq.heappop(self._sleepers)
+            self.now = max(self.now, wake_up)
+            if not future.done():
+                future.set_result(None)
+            await _settle()
+        self.now = target
+
+
+async def _settle() -> None:
+    """Let all ready tasks run until they wait again"""
+    for _ in range(10):
+        await asyncio.sleep(0)